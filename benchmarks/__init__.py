@@ -0,0 +1,6 @@
+"""
+Бенчмарки этапов обработки фидов на синтетических данных.
+
+Запуск: python -m benchmarks.run --offers 2000 --output results.json
+Сравнение: python -m benchmarks.compare before.json after.json
+"""
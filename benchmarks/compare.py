@@ -0,0 +1,47 @@
+import argparse
+import json
+from pathlib import Path
+
+
+def load(path: Path) -> dict:
+    """Загружает результаты бенчмарка."""
+    return json.loads(path.read_text(encoding='utf-8'))
+
+
+def compare(before: dict, after: dict) -> list[tuple]:
+    """
+    Сравнивает медианы этапов двух прогонов.
+    Возвращает строки (этап, режим, до, после, отношение).
+    """
+    rows = []
+    for stage, modes in after['stages'].items():
+        for mode, summary in modes.items():
+            old = before['stages'].get(stage, {}).get(mode)
+            if old is None:
+                continue
+            ratio = summary['median'] / old['median'] if old['median'] \
+                else float('inf')
+            rows.append(
+                (stage, mode, old['median'], summary['median'], ratio)
+            )
+    return rows
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Сравнение двух результатов бенчмарка'
+    )
+    parser.add_argument('before', type=Path)
+    parser.add_argument('after', type=Path)
+    args = parser.parse_args(argv)
+    before, after = load(args.before), load(args.after)
+    if before['params'] != after['params']:
+        print('Внимание: параметры прогонов различаются')
+    for stage, mode, old, new, ratio in compare(before, after):
+        print(
+            f'{stage:<20} {mode:<5} {old:8.3f} -> {new:8.3f} s  x{ratio:.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
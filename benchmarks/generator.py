@@ -0,0 +1,149 @@
+import random
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+from handler.constants import CURRENT_ID
+
+IMAGE_SIZES = ((600, 600), (1200, 900), (2400, 1800), (4000, 3000))
+"""Размеры генерируемых исходных изображений."""
+
+PLAIN_ROOTS = ('1', '2')
+"""Корневые категории без рамки."""
+
+FEED_NAMES = (('multi_yandex_1', '1'), ('5012_yandex_2', '2'))
+"""Имена фидов и их города, как у скачанных фидов."""
+
+FEED_VARIANTS = ('search', 'network')
+"""Варианты размещения, для которых сохраняется копия фида."""
+
+
+def generate_images(
+    folder: Path,
+    count: int,
+    seed: int = 0
+) -> list[str]:
+    """
+    Создает count исходных JPEG-изображений разного размера.
+    Возвращает имена файлов.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    rnd = random.Random(seed)
+    names = []
+    for number in range(count):
+        width, height = rnd.choice(IMAGE_SIZES)
+        image = Image.new(
+            'RGB',
+            (width, height),
+            tuple(rnd.randrange(256) for _ in range(3))
+        )
+        draw = ImageDraw.Draw(image)
+        for _ in range(8):
+            x, y = rnd.randrange(width), rnd.randrange(height)
+            draw.ellipse(
+                (x, y, x + width // 4, y + height // 4),
+                fill=tuple(rnd.randrange(256) for _ in range(3))
+            )
+        name = f'{number}.jpg'
+        image.save(folder / name, 'JPEG', quality=90)
+        names.append(name)
+    return names
+
+
+def generate_categories(
+    count: int,
+    depth: int,
+    seed: int = 0
+) -> list[tuple[str, str | None]]:
+    """
+    Создает дерево из count категорий глубиной depth под корнями
+    с рамкой (CURRENT_ID) и без нее. Возвращает пары (id, parent_id).
+    """
+    rnd = random.Random(seed)
+    roots = sorted(CURRENT_ID) + list(PLAIN_ROOTS)
+    categories: list[tuple[str, str | None]] = [
+        (root, None) for root in roots
+    ]
+    levels: list[list[str]] = [roots]
+    for number in range(count):
+        level = 1 + number % max(1, depth)
+        if len(levels) <= level:
+            levels.append([])
+        parents = levels[level - 1] or roots
+        cat_id = str(100000 + number)
+        categories.append((cat_id, rnd.choice(parents)))
+        levels[level].append(cat_id)
+    return categories
+
+
+def generate_feed(
+    offers: int,
+    categories: list[tuple[str, str | None]],
+    picture_urls: list[str],
+    seed: int = 0
+) -> str:
+    """Создает YML-фид с offers офферами и заданными категориями."""
+    rnd = random.Random(seed)
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<yml_catalog date="2025-01-01 00:00">\n'
+        '<shop><name>Globus</name><company>Globus</company>'
+        '<url>https://example.com</url><categories>'
+    ]
+    for cat_id, parent_id in categories:
+        parent = f' parentId="{parent_id}"' if parent_id else ''
+        parts.append(
+            f'<category id="{cat_id}"{parent}>Категория {cat_id}</category>'
+        )
+    parts.append('</categories><offers>')
+    cat_ids = [cat_id for cat_id, _ in categories]
+    for number in range(offers):
+        offer_id = 1000000 + number
+        pictures = ''.join(
+            f'<picture>{url}</picture>'
+            for url in rnd.sample(picture_urls, min(2, len(picture_urls)))
+        )
+        parts.append(
+            f'<offer id="{offer_id}" available="true">'
+            f'<url>https://example.com/p/{offer_id}</url>'
+            f'<price>{rnd.randrange(50, 5000)}</price>'
+            '<currencyId>RUR</currencyId>'
+            f'<categoryId>{rnd.choice(cat_ids)}</categoryId>'
+            f'{pictures}'
+            f'<name>Товар &amp; {offer_id}</name>'
+            f'<description>Описание товара {offer_id}</description>'
+            '</offer>'
+        )
+    parts.append('</offers></shop>\n</yml_catalog>\n')
+    return ''.join(parts)
+
+
+def generate_workspace(
+    root: Path,
+    base_url: str,
+    offers: int,
+    categories: int,
+    depth: int,
+    images: int,
+    seed: int = 0
+) -> dict[str, Path]:
+    """
+    Создает исходные данные бенчмарка: изображения для раздачи
+    локальным сервером (root/server) и фиды в root/feeds.
+    """
+    server_path = root / 'server'
+    feeds_path = root / 'feeds'
+    feeds_path.mkdir(parents=True, exist_ok=True)
+    names = generate_images(server_path / 'img', images, seed)
+    picture_urls = [f'{base_url}/img/{name}' for name in names]
+    tree = generate_categories(categories, depth, seed)
+    for name, city in FEED_NAMES:
+        body = generate_feed(offers, tree, picture_urls, seed + int(city))
+        (server_path / f'feed_export_yandex_{name}.xml').write_text(
+            body,
+            encoding='utf-8'
+        )
+        for variant in FEED_VARIANTS:
+            (feeds_path / f'feed_export_yandex_{name}_{variant}.xml') \
+                .write_text(body, encoding='utf-8')
+    return {'server': server_path, 'feeds': feeds_path}
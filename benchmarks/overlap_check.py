@@ -0,0 +1,153 @@
+import argparse
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+MODES = ('sequential', 'overlap')
+"""Способы запуска: get_images и add_frame по очереди и совмещенно."""
+
+COUNTERS = ('images_downloaded', 'images_framed', 'images_skipped',
+            'offers_unsuitable')
+"""Счетчики этапов, которые должны совпадать."""
+
+
+def _thin_feeds(feeds_path: Path, target_path: Path) -> None:
+    """
+    Копирует фиды без офферов с нечетными номерами. После запуска
+    на них скачанные и нескачанные офферы чередуются в каждом фиде.
+    """
+    target_path.mkdir(parents=True, exist_ok=True)
+    for feed_path in feeds_path.glob('*.xml'):
+        text = re.sub(
+            r'<offer id="(\d+)".*?</offer>',
+            lambda match: '' if int(match.group(1)) % 2 else match.group(0),
+            feed_path.read_text(encoding='utf-8'),
+            flags=re.S
+        )
+        (target_path / feed_path.name).write_text(text, encoding='utf-8')
+
+
+def _run_mode(
+    mode: str,
+    workdir: str,
+    feeds_folder: str,
+    prepared_folder: str
+) -> dict:
+    """
+    Запускает этапы изображений в отдельном процессе: папки
+    и состояние читаются из окружения при импорте handler.constants.
+    Сначала изображения офферов prepared_folder скачиваются
+    и обрамляются по очереди, затем этапы запускаются в режиме mode
+    на всех фидах. Возвращает счетчики второго запуска и хэши
+    обрамленных изображений.
+    """
+    for name, folder in (
+        ('IMAGE_FOLDER', 'old_images'),
+        ('NEW_IMAGE_FOLDER', 'new_images'),
+        ('STATE_FOLDER', 'state'),
+    ):
+        os.environ[name] = str(Path(workdir) / folder)
+    os.environ['FEEDS_FOLDER'] = feeds_folder
+    from handler.image_handler import FeedImage
+    from handler.metrics import metrics
+
+    prepared = FeedImage(feeds_folder=prepared_folder)
+    prepared.get_images()
+    prepared.add_frame()
+    metrics.reset()
+    images = FeedImage()
+    if mode == 'overlap':
+        images.get_images_and_frame()
+    else:
+        images.get_images()
+        images.add_frame()
+    items: dict[str, int] = {}
+    for stage in metrics.stages.values():
+        for item, value in stage.items.items():
+            items[item] = items.get(item, 0) + value
+    framed = {
+        path.name: hashlib.sha256(path.read_bytes()).hexdigest()
+        for path in (Path(workdir) / 'new_images').iterdir()
+        if path.is_file()
+    }
+    return {'items': items, 'framed': framed}
+
+
+def check(workdir: Path, offers: int, images: int, seed: int) -> list[str]:
+    """
+    Сравнивает совмещенный запуск get_images_and_frame
+    с последовательным get_images и add_frame на одних данных.
+    Возвращает описание расхождений.
+    """
+    from benchmarks.generator import generate_workspace
+    from benchmarks.server import LocalFileServer
+
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    with LocalFileServer(workdir / 'server') as server:
+        paths = generate_workspace(
+            workdir,
+            server.base_url,
+            offers,
+            categories=50,
+            depth=3,
+            images=images,
+            seed=seed
+        )
+        prepared_path = workdir / 'prepared_feeds'
+        _thin_feeds(paths['feeds'], prepared_path)
+        for mode in MODES:
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                results[mode] = pool.submit(
+                    _run_mode,
+                    mode,
+                    str(workdir / mode),
+                    str(paths['feeds']),
+                    str(prepared_path)
+                ).result()
+    sequential, overlap = (results[mode] for mode in MODES)
+    problems = []
+    for item in COUNTERS:
+        before = sequential['items'].get(item, 0)
+        after = overlap['items'].get(item, 0)
+        if before != after:
+            problems.append(f'{item}: {before} != {after}')
+    if not sequential['items'].get('images_framed'):
+        problems.append('images_framed: ничего не обрамлено')
+    for name in sorted(sequential['framed'].keys() ^ overlap['framed']):
+        problems.append(f'файл есть только в одном запуске: {name}')
+    for name in sorted(sequential['framed'].keys() & overlap['framed']):
+        if sequential['framed'][name] != overlap['framed'][name]:
+            problems.append(f'файл отличается: {name}')
+    return problems
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Проверка: совмещенная загрузка и обрамление дают '
+                    'тот же результат, что get_images и add_frame'
+    )
+    parser.add_argument('--offers', type=int, default=200,
+                        help='количество офферов в каждом фиде')
+    parser.add_argument('--images', type=int, default=20,
+                        help='количество уникальных исходных изображений')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='зерно генератора данных')
+    parser.add_argument('--workdir', type=Path,
+                        help='рабочая папка, по умолчанию временная')
+    args = parser.parse_args(argv)
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix='feeds_overlap_'))
+    workdir = workdir.resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    problems = check(workdir, args.offers, args.images, args.seed)
+    if problems:
+        raise SystemExit('\n'.join(problems))
+    print('Результаты совпадают')
+
+
+if __name__ == '__main__':
+    main()
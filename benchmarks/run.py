@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import tempfile
+from pathlib import Path
+
+FOLDERS = {
+    'FEEDS_FOLDER': 'feeds',
+    'IMAGE_FOLDER': 'old_images',
+    'NEW_IMAGE_FOLDER': 'new_images',
+    'NEW_FEEDS_FOLDER': 'new_feeds',
+    'WORK_FEEDS_FOLDER': 'work_feeds',
+    'STATE_FOLDER': 'state',
+}
+"""Переменные окружения с папками конвейера внутри рабочей папки."""
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """Разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(
+        description='Бенчмарк этапов обработки фидов на синтетических данных'
+    )
+    parser.add_argument('--offers', type=int, default=1000,
+                        help='количество офферов в каждом фиде')
+    parser.add_argument('--categories', type=int, default=200,
+                        help='количество категорий')
+    parser.add_argument('--depth', type=int, default=4,
+                        help='глубина дерева категорий')
+    parser.add_argument('--images', type=int, default=100,
+                        help='количество уникальных исходных изображений')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='зерно генератора данных')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='количество холодных прогонов')
+    parser.add_argument('--no-warm', dest='warm', action='store_false',
+                        help='не делать теплый прогон после холодного')
+    parser.add_argument('--stages', nargs='+',
+                        help='этапы для прогона, по умолчанию все')
+    parser.add_argument('--workdir', type=Path,
+                        help='рабочая папка, по умолчанию временная')
+    parser.add_argument('--output', type=Path,
+                        default=Path('benchmark_results.json'),
+                        help='файл для результатов в формате JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix='feeds_bench_'))
+    workdir = workdir.resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    # Папки конвейера читаются из окружения при импорте handler.constants,
+    # поэтому этапы импортируются только после настройки окружения.
+    for name, folder in FOLDERS.items():
+        os.environ[name] = str(workdir / folder)
+    from benchmarks.suite import STAGES, BenchmarkSuite
+
+    stages = args.stages or list(STAGES)
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f'Неизвестные этапы: {", ".join(sorted(unknown))}')
+    params = {
+        'offers': args.offers,
+        'categories': args.categories,
+        'depth': args.depth,
+        'images': args.images,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'warm': args.warm,
+        'stages': [stage for stage in STAGES if stage in stages],
+    }
+    results = BenchmarkSuite(workdir, params).run()
+    args.output.write_text(
+        json.dumps(results, ensure_ascii=False, indent=2),
+        encoding='utf-8'
+    )
+    for stage, modes in results['stages'].items():
+        for mode, summary in modes.items():
+            print(f'{stage:<20} {mode:<5} {summary["median"]:.3f} s')
+    print(f'Результаты сохранены в {args.output}')
+
+
+if __name__ == '__main__':
+    main()
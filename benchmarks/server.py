@@ -0,0 +1,55 @@
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    """Обработчик статики без журнала запросов."""
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class LocalFileServer:
+    """
+    Локальный HTTP-сервер, раздающий папку с данными бенчмарка
+    вместо сайта с фидами и изображениями.
+    """
+
+    def __init__(self, folder: Path, host: str = '127.0.0.1') -> None:
+        self.folder = folder
+        self.host = host
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        """Адрес сервера, доступен после запуска."""
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'LocalFileServer':
+        """Запускает сервер на свободном порту в фоновом потоке."""
+        handler = partial(_QuietHandler, directory=str(self.folder))
+        self._server = ThreadingHTTPServer((self.host, 0), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Останавливает сервер."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> 'LocalFileServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
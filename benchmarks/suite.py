@@ -0,0 +1,189 @@
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime as dt
+from pathlib import Path
+
+import PIL
+
+from benchmarks.generator import FEED_NAMES, generate_workspace
+from benchmarks.server import LocalFileServer
+from handler.feeds_handler import FeedHandler
+from handler.feeds_save import FeedSave
+from handler.image_handler import FeedImage
+from handler.metrics import _peak_rss, _reset_peak_rss
+
+STAGES = (
+    'save_xml',
+    'get_images',
+    'add_frame',
+    'image_replacement',
+    'add_sales_notes',
+)
+"""Этапы конвейера в порядке запуска."""
+
+OUTPUT_FOLDERS = (
+    'old_images',
+    'new_images',
+    'new_feeds',
+    'work_feeds',
+    'state',
+)
+"""Папки с результатами этапов, очищаемые перед холодным прогоном."""
+
+
+def _peak_rss_mb() -> float:
+    """
+    Пиковое потребление памяти процессом в мегабайтах
+    с последнего сброса _reset_peak_rss.
+    """
+    return _peak_rss() / 2 ** 20
+
+
+def _cpu_count() -> int | None:
+    """Количество процессоров, доступных процессу."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def _summary(runs: list[dict]) -> dict:
+    """Сводка по прогонам одного этапа."""
+    wall = [run['wall'] for run in runs]
+    return {
+        'runs': runs,
+        'min': min(wall),
+        'median': statistics.median(wall),
+    }
+
+
+class BenchmarkSuite:
+    """
+    Прогон этапов конвейера на синтетических фидах.
+
+    Данные генерируются один раз и раздаются локальным сервером.
+    Каждый повтор запускается в новом процессе: холодный прогон
+    начинается с пустых папок результатов и состояния и без кэшей
+    процесса, теплый повторяет конвейер в том же процессе сразу
+    после холодного, когда все изображения уже скачаны и обрамлены.
+    """
+
+    def __init__(self, workdir: Path, params: dict) -> None:
+        self.workdir = workdir
+        self.params = params
+        self.stages = params['stages']
+        self.results: dict[str, dict[str, list]] = {
+            stage: {'cold': [], 'warm': []} for stage in self.stages
+        }
+
+    def _reset(self) -> None:
+        """Защищенный метод, очищает результаты прошлого прогона."""
+        for folder in OUTPUT_FOLDERS:
+            shutil.rmtree(self.workdir / folder, ignore_errors=True)
+
+    def _stage_calls(self, feeds_list: tuple[str, ...]) -> dict:
+        """Защищенный метод, возвращает вызовы этапов."""
+        images = FeedImage(feeds_list=feeds_list)
+        feeds = FeedHandler()
+        save_client = FeedSave(feeds_list=feeds_list)
+
+        def save_xml() -> None:
+            save_client.save_xml()
+            save_client.save_validators()
+
+        return {
+            'save_xml': save_xml,
+            'get_images': images.get_images,
+            'add_frame': images.add_frame,
+            'image_replacement': feeds.image_replacement,
+            'add_sales_notes': feeds.add_sales_notes,
+        }
+
+    def _run_chain(self, mode: str, feeds_list: tuple[str, ...]) -> None:
+        """Защищенный метод, прогоняет выбранные этапы один раз."""
+        calls = self._stage_calls(feeds_list)
+        for stage in self.stages:
+            _reset_peak_rss()
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            calls[stage]()
+            self.results[stage][mode].append({
+                'wall': time.perf_counter() - wall_start,
+                'cpu': time.process_time() - cpu_start,
+                'peak_rss_mb': _peak_rss_mb(),
+            })
+
+    def run_cycle(self, feeds_list: tuple[str, ...]) -> dict:
+        """
+        Метод прогоняет холодный и теплый конвейер
+        и возвращает их результаты по этапам.
+        """
+        self._run_chain('cold', feeds_list)
+        if self.params['warm']:
+            self._run_chain('warm', feeds_list)
+        return self.results
+
+    def run(self) -> dict:
+        """Запускает бенчмарк и возвращает результаты."""
+        server_path = self.workdir / 'server'
+        server_path.mkdir(parents=True, exist_ok=True)
+        with LocalFileServer(server_path) as server:
+            generate_workspace(
+                self.workdir,
+                server.base_url,
+                self.params['offers'],
+                self.params['categories'],
+                self.params['depth'],
+                self.params['images'],
+                self.params['seed']
+            )
+            feeds_list = tuple(
+                f'{server.base_url}/feed_export_yandex_{name}.xml'
+                for name, _ in FEED_NAMES
+            )
+            context = multiprocessing.get_context('spawn')
+            for _ in range(self.params['repeat']):
+                self._reset()
+                with ProcessPoolExecutor(1, mp_context=context) as pool:
+                    results = pool.submit(
+                        _run_cycle,
+                        str(self.workdir),
+                        self.params,
+                        feeds_list
+                    ).result()
+                for stage, modes in results.items():
+                    for mode, runs in modes.items():
+                        self.results[stage][mode].extend(runs)
+        return {
+            'created': dt.now().isoformat(timespec='seconds'),
+            'params': self.params,
+            'environment': {
+                'python': platform.python_version(),
+                'pillow': PIL.__version__,
+                'platform': platform.platform(),
+                'cpu_count': _cpu_count(),
+            },
+            'stages': {
+                stage: {
+                    mode: _summary(runs)
+                    for mode, runs in modes.items() if runs
+                }
+                for stage, modes in self.results.items()
+            },
+        }
+
+
+def _run_cycle(
+    workdir: str,
+    params: dict,
+    feeds_list: tuple[str, ...]
+) -> dict:
+    """
+    Прогоняет холодный и теплый конвейер в отдельном процессе:
+    папки читаются из окружения, унаследованного от родителя.
+    """
+    return BenchmarkSuite(Path(workdir), params).run_cycle(feeds_list)
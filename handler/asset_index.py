@@ -0,0 +1,302 @@
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import NamedTuple
+
+from handler.constants import ASSET_INDEX_FILE, STATE_FOLDER
+from handler.logging_config import setup_logging
+
+setup_logging()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    folder TEXT NOT NULL,
+    file TEXT NOT NULL,
+    offer_id TEXT NOT NULL,
+    promo TEXT,
+    city TEXT,
+    postfix TEXT,
+    PRIMARY KEY (folder, file)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS assets_offer
+    ON assets (folder, offer_id, city, postfix);
+CREATE TABLE IF NOT EXISTS folders (
+    folder TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+"""Схема индекса изображений."""
+
+
+class Asset(NamedTuple):
+    """Разобранное имя файла изображения."""
+
+    offer_id: str
+    promo: str | None
+    city: str | None
+    postfix: str | None
+
+
+def parse_asset(file_name: str) -> Asset:
+    """
+    Разбирает имя файла изображения: {offer_id}.{format} для
+    исходного и {offer_id}_{promo}_{city}_{postfix}.{format}
+    для обрамленного.
+    """
+    parts = file_name.split('.')[0].split('_')
+    if len(parts) < 2:
+        return Asset(parts[0], None, None, None)
+    return Asset(
+        parts[0],
+        '_'.join(parts[1:-2]) or None,
+        parts[-2],
+        parts[-1]
+    )
+
+
+class AssetIndex:
+    """
+    Индекс файлов изображений в SQLite.
+
+    Для каждой папки хранит файлы с разобранными именами
+    и время модификации папки на момент последней записи индекса.
+    Файлы добавляются и удаляются вместе с записью манифестов
+    изображений, поэтому этапам не нужно читать и разбирать папку.
+    Если папку изменили в обход обработчика (время модификации
+    не совпадает), ее записи один раз перестраиваются по диску.
+
+    После каждого изменения через индекс запоминается время
+    модификации папки. Если к сохранению оно сдвинулось, папку
+    изменил кто-то еще, и ее записи перестраиваются при следующем
+    обращении.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._dirty: set[str] = set()
+        self._seen: dict[str, int | None] = {}
+        self._lock = threading.Lock()
+        self._connection = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Защищенный метод, открывает базу индекса.
+        Поврежденная база удаляется и строится заново.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            connection.executescript(SCHEMA)
+        except sqlite3.DatabaseError as error:
+            logging.warning(
+                'Индекс изображений %s поврежден и будет построен '
+                'заново: %s',
+                self.path,
+                error
+            )
+            connection.close()
+            self.path.unlink(missing_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.executescript(SCHEMA)
+        return connection
+
+    @staticmethod
+    def _mtime(folder_path: Path) -> int | None:
+        """Защищенный метод, возвращает время модификации папки."""
+        try:
+            return folder_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _sync(self, folder_path: Path) -> str:
+        """
+        Защищенный метод, перестраивает записи папки, если ее
+        изменили в обход индекса. Возвращает ключ папки.
+        Вызывается под блокировкой.
+        """
+        folder = str(folder_path)
+        if folder in self._dirty:
+            return folder
+        mtime = self._mtime(folder_path)
+        self._seen[folder] = mtime
+        row = self._connection.execute(
+            'SELECT mtime_ns FROM folders WHERE folder = ?',
+            (folder,)
+        ).fetchone()
+        if row is not None and row[0] == mtime:
+            return folder
+        self._connection.execute(
+            'DELETE FROM assets WHERE folder = ?',
+            (folder,)
+        )
+        if mtime is None:
+            self._connection.execute(
+                'DELETE FROM folders WHERE folder = ?',
+                (folder,)
+            )
+            self._connection.commit()
+            return folder
+        with os.scandir(folder_path) as entries:
+            file_names = [
+                entry.name for entry in entries
+                if entry.is_file() and not entry.name.startswith('.')
+            ]
+        self._connection.executemany(
+            'INSERT INTO assets VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (folder, file_name, *parse_asset(file_name))
+                for file_name in file_names
+            ]
+        )
+        self._connection.execute(
+            'INSERT OR REPLACE INTO folders VALUES (?, ?)',
+            (folder, mtime)
+        )
+        self._connection.commit()
+        logging.info(
+            'Индекс изображений папки %s построен: %s файлов',
+            folder_path.name,
+            len(file_names)
+        )
+        return folder
+
+    def track(self, folder_path: Path) -> None:
+        """
+        Отмечает папку, в которую обработчик начинает записывать файлы.
+        До сохранения индекса ее файлы учитываются через add и remove,
+        и запись первого файла не перестраивает папку.
+        """
+        with self._lock:
+            self._dirty.add(self._sync(folder_path))
+
+    def add(self, folder_path: Path, file_name: str) -> None:
+        """
+        Добавляет в индекс файл, только что записанный в папку.
+        """
+        with self._lock:
+            folder = self._sync(folder_path)
+            self._connection.execute(
+                'INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?)',
+                (folder, file_name, *parse_asset(file_name))
+            )
+            self._dirty.add(folder)
+            self._seen[folder] = self._mtime(folder_path)
+
+    def remove(self, folder_path: Path, file_name: str) -> None:
+        """
+        Удаляет из индекса файл, только что убранный из папки.
+        """
+        with self._lock:
+            folder = self._sync(folder_path)
+            self._connection.execute(
+                'DELETE FROM assets WHERE folder = ? AND file = ?',
+                (folder, file_name)
+            )
+            self._dirty.add(folder)
+            self._seen[folder] = self._mtime(folder_path)
+
+    def commit(self) -> None:
+        """
+        Сохраняет изменения и запоминает время модификации
+        измененных папок: их текущее содержимое учтено в индексе.
+        Папка, которую после последнего изменения через индекс
+        изменили в обход него, помечается для перестроения.
+        """
+        with self._lock:
+            for folder in self._dirty:
+                mtime = self._mtime(Path(folder))
+                if mtime is not None and mtime == self._seen.get(folder):
+                    self._connection.execute(
+                        'INSERT OR REPLACE INTO folders VALUES (?, ?)',
+                        (folder, mtime)
+                    )
+                    continue
+                logging.info(
+                    'Папка %s изменена в обход индекса изображений',
+                    Path(folder).name
+                )
+                self._connection.execute(
+                    'DELETE FROM folders WHERE folder = ?',
+                    (folder,)
+                )
+            self._connection.commit()
+            self._dirty.clear()
+
+    def files(
+        self,
+        folder_path: Path,
+        offer_id: str | None = None,
+        promo: str | None = None,
+        city: str | None = None,
+        postfix: str | None = None
+    ) -> list[tuple[str, Asset]]:
+        """
+        Возвращает файлы папки с разобранными именами.
+        Заданные аргументы отбирают файлы оффера, акции,
+        города и размещения.
+        """
+        filters = {
+            column: value
+            for column, value in (
+                ('offer_id', offer_id),
+                ('promo', promo),
+                ('city', city),
+                ('postfix', postfix),
+            )
+            if value is not None
+        }
+        conditions = ''.join(f' AND {column} = ?' for column in filters)
+        with self._lock:
+            folder = self._sync(folder_path)
+            rows = self._connection.execute(
+                'SELECT file, offer_id, promo, city, postfix FROM assets '
+                f'WHERE folder = ?{conditions}',
+                (folder, *filters.values())
+            ).fetchall()
+        return [(row[0], Asset(*row[1:])) for row in rows]
+
+    def source_images(self, folder_path: Path) -> dict[str, str]:
+        """Возвращает исходные изображения: offer_id -> имя файла."""
+        return {
+            asset.offer_id: file_name
+            for file_name, asset in self.files(folder_path)
+            if asset.city is None
+        }
+
+    def image_dict(self, folder_path: Path) -> dict[str, str]:
+        """
+        Возвращает обрамленные изображения:
+        {offer_id}_{city}_{postfix} -> имя файла.
+        """
+        return {
+            f'{asset.offer_id}_{asset.city}_{asset.postfix}': file_name
+            for file_name, asset in self.files(folder_path)
+            if asset.city is not None
+        }
+
+    def image_dict_all(self, folder_path: Path) -> dict[str, str]:
+        """
+        Возвращает изображения с рамкой all:
+        {offer_id}_{city} -> имя файла.
+        """
+        return {
+            f'{asset.offer_id}_{asset.city}': file_name
+            for file_name, asset in self.files(folder_path, postfix='all')
+        }
+
+
+_asset_index = None
+_asset_index_lock = threading.Lock()
+
+
+def get_asset_index() -> AssetIndex:
+    """Возвращает общий для процесса индекс изображений."""
+    global _asset_index
+    if _asset_index is None:
+        with _asset_index_lock:
+            if _asset_index is None:
+                folder_path = Path(__file__).parent.parent / STATE_FOLDER
+                _asset_index = AssetIndex(folder_path / ASSET_INDEX_FILE)
+    return _asset_index
@@ -0,0 +1,104 @@
+import logging
+import threading
+from pathlib import Path
+
+from handler.asset_index import get_asset_index
+from handler.constants import ASSET_INDEX
+from handler.logging_config import setup_logging
+from handler.state import load_state, save_state
+
+setup_logging()
+
+
+class BuildManifest:
+    """
+    Манифест сборки обрамленных изображений.
+
+    Для каждого выхода (оффер, город, размещение) хранит имя файла
+    и хэши входов: исходного изображения, рамки и параметров компоновки.
+    Изображение пересобирается, только если изменился хотя бы один вход.
+    """
+
+    STATE_NAME = 'framed'
+
+    def __init__(self, new_image_folder: str) -> None:
+        self.folder_path = Path(__file__).parent.parent / new_image_folder
+        self.entries: dict[str, dict] = load_state(self.STATE_NAME)
+        self.assets = get_asset_index() if ASSET_INDEX else None
+        self._lock = threading.Lock()
+
+    def is_fresh(
+        self,
+        key: str,
+        inputs: dict[str, str],
+        current_file: str | None
+    ) -> bool:
+        """
+        Проверяет, что выход key существует и собран из тех же входов.
+        Файлы, собранные до появления манифеста, принимаются как есть.
+        Папка несвежего выхода отмечается в индексе изображений:
+        в нее будет записан новый файл.
+        """
+        if current_file is not None:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.record(key, inputs, current_file)
+                return True
+            if entry['inputs'] == inputs and entry['file'] == current_file:
+                return True
+        if self.assets:
+            self.assets.track(self.folder_path)
+        return False
+
+    def record(
+        self,
+        key: str,
+        inputs: dict[str, str],
+        file_name: str,
+        previous_file: str | None = None
+    ) -> None:
+        """
+        Записывает собранный выход.
+        Прежний файл выхода с другим именем удаляется.
+        """
+        with self._lock:
+            entry = self.entries.get(key) or {}
+            self.entries[key] = {'inputs': inputs, 'file': file_name}
+        if self.assets:
+            self.assets.add(self.folder_path, file_name)
+        for old_file in {entry.get('file'), previous_file}:
+            if old_file and old_file != file_name:
+                (self.folder_path / old_file).unlink(missing_ok=True)
+                if self.assets:
+                    self.assets.remove(self.folder_path, old_file)
+
+    def discard(self, key: str, current_file: str | None) -> bool:
+        """
+        Удаляет выход, который больше не должен существовать.
+        Возвращает True, если файл был удален.
+        """
+        with self._lock:
+            entry = self.entries.pop(key, None) or {}
+        removed = False
+        for old_file in {entry.get('file'), current_file}:
+            if old_file:
+                file_path = self.folder_path / old_file
+                if file_path.exists():
+                    file_path.unlink()
+                    removed = True
+                if self.assets:
+                    self.assets.remove(self.folder_path, old_file)
+        return removed
+
+    def forget(self, key: str) -> None:
+        """Удаляет выход из манифеста, не трогая файл."""
+        with self._lock:
+            self.entries.pop(key, None)
+
+    def save(self) -> None:
+        """Сохраняет манифест."""
+        with self._lock:
+            save_state(self.STATE_NAME, self.entries)
+        if self.assets:
+            self.assets.commit()
+        logging.info('Манифест сборки: %s изображений', len(self.entries))
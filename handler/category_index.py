@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import threading
+from typing import Iterable
+
+from handler.constants import CURRENT_ID
+from handler.logging_config import setup_logging
+from handler.offer_index import OfferIndex
+from handler.state import load_state, save_state
+
+setup_logging()
+
+
+class CategoryIndex:
+    """
+    Индекс дерева категорий набора фидов.
+
+    Для заданного набора корневых категорий за один проход
+    определяет ближайшего корневого предка каждой категории.
+    Уже пройденные цепочки запоминаются, поэтому каждая категория
+    обрабатывается один раз независимо от глубины дерева.
+
+    Если задан key - хэш содержимого фидов, результаты сохраняются
+    в состояние и используются следующими запусками, пока фиды
+    не изменятся.
+    """
+
+    STATE_NAME = 'categories'
+
+    def __init__(
+        self,
+        parents: dict[str, str | None],
+        key: str | None = None
+    ) -> None:
+        self.parents = parents
+        self.key = key
+        self._resolved: dict[frozenset, dict[str, str]] = {}
+        self._lock = threading.Lock()
+        if key is not None:
+            self._load()
+
+    def _load(self) -> None:
+        """
+        Защищенный метод, загружает сохраненные результаты,
+        если они получены для тех же фидов.
+        """
+        state = load_state(self.STATE_NAME)
+        if state.get('key') != self.key:
+            return
+        for item in state.get('resolved', []):
+            self._resolved[frozenset(item['roots'])] = item['nearest']
+        logging.info(
+            'Индекс категорий загружен из состояния: %s наборов корней',
+            len(self._resolved)
+        )
+
+    def _save(self) -> None:
+        """
+        Защищенный метод, сохраняет результаты в состояние.
+        Вызывается под блокировкой.
+        """
+        save_state(self.STATE_NAME, {
+            'key': self.key,
+            'resolved': [
+                {'roots': sorted(roots), 'nearest': nearest}
+                for roots, nearest in self._resolved.items()
+            ],
+        })
+
+    def _resolve(self, roots: frozenset) -> dict[str, str]:
+        """Защищенный метод, сопоставляет категориям ближайший корень."""
+        nearest: dict[str, str | None] = {}
+        for cat_id in self.parents:
+            chain = []
+            seen = set()
+            current = cat_id
+            root = None
+            while current:
+                if current in nearest:
+                    root = nearest[current]
+                    break
+                if current in roots:
+                    root = current
+                    break
+                if current in seen:
+                    logging.warning('Цикл в дереве категорий: %s', current)
+                    break
+                chain.append(current)
+                seen.add(current)
+                current = self.parents.get(current)
+            if current in roots:
+                nearest[current] = current
+            for node in chain:
+                nearest[node] = root
+        return {
+            cat_id: root for cat_id, root in nearest.items()
+            if root and cat_id in self.parents
+        }
+
+    def frame_roots(
+        self,
+        roots: Iterable[str] = CURRENT_ID
+    ) -> dict[str, str]:
+        """
+        Возвращает словарь category_id -> ближайший корень
+        для всех категорий, у которых он есть.
+        """
+        key = frozenset(roots)
+        with self._lock:
+            resolved = self._resolved.get(key)
+            if resolved is None:
+                resolved = self._resolve(key)
+                self._resolved[key] = resolved
+                if self.key is not None:
+                    self._save()
+        return resolved
+
+    def nearest_root(
+        self,
+        cat_id: str,
+        roots: Iterable[str] = CURRENT_ID
+    ) -> str | None:
+        """Возвращает ближайший корень категории или None."""
+        return self.frame_roots(roots).get(cat_id)
+
+
+_category_cache: dict[str, CategoryIndex] = {}
+_category_lock = threading.Lock()
+
+
+def get_category_index(indexes: Iterable[OfferIndex]) -> CategoryIndex:
+    """
+    Возвращает индекс категорий набора фидов из кэша процесса.
+    Ключ кэша - хэш содержимого входящих в набор фидов, по нему же
+    индекс находит результаты, сохраненные прошлыми запусками.
+    """
+    indexes = sorted(indexes, key=lambda index: index.file_name)
+    key = hashlib.sha256(
+        ''.join(
+            f'{index.file_name}:{index.digest}\n' for index in indexes
+        ).encode()
+    ).hexdigest()
+    with _category_lock:
+        category_index = _category_cache.get(key)
+        if category_index is None:
+            parents = {}
+            for index in indexes:
+                parents.update(index.categories)
+            category_index = CategoryIndex(parents, key)
+            _category_cache.clear()
+            _category_cache[key] = category_index
+        return category_index
@@ -138,6 +138,12 @@ FEEDS_FOLDER = os.getenv('FEEDS_FOLDER', 'temp_feeds')
 NEW_FEEDS_FOLDER = os.getenv('NEW_FEEDS_FOLDER', 'new_feeds')
 """Константа стокового названия директории с измененными фидами."""
 
+WORK_FEEDS_FOLDER = os.getenv('WORK_FEEDS_FOLDER', 'work_feeds')
+"""
+Константа стокового названия директории с промежуточными фидами:
+с подставленными изображениями, но еще без тега sales_notes.
+"""
+
 IMAGE_FOLDER = os.getenv('IMAGE_FOLDER', 'old_images')
 """Константа стокового названия директории с изображениями."""
 
@@ -146,3 +152,178 @@ NEW_IMAGE_FOLDER = os.getenv('NEW_IMAGE_FOLDER', 'new_images')
 
 ENCODING = 'utf-8'
 """Кодировка по умолчанию."""
+
+IMAGE_DOWNLOAD_WORKERS = int(os.getenv('IMAGE_DOWNLOAD_WORKERS', 16))
+"""Количество потоков для параллельной загрузки изображений."""
+
+IMAGE_REQUEST_TIMEOUT = (10, 60)
+"""Таймауты (подключение, чтение) при загрузке изображения."""
+
+IMAGE_PASSTHROUGH = os.getenv('IMAGE_PASSTHROUGH', 'true').lower() == 'true'
+"""Сохранять скачанные изображения как есть, без перекодирования."""
+
+IMAGE_PASSTHROUGH_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+"""Форматы изображений, которые сохраняются без декодирования."""
+
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 10))
+"""Количество хостов, для которых хранится пул соединений."""
+
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 32))
+"""Максимальное количество keep-alive соединений с одним хостом."""
+
+HOST_RATE_LIMIT = float(os.getenv('HOST_RATE_LIMIT', 50))
+"""Максимум запросов в секунду к одному хосту, 0 - без ограничения."""
+
+HOST_BURST = int(os.getenv('HOST_BURST', 50))
+"""Количество запросов к хосту, которые можно отправить подряд."""
+
+HOST_RETRIES = int(os.getenv('HOST_RETRIES', 2))
+"""Повторы запроса изображения при сетевой ошибке или ответе 429/5xx."""
+
+HOST_BACKOFF = (0.5, 10.0)
+"""Начальная и максимальная пауза (сек.) перед повтором запроса."""
+
+BREAKER_THRESHOLD = int(os.getenv('BREAKER_THRESHOLD', 10))
+"""Количество ошибок подряд, после которого запросы к хосту прекращаются."""
+
+BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', 60))
+"""Сколько секунд хост не запрашивается после серии ошибок."""
+
+STREAM_FEEDS = os.getenv('STREAM_FEEDS', 'true').lower() == 'true'
+"""
+Потоковое сохранение фидов: тело ответа пишется на диск блоками
+и проверяется на корректность XML по мере получения.
+"""
+
+FEED_CHUNK_SIZE = 1024 * 1024
+"""Размер блока (в байтах) при потоковом сохранении фида."""
+
+STREAM_TRANSFORM = os.getenv('STREAM_TRANSFORM', 'true').lower() == 'true'
+"""
+Потоковая перезапись фидов: офферы читаются, изменяются и
+записываются по одному, без построения дерева всего фида.
+"""
+
+FEED_WORKERS = int(os.getenv('FEED_WORKERS', os.cpu_count() or 1))
+"""Количество воркеров для параллельной перезаписи фидов."""
+
+FEED_EXECUTOR = os.getenv('FEED_EXECUTOR', 'process')
+"""
+Тип пула для перезаписи фидов: process - отдельные процессы
+(разбор XML упирается в GIL), thread - потоки.
+"""
+
+FRAME_WORKERS = int(os.getenv('FRAME_WORKERS', os.cpu_count() or 1))
+"""Количество воркеров для параллельного обрамления изображений."""
+
+FRAME_EXECUTOR = os.getenv('FRAME_EXECUTOR', 'thread')
+"""
+Тип пула для обрамления изображений:
+thread - потоки, process - отдельные процессы.
+"""
+
+FRAME_IMAGE_FORMAT = os.getenv('FRAME_IMAGE_FORMAT', 'PNG').upper()
+"""Формат обрамленных изображений: PNG, JPEG или WEBP."""
+
+FRAME_IMAGE_QUALITY = int(os.getenv('FRAME_IMAGE_QUALITY', 85))
+"""Качество сжатия обрамленных изображений для JPEG и WEBP."""
+
+FRAME_PNG_COMPRESS_LEVEL = int(os.getenv('FRAME_PNG_COMPRESS_LEVEL', 6))
+"""Уровень сжатия PNG: 0 - без сжатия, 9 - максимальное."""
+
+FRAME_IMAGE_OPTIMIZE = (
+    os.getenv('FRAME_IMAGE_OPTIMIZE', 'false').lower() == 'true'
+)
+"""Дополнительная оптимизация размера файла ценой скорости кодирования."""
+
+STATE_FOLDER = os.getenv('STATE_FOLDER', 'state')
+"""
+Константа стокового названия директории со служебным состоянием
+между запусками (валидаторы фидов, манифесты изображений).
+"""
+
+CONDITIONAL_FETCH = os.getenv('CONDITIONAL_FETCH', 'true').lower() == 'true'
+"""
+Условное скачивание фидов (ETag, Last-Modified, хэш содержимого):
+неизменившиеся фиды не перезаписываются и не обрабатываются повторно.
+"""
+
+FEED_VARIANT_LINK = os.getenv('FEED_VARIANT_LINK', 'reflink')
+"""
+Способ получения файлов-вариантов фида (search, network, all)
+из одного сохраненного файла: reflink, hardlink или copy.
+При недоступности reflink и hardlink используется copy.
+"""
+
+PUBLISH_GZIP = os.getenv('PUBLISH_GZIP', 'true').lower() == 'true'
+"""Публиковать рядом с итоговыми фидами сжатые копии .xml.gz."""
+
+PUBLISH_GZIP_LEVEL = int(os.getenv('PUBLISH_GZIP_LEVEL', 6))
+"""Уровень сжатия gzip для опубликованных фидов."""
+
+PUBLISH_BROTLI = os.getenv('PUBLISH_BROTLI', 'false').lower() == 'true'
+"""
+Публиковать рядом с итоговыми фидами сжатые копии .xml.br
+(требуется установленный пакет brotli).
+"""
+
+METRICS_FOLDER = os.getenv('METRICS_FOLDER', 'metrics')
+"""
+Папка для метрик запуска: metrics.json и metrics.prom
+(для textfile collector в node_exporter).
+"""
+
+METRICS_PREFIX = 'feed_handler'
+"""Префикс имен метрик Prometheus."""
+
+PIPELINE_OVERLAP = os.getenv('PIPELINE_OVERLAP', 'true').lower() == 'true'
+"""
+Обрамлять изображения по мере скачивания, а не после
+завершения всех загрузок.
+"""
+
+FRAME_QUEUE_SIZE = int(os.getenv('FRAME_QUEUE_SIZE', 64))
+"""
+Размер очереди скачанных изображений, ожидающих обрамления.
+При заполнении загрузки приостанавливаются.
+"""
+
+DAEMON_INTERVAL = int(os.getenv('DAEMON_INTERVAL', 3600))
+"""Интервал между запусками в режиме службы, сек."""
+
+DAEMON_CRON = os.getenv('DAEMON_CRON', '')
+"""
+Расписание запусков в режиме службы в формате cron
+(минута час день месяц день_недели). Если задано,
+используется вместо DAEMON_INTERVAL.
+"""
+
+RUN_LOCK_FILE = os.getenv('RUN_LOCK_FILE', 'run.lock')
+"""
+Файл блокировки в папке состояния: не дает запускам
+обработки пересекаться.
+"""
+
+IMAGE_GC_MODE = os.getenv('IMAGE_GC_MODE', 'quarantine').lower()
+"""
+Что делать с изображениями офферов, которых больше нет в фидах:
+quarantine - переносить в карантин, delete - удалять, off - ничего.
+"""
+
+IMAGE_GC_GRACE_DAYS = float(os.getenv('IMAGE_GC_GRACE_DAYS', 3))
+"""Сколько дней изображение должно быть лишним, чтобы его убрали."""
+
+QUARANTINE_FOLDER = os.getenv('QUARANTINE_FOLDER', 'quarantine')
+"""Папка карантина для убранных изображений."""
+
+IMAGE_QUARANTINE_DAYS = float(os.getenv('IMAGE_QUARANTINE_DAYS', 30))
+"""Сколько дней изображение хранится в карантине до удаления."""
+
+ASSET_INDEX = os.getenv('ASSET_INDEX', 'true').lower() == 'true'
+"""
+Искать изображения по индексу в SQLite, а не читать
+и разбирать папки изображений на каждом этапе.
+"""
+
+ASSET_INDEX_FILE = os.getenv('ASSET_INDEX_FILE', 'assets.sqlite3')
+"""Файл индекса изображений в папке состояния."""
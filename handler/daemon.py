@@ -0,0 +1,82 @@
+import logging
+import signal
+import threading
+from datetime import datetime as dt
+
+from handler.constants import DAEMON_CRON, DAEMON_INTERVAL
+from handler.logging_config import setup_logging, start_log_file
+from handler.main import run_locked
+from handler.schedule import get_schedule
+
+setup_logging()
+
+
+class Daemon:
+    """
+    Режим службы: процесс остается запущенным и выполняет
+    обработку по расписанию.
+
+    Между запусками сохраняются пул HTTP-соединений, кэш рамок,
+    индексы фидов и категорий и списки файлов папок, поэтому
+    каждый запуск начинается с прогретыми кэшами.
+    Запуск: python -m handler.daemon.
+    """
+
+    def __init__(
+        self,
+        schedule,
+        run=run_locked,
+        run_on_start: bool = True
+    ) -> None:
+        self.schedule = schedule
+        self.run = run
+        self.run_on_start = run_on_start
+        self._stop = threading.Event()
+
+    def stop(self, signum=None, frame=None) -> None:
+        """Останавливает службу после текущего запуска."""
+        logging.info('Получен сигнал остановки службы')
+        self._stop.set()
+
+    def _run_once(self) -> None:
+        """
+        Защищенный метод, выполняет запуск, не останавливая службу.
+        Каждый запуск пишет лог в свой файл, как разовый запуск.
+        """
+        start_log_file()
+        try:
+            self.run()
+        except Exception as error:
+            logging.error('Запуск завершился с ошибкой: %s', error)
+
+    def serve(self) -> None:
+        """Выполняет запуски по расписанию до сигнала остановки."""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self.stop)
+        logging.info('Служба запущена, расписание: %s', self.schedule)
+        next_run = dt.now()
+        if not self.run_on_start:
+            next_run = self.schedule.next_after(next_run)
+        while not self._stop.is_set():
+            delay = (next_run - dt.now()).total_seconds()
+            if delay > 0:
+                logging.info('Следующий запуск в %s', next_run)
+                if self._stop.wait(delay):
+                    break
+            started = dt.now()
+            self._run_once()
+            next_run = self.schedule.next_after(started)
+            if next_run <= dt.now():
+                logging.warning(
+                    'Запуск длился дольше интервала расписания, '
+                    'следующий запуск начнется сразу'
+                )
+        logging.info('Служба остановлена')
+
+
+def serve() -> None:
+    Daemon(get_schedule(DAEMON_INTERVAL, DAEMON_CRON)).serve()
+
+
+if __name__ == '__main__':
+    serve()
@@ -8,7 +8,10 @@ from http.client import IncompleteRead
 import requests
 
 from handler.constants import ATTEMPTION_LOAD_FEED, DATE_FORMAT, TIME_FORMAT
+from handler.exceptions import CircuitOpenError
+from handler.governor import jittered
 from handler.logging_config import setup_logging
+from handler.metrics import metrics
 
 setup_logging()
 
@@ -19,6 +22,7 @@ def time_of_script(func):
     def wrapper(*args, **kwargs):
         start_ts = time.time()
         date_str = dt.now().strftime(DATE_FORMAT)
+        metrics.reset()
 
         print(
             f'Функция {func.__name__} начала работу '
@@ -57,6 +61,7 @@ def time_of_script(func):
             }
 
             logging.info(json.dumps(log_record, ensure_ascii=False))
+            metrics.export(status)
 
     return wrapper
 
@@ -67,7 +72,8 @@ def time_of_function(func):
 
     Замеряет время выполнения декорируемой функции и логирует результат
     в секундах и минутах. Время округляется до 3 знаков после запятой
-    для секунд и до 2 знаков для минут.
+    для секунд и до 2 знаков для минут. Вызов записывается как этап
+    в реестр метрик: время, CPU, память, ввод-вывод и счетчики.
 
     Args:
         func (callable): Декорируемая функция, время выполнения которой
@@ -80,7 +86,8 @@ def time_of_function(func):
     def wrapper(*args, **kwargs):
         start_time = time.time()
         logging.info('Функция %s начала работу', func.__name__)
-        result = func(*args, **kwargs)
+        with metrics.stage(func.__name__):
+            result = func(*args, **kwargs)
         execution_time = round(time.time() - start_time, 3)
         logging.info(
             'Функция %s завершила работу. '
@@ -108,6 +115,8 @@ def retry_on_network_error(
                 attempt += 1
                 try:
                     return func(*args, **kwargs)
+                except CircuitOpenError:
+                    raise
                 except (
                     IncompleteRead,
                     ConnectionResetError,
@@ -120,10 +129,12 @@ def retry_on_network_error(
                 ) as error:
                     last_exception = error
                     if attempt < max_attempts:
-                        delay = delays[attempt - 1] if attempt - \
-                            1 < len(delays) else delays[-1]
+                        delay = jittered(
+                            delays[min(attempt, len(delays)) - 1]
+                        )
                         logging.warning(
-                            'Попытка %s/%s неудачна, повтор через %s сек: %s',
+                            'Попытка %s/%s неудачна, '
+                            'повтор через %.1f сек: %s',
                             attempt,
                             max_attempts,
                             delay,
@@ -1,3 +1,6 @@
+import requests
+
+
 class EmptyXMLError(ValueError):
     """Ошибка пустого XML-файла."""
 
@@ -36,3 +39,19 @@ class StructureXMLError(ValueError):
 
 class MissingFolderError(Exception):
     """Ошибка отсутствующей директории."""
+
+
+class FrameLoadError(ValueError):
+    """Ошибка загрузки рамки."""
+
+
+class ScheduleError(ValueError):
+    """Ошибка в расписании запусков."""
+
+
+class RunLockedError(Exception):
+    """Ошибка запуска при незавершенном предыдущем запуске."""
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Ошибка запроса к хосту, запросы к которому временно прекращены."""
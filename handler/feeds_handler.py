@@ -1,59 +1,344 @@
 import logging
 import xml.etree.ElementTree as ET
-
-from handler.constants import (ADDRESS_FTP_IMAGES, DEFAULT_TEXT, FEEDS_FOLDER,
-                               FEEDS_POSTFIX, FILENAMES_ALL, FILENAMES_ALL_NEW,
+from collections import Counter
+from functools import partial
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+from handler.constants import (ADDRESS_FTP_IMAGES, DEFAULT_TEXT, FEED_EXECUTOR,
+                               FEED_WORKERS, FEEDS_FOLDER, FEEDS_POSTFIX,
+                               FILENAMES_ALL, FILENAMES_ALL_NEW,
                                MSC_PROMO_TEXT, MSC_PROMO_TEXT_ALL,
                                NEW_FEEDS_FOLDER, NEW_IMAGE_FOLDER,
-                               SPARE_ADRESS_IMAGES, TVR_PROMO_TEXT)
+                               SPARE_ADRESS_IMAGES, STREAM_TRANSFORM,
+                               TVR_PROMO_TEXT, WORK_FEEDS_FOLDER)
 from handler.decorators import time_of_function
+from handler.exceptions import DirectoryCreationError, EmptyFeedsListError
+from handler.framing import frame_pool
 from handler.logging_config import setup_logging
+from handler.metrics import metrics
 from handler.mixins import FileMixin
+from handler.publish import PublishWriter
+from handler.xml_stream import stream_transform
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
+_image_dict: dict = {}
+
+
+def _share_image_dict(image_dict: dict) -> None:
+    """
+    Передает воркеру обрамленные изображения этапа. Вызывается
+    один раз при запуске воркера, чтобы словарь не передавался
+    с каждой задачей.
+    """
+    global _image_dict
+    _image_dict = image_dict
+
+
+def replace_pictures(
+    offer: ET.Element,
+    counters: Counter,
+    image_dict: dict,
+    key_suffix: str,
+    spare_offers: tuple[str, ...] = ()
+) -> None:
+    """Заменяет изображения оффера на обрамленные."""
+    offer_id = str(offer.get('id'))
+    image_key = f'{offer_id}{key_suffix}'
+
+    if not offer_id:
+        return
+
+    if image_key in image_dict:
+        pictures = offer.findall('picture')
+
+        image_url = f'{ADDRESS_FTP_IMAGES}/{image_dict[image_key]}'
+        if offer_id in spare_offers:  # КОСТЫЛЬ
+            image_url = f'{SPARE_ADRESS_IMAGES}/{image_dict[image_key]}'
+
+        for picture in pictures:
+            offer.remove(picture)
+        counters['deleted_images'] += len(pictures)
+
+        picture_tag = ET.SubElement(offer, 'picture')
+        picture_tag.text = image_url
+        counters['input_images'] += 1
+
+
+def add_sales_notes_tag(
+    offer: ET.Element,
+    counters: Counter,
+    image_dict: dict,
+    key_suffix: str,
+    promo_text: str
+) -> None:
+    """Добавляет офферу тег sales_notes."""
+    offer_id = str(offer.get('id'))
+    offer_key = f'{offer_id}{key_suffix}'
+
+    try:
+        sales_notes_tag = ET.SubElement(offer, 'sales_notes')
+        if offer_key in image_dict:
+            sales_notes_tag.text = promo_text.format(
+                image_dict[offer_key].split('.')[0].split('_')[1]
+            )
+            counters['added_promo_text'] += 1
+        else:
+            sales_notes_tag.text = DEFAULT_TEXT
+            counters['added_default_text'] += 1
+    except (IndexError, KeyError) as error:
+        logging.warning(
+            'Не удалось добавить sales_notes '
+            'для оффера %s: %s',
+            offer_id, error
+        )
+
+
+class FeedJob(NamedTuple):
+    """
+    Перезапись одного фида из file_folder в target_folder.
+    transform - функция модуля с привязанными через partial
+    аргументами, кроме offer, counters и image_dict: задача
+    передается в процесс пула.
+    """
+
+    filename: str
+    file_folder: str
+    target_folder: str
+    transform: Callable
+    prefix: str = 'new_'
+    compress: bool = False
+
 
 class FeedHandler(FileMixin):
     """
     Класс, предоставляющий интерфейс
     для обработки xml-файлов.
+
+    Фиды с подставленными изображениями сохраняются в рабочую папку
+    work_feeds_folder. В папку new_feeds_folder, которую читают
+    потребители, фид публикуется один раз - вместе со сжатыми копиями
+    и уже с тегом sales_notes.
     """
 
     def __init__(
         self,
         feeds_folder: str = FEEDS_FOLDER,
         new_feeds_folder: str = NEW_FEEDS_FOLDER,
-        new_image_folder: str = NEW_IMAGE_FOLDER
+        new_image_folder: str = NEW_IMAGE_FOLDER,
+        work_feeds_folder: str = WORK_FEEDS_FOLDER,
+        stream: bool = STREAM_TRANSFORM,
+        workers: int = FEED_WORKERS,
+        executor: str = FEED_EXECUTOR
     ) -> None:
         self.feeds_folder = feeds_folder
         self.new_feeds_folder = new_feeds_folder
         self.new_image_folder = new_image_folder
+        self.work_feeds_folder = work_feeds_folder
+        self.stream = stream
+        self.workers = workers
+        self.executor = executor
 
     def _save_xml(
         self,
         elem,
         file_folder: str,
         filename: str,
-        prefix='new_'
+        prefix='new_',
+        compress: bool = False
     ) -> None:
-        """Защищенный метод, сохраняет отформатированные файлы."""
+        """
+        Защищенный метод, атомарно сохраняет отформатированные файлы.
+        compress дополнительно публикует сжатые копии фида.
+        """
         root = elem
         self._indent(root)
         formatted_xml = ET.tostring(root, encoding='unicode')
         file_path = self._make_dir(file_folder)
-        with open(
+        with PublishWriter(
             file_path / f'{prefix}{filename}',
-            'w',
-            encoding='utf-8'
-        ) as f:
-            f.write(formatted_xml)
+            compress
+        ) as writer:
+            writer.write(formatted_xml)
+
+    def _rewrite_feed(
+        self,
+        filename: str,
+        file_folder: str,
+        target_folder: str,
+        transform,
+        prefix='new_',
+        compress: bool = False
+    ) -> None:
+        """
+        Защищенный метод, применяет transform к каждому офферу фида
+        и сохраняет результат в папку target_folder.
+        В потоковом режиме офферы обрабатываются и записываются
+        по одному, результат совпадает с записью через _save_xml.
+        """
+        if not self.stream:
+            tree = self._get_tree(filename, file_folder)
+            root = tree.getroot()
+            for offer in list(root.findall('.//offer')):
+                transform(offer)
+            self._save_xml(
+                root,
+                target_folder,
+                filename,
+                prefix,
+                compress
+            )
+            return
+
+        source_path = Path(__file__).parent.parent / file_folder / filename
+        file_path = self._make_dir(target_folder) / f'{prefix}{filename}'
+        with PublishWriter(file_path, compress) as writer:
+            stream_transform(
+                source_path,
+                writer.write,
+                transform,
+                self._indent
+            )
+
+    def _run_job(self, job: FeedJob) -> Counter:
+        """
+        Защищенный метод, перезаписывает фид задачи
+        и возвращает ее счетчики.
+        """
+        counters = Counter()
+        self._rewrite_feed(
+            job.filename,
+            job.file_folder,
+            job.target_folder,
+            partial(
+                job.transform,
+                counters=counters,
+                image_dict=_image_dict
+            ),
+            job.prefix,
+            job.compress
+        )
+        return counters
+
+    def _run_jobs(self, jobs: list[FeedJob], image_dict: dict) -> Counter:
+        """
+        Защищенный метод, перезаписывает фиды задач в пуле
+        и возвращает сумму их счетчиков. Фиды независимы,
+        поэтому каждый перезаписывается в своем воркере; воркеров
+        не больше, чем фидов. image_dict передается каждому
+        воркеру один раз.
+        """
+        counters = Counter()
+        workers = min(self.workers, len(jobs))
+        try:
+            if workers <= 1:
+                _share_image_dict(image_dict)
+                for job in jobs:
+                    counters.update(self._run_job(job))
+                return counters
+            with frame_pool(
+                workers,
+                self.executor,
+                _share_image_dict,
+                (image_dict,)
+            ) as pool:
+                for result in pool.map(self._run_job, jobs):
+                    counters.update(result)
+            return counters
+        finally:
+            _share_image_dict({})
+
+    def _replacement_files(self, only_files: set[str] | None) -> list[str]:
+        """
+        Защищенный метод, возвращает исходные фиды,
+        в которых подставляются обрамленные изображения.
+        """
+        filenames = []
+        for filename in self._get_filenames_set(self.feeds_folder):
+            if filename in FILENAMES_ALL:  # КОСТЫЛЬ!
+                continue
+            if only_files is not None and filename not in only_files:
+                continue
+            filenames.append(filename)
+        return sorted(filenames)
+
+    def _sales_notes_files(
+        self,
+        only_files: set[str] | None,
+        planned: set[str] = frozenset()
+    ) -> list[str]:
+        """
+        Защищенный метод, возвращает промежуточные фиды, в которые
+        добавляется тег sales_notes. planned - промежуточные фиды,
+        которые еще будут созданы предыдущими этапами.
+        """
+        try:
+            filenames = self._get_filenames_set(
+                self.work_feeds_folder,
+                '.xml'
+            )
+        except (DirectoryCreationError, EmptyFeedsListError):
+            if not planned:
+                raise
+            filenames = set()
+        new_filenames = []
+        for filename in filenames | planned:
+            if filename in FILENAMES_ALL_NEW:  # КОСТЫЛЬ!
+                continue
+            if only_files is not None \
+                    and filename.removeprefix('new_') not in only_files:
+                continue
+            new_filenames.append(filename)
+        return sorted(new_filenames)
+
+    def estimate_rewrites(
+        self,
+        stages: set[str],
+        only_files: set[str] | None = None
+    ) -> dict[str, dict[str, int]]:
+        """
+        Метод оценивает, сколько фидов перезапишет каждый из этапов
+        stages, ничего не записывая. Оценка строится по текущим файлам.
+        """
+        rewrites = dict.fromkeys(
+            stages & {
+                'image_replacement',
+                'add_sales_notes',
+                'image_replacement_all',
+                'add_sales_notes_all',
+            },
+            0
+        )
+        replaced: list[str] = []
+        try:
+            if 'image_replacement' in stages \
+                    and self._get_image_dict(self.new_image_folder):
+                replaced = self._replacement_files(only_files)
+                rewrites['image_replacement'] = len(replaced)
+            if 'add_sales_notes' in stages:
+                rewrites['add_sales_notes'] = len(self._sales_notes_files(
+                    only_files,
+                    {f'new_{filename}' for filename in replaced}
+                ))
+        except (DirectoryCreationError, EmptyFeedsListError) as error:
+            logging.warning('Нет фидов для оценки: %s', error)
+        if 'image_replacement_all' in stages \
+                and self._get_image_dict_all(self.new_image_folder):
+            rewrites['image_replacement_all'] = len(FILENAMES_ALL)
+        if 'add_sales_notes_all' in stages:
+            rewrites['add_sales_notes_all'] = len(FILENAMES_ALL_NEW)
+        return {
+            stage: {'rewrites': count} for stage, count in rewrites.items()
+        }
 
     @time_of_function
-    def image_replacement(self) -> None:
-        """Метод, подставляющий в фиды новые изображения."""
-        deleted_images = 0
-        input_images = 0
+    def image_replacement(self, only_files: set[str] | None = None) -> None:
+        """
+        Метод, подставляющий в фиды новые изображения.
+        only_files ограничивает обработку указанными фидами.
+        """
         try:
             image_dict = self._get_image_dict(self.new_image_folder)
 
@@ -61,115 +346,85 @@ class FeedHandler(FileMixin):
                 logging.warning('Нет подходящих изображений для замены')
                 return
 
-            filenames = self._get_filenames_set(self.feeds_folder)
-
-            for filename in filenames:
-                if filename in FILENAMES_ALL:  # КОСТЫЛЬ!
-                    continue
-                tree = self._get_tree(filename, self.feeds_folder)
-                root = tree.getroot()
+            jobs = []
+            for filename in self._replacement_files(only_files):
                 postfix = FEEDS_POSTFIX[filename.split('_')[-1].split('.')[0]]
-                offers = list(root.findall('.//offer'))
                 file_city = filename.split('_')[-2]
-                for offer in offers:
-                    offer_id = str(offer.get('id'))
-                    image_key = f'{offer_id}_{file_city}_{postfix}'
-
-                    if not offer_id:
-                        continue
-
-                    if image_key in image_dict:
-                        pictures = offer.findall('picture')
-
-                        image_url = (
-                            f'{ADDRESS_FTP_IMAGES}/{image_dict[image_key]}'
-                        )  # КОСТЫЛЬ
-                        if offer_id in ('666353',):  # КОСТЫЛЬ
-                            image_url = (
-                                f'{SPARE_ADRESS_IMAGES}/'
-                                f'{image_dict[image_key]}'
-                            )  # КОСТЫЛЬ
-
-                        for picture in pictures:
-                            offer.remove(picture)
-                        deleted_images += len(pictures)
-
-                        picture_tag = ET.SubElement(offer, 'picture')
-                        picture_tag.text = image_url
-                        input_images += 1
-                self._save_xml(root, self.new_feeds_folder, filename)
+                replace = partial(
+                    replace_pictures,
+                    key_suffix=f'_{file_city}_{postfix}',
+                    spare_offers=('666353',)  # КОСТЫЛЬ
+                )
+                jobs.append(FeedJob(
+                    filename,
+                    self.feeds_folder,
+                    self.work_feeds_folder,
+                    replace
+                ))
+            counters = self._run_jobs(jobs, image_dict)
             logger.bot_event(
                 'Количество удаленных изображений - %s',
-                deleted_images
+                counters['deleted_images']
             )
             logger.bot_event(
                 'Количество добавленных изображений - %s',
-                input_images
+                counters['input_images']
             )
+            metrics.count('images_deleted', counters['deleted_images'])
+            metrics.count('images_inserted', counters['input_images'])
 
         except Exception as error:
             logging.error('Ошибка в image_replacement: %s', error)
             raise
 
-    def add_sales_notes(self):
-        added_promo_text = 0
-        added_default_text = 0
+    @time_of_function
+    def add_sales_notes(self, only_files: set[str] | None = None):
+        """
+        Метод, добавляющий офферам тег sales_notes.
+        only_files ограничивает обработку фидами, собранными
+        из указанных исходных файлов.
+        """
         try:
             image_dict = self._get_image_dict(self.new_image_folder)
-            filenames = self._get_filenames_set(self.new_feeds_folder)
-
-            for filename in filenames:
-                if filename in FILENAMES_ALL_NEW:  # КОСТЫЛЬ!
-                    continue
-                tree = self._get_tree(filename, self.new_feeds_folder)
-                root = tree.getroot()
-                offers = list(root.findall('.//offer'))
+            jobs = []
+            for filename in self._sales_notes_files(only_files):
                 postfix = FEEDS_POSTFIX[filename.split('_')[-1].split('.')[0]]
                 file_city = filename.split('_')[-2]
-
-                for offer in offers:
-                    offer_id = str(offer.get('id'))
-                    offer_key = f'{offer_id}_{file_city}_{postfix}'
-
-                    try:
-                        sales_notes_tag = ET.SubElement(offer, 'sales_notes')
-                        promo_text = MSC_PROMO_TEXT
-                        if file_city == '2':
-                            promo_text = TVR_PROMO_TEXT
-                        if offer_key in image_dict:
-                            sales_notes_tag.text = promo_text.format(
-                                image_dict[offer_key].split(
-                                    '.'
-                                )[0].split('_')[1]
-                            )
-                            added_promo_text += 1
-                        else:
-                            sales_notes_tag.text = DEFAULT_TEXT
-                            added_default_text += 1
-                    except (IndexError, KeyError) as error:
-                        logging.warning(
-                            'Не удалось добавить sales_notes '
-                            'для оффера %s: %s',
-                            offer_id, error
-                        )
-                self._save_xml(root, self.new_feeds_folder, filename, '')
+                promo_text = MSC_PROMO_TEXT
+                if file_city == '2':
+                    promo_text = TVR_PROMO_TEXT
+                add_notes = partial(
+                    add_sales_notes_tag,
+                    key_suffix=f'_{file_city}_{postfix}',
+                    promo_text=promo_text
+                )
+                jobs.append(FeedJob(
+                    filename,
+                    self.work_feeds_folder,
+                    self.new_feeds_folder,
+                    add_notes,
+                    '',
+                    compress=True
+                ))
+            counters = self._run_jobs(jobs, image_dict)
             logger.bot_event(
                 'Тег sales_notes с дефолтным текстом добавлен в %s офферов',
-                added_default_text
+                counters['added_default_text']
             )
             logger.bot_event(
                 'Тег sales_notes c промокодом добавлен в %s офферов',
-                added_promo_text
+                counters['added_promo_text']
             )
+            metrics.count('default_text_added', counters['added_default_text'])
+            metrics.count('promo_text_added', counters['added_promo_text'])
         except Exception as error:
             logging.error('Неожиданная ошибка: %s', error)
+            metrics.count_failures()
 
 # ---------------------------------------- костыль для нового фида msk
     @time_of_function
     def image_replacement_all(self) -> None:
         """Метод, подставляющий в фиды новые изображения."""
-        deleted_images = 0
-        input_images = 0
         try:
             image_dict = self._get_image_dict_all(self.new_image_folder)
 
@@ -179,89 +434,68 @@ class FeedHandler(FileMixin):
 
             filenames = FILENAMES_ALL
 
+            jobs = []
             for filename in filenames:
-                tree = self._get_tree(filename, self.feeds_folder)
-                root = tree.getroot()
-
-                offers = list(root.findall('.//offer'))
                 file_city = filename.split('_')[-2]
-                for offer in offers:
-                    offer_id = str(offer.get('id'))
-                    image_key = f'{offer_id}_{file_city}'
-
-                    if not offer_id:
-                        continue
-
-                    if image_key in image_dict:
-                        pictures = offer.findall('picture')
-                        for picture in pictures:
-                            offer.remove(picture)
-                        deleted_images += len(pictures)
-
-                        picture_tag = ET.SubElement(offer, 'picture')
-                        picture_tag.text = (
-                            f'{ADDRESS_FTP_IMAGES}/{image_dict[image_key]}'
-                        )
-                        input_images += 1
-                self._save_xml(root, self.new_feeds_folder, filename)
+                replace = partial(
+                    replace_pictures,
+                    key_suffix=f'_{file_city}'
+                )
+                jobs.append(FeedJob(
+                    filename,
+                    self.feeds_folder,
+                    self.work_feeds_folder,
+                    replace
+                ))
+            counters = self._run_jobs(jobs, image_dict)
             logger.bot_event(
                 'Количество удаленных изображений - %s',
-                deleted_images
+                counters['deleted_images']
             )
             logger.bot_event(
                 'Количество добавленных изображений - %s',
-                input_images
+                counters['input_images']
             )
+            metrics.count('images_deleted', counters['deleted_images'])
+            metrics.count('images_inserted', counters['input_images'])
 
         except Exception as error:
             logging.error('Ошибка в image_replacement: %s', error)
             raise
 
+    @time_of_function
     def add_sales_notes_all(self):
-        added_promo_text = 0
-        added_default_text = 0
         try:
             image_dict = self._get_image_dict_all(self.new_image_folder)
             filenames = FILENAMES_ALL_NEW
 
+            jobs = []
             for filename in filenames:
-                tree = self._get_tree(filename, self.new_feeds_folder)
-                root = tree.getroot()
-                offers = list(root.findall('.//offer'))
                 file_city = filename.split('_')[-2]
-
-                for offer in offers:
-                    offer_id = str(offer.get('id'))
-                    offer_key = f'{offer_id}_{file_city}'
-
-                    try:
-                        sales_notes_tag = ET.SubElement(offer, 'sales_notes')
-                        promo_text = MSC_PROMO_TEXT_ALL
-
-                        if offer_key in image_dict:
-                            sales_notes_tag.text = promo_text.format(
-                                image_dict[offer_key].split(
-                                    '.'
-                                )[0].split('_')[1]
-                            )
-                            added_promo_text += 1
-                        else:
-                            sales_notes_tag.text = DEFAULT_TEXT
-                            added_default_text += 1
-                    except (IndexError, KeyError) as error:
-                        logging.warning(
-                            'Не удалось добавить sales_notes '
-                            'для оффера %s: %s',
-                            offer_id, error
-                        )
-                self._save_xml(root, self.new_feeds_folder, filename, '')
+                add_notes = partial(
+                    add_sales_notes_tag,
+                    key_suffix=f'_{file_city}',
+                    promo_text=MSC_PROMO_TEXT_ALL
+                )
+                jobs.append(FeedJob(
+                    filename,
+                    self.work_feeds_folder,
+                    self.new_feeds_folder,
+                    add_notes,
+                    '',
+                    compress=True
+                ))
+            counters = self._run_jobs(jobs, image_dict)
             logger.bot_event(
                 'Тег sales_notes с дефолтным текстом добавлен в %s офферов',
-                added_default_text
+                counters['added_default_text']
             )
             logger.bot_event(
                 'Тег sales_notes c промокодом добавлен в %s офферов',
-                added_promo_text
+                counters['added_promo_text']
             )
+            metrics.count('default_text_added', counters['added_default_text'])
+            metrics.count('promo_text_added', counters['added_promo_text'])
         except Exception as error:
             logging.error('Неожиданная ошибка: %s', error)
+            metrics.count_failures()
@@ -1,16 +1,24 @@
+import hashlib
 import logging
+import os
 import xml.etree.ElementTree as ET
+from pathlib import Path
+from xml.parsers import expat
 
 import requests
 from dotenv import load_dotenv
 
-from handler.constants import ENCODING, FEEDS_FOLDER
+from handler.constants import (CONDITIONAL_FETCH, ENCODING, FEED_CHUNK_SIZE,
+                               FEED_VARIANT_LINK, FEEDS_FOLDER, STREAM_FEEDS)
 from handler.decorators import retry_on_network_error, time_of_function
 from handler.exceptions import (EmptyFeedsListError, EmptyXMLError,
                                 InvalidXMLError)
-from handler.feeds import FEEDS
+from handler.feeds import FEED_ALL_MSC, FEEDS
+from handler.governor import get_governor
 from handler.logging_config import setup_logging
+from handler.metrics import metrics
 from handler.mixins import FileMixin
+from handler.state import load_state, save_state
 
 setup_logging()
 logger = logging.getLogger(__name__)
@@ -26,7 +34,10 @@ class FeedSave(FileMixin):
     def __init__(
         self,
         feeds_list: tuple[str, ...] = FEEDS,
-        feeds_folder: str = FEEDS_FOLDER
+        feeds_folder: str = FEEDS_FOLDER,
+        stream: bool = STREAM_FEEDS,
+        conditional: bool = CONDITIONAL_FETCH,
+        variant_link: str = FEED_VARIANT_LINK
     ) -> None:
         if not feeds_list:
             logging.error('Не передан список фидов.')
@@ -34,15 +45,41 @@ class FeedSave(FileMixin):
 
         self.feeds_list = feeds_list
         self.feeds_folder = feeds_folder
+        self.stream = stream
+        self.conditional = conditional
+        self.variant_link = variant_link
+        self._sources: dict[str, tuple[Path, str]] = {}
+        self.changed_files: set[str] = set()
+        self.unchanged_files: set[str] = set()
+        self._validators: dict = load_state('feeds') if conditional else {}
 
     @retry_on_network_error(max_attempts=3, delays=(2, 5, 10))
-    def _get_file(self, feed: str):
-        """Защищенный метод, получает фид по ссылке."""
+    def _get_file(self, feed: str, validators: dict | None = None):
+        """
+        Защищенный метод, получает фид по ссылке.
+        При наличии валидаторов отправляет условный запрос,
+        ответ 304 означает, что фид не изменился.
+        """
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
         try:
-            response = requests.get(feed, stream=True, timeout=(10, 60))
+            response = get_governor().get(
+                feed,
+                retries=0,
+                stream=True,
+                timeout=(10, 60),
+                headers=headers
+            )
 
             if response.status_code == requests.codes.ok:
                 return response
+            if response.status_code == requests.codes.not_modified \
+                    and validators:
+                return response
             else:
                 logging.error(
                     'HTTP ошибка %s при загрузке %s',
@@ -86,43 +123,222 @@ class FeedSave(FileMixin):
             raise InvalidXMLError(f'XML содержит синтаксические ошибки: {e}')
         return decoded_content
 
+    def _stream_xml(
+        self,
+        response,
+        file_path: Path,
+        known_digest: str | None = None
+    ) -> str:
+        """
+        Защищенный метод, потоково записывает тело ответа в файл
+        и возвращает sha256 содержимого. XML проверяется инкрементально
+        по мере получения блоков, файл появляется по итоговому пути
+        только после проверки и только если содержимое изменилось.
+        """
+        parser = expat.ParserCreate()
+        digest = hashlib.sha256()
+        temp_path = file_path.with_name(f'{file_path.name}.part')
+        received = False
+        try:
+            with open(temp_path, 'wb') as file:
+                for chunk in response.iter_content(
+                    chunk_size=FEED_CHUNK_SIZE
+                ):
+                    if not chunk:
+                        continue
+                    if not received and chunk.strip():
+                        received = True
+                    parser.Parse(chunk, False)
+                    digest.update(chunk)
+                    file.write(chunk)
+                if not received:
+                    logging.error('Получен пустой XML-файл')
+                    raise EmptyXMLError('XML пуст')
+                parser.Parse(b'', True)
+            if digest.hexdigest() != known_digest:
+                os.replace(temp_path, file_path)
+            return digest.hexdigest()
+        except expat.ExpatError as error:
+            logging.error('XML-файл содержит синтаксические ошибки')
+            raise InvalidXMLError(
+                f'XML содержит синтаксические ошибки: {error}'
+            )
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    def _build_tree(self, response) -> ET.ElementTree:
+        """
+        Защищенный метод, читает ответ целиком, валидирует его
+        и возвращает отформатированное дерево фида.
+        """
+        decoded_content = self._validate_xml(response.content)
+        xml_tree = ET.fromstring(decoded_content)
+        self._indent(xml_tree)
+        return ET.ElementTree(xml_tree)
+
+    def _write_tree(self, tree: ET.ElementTree, file_path: Path) -> None:
+        """Защищенный метод, записывает дерево фида в xml-файл."""
+        with open(file_path, 'wb') as file:
+            tree.write(file, encoding=ENCODING, xml_declaration=True)
+
+    def _get_validators(self, file_path: Path) -> dict:
+        """
+        Защищенный метод, возвращает сохраненные валидаторы файла,
+        если условное скачивание включено и файл на месте.
+        """
+        if not self.conditional or not file_path.exists():
+            return {}
+        return self._validators.get(file_path.name, {})
+
+    def _fetch_feed(self, feed: str, file_path: Path) -> tuple[str, bool]:
+        """
+        Защищенный метод, скачивает фид в file_path.
+        Возвращает sha256 содержимого и признак того,
+        что файл был перезаписан.
+        """
+        validators = self._get_validators(file_path)
+        known_digest = validators.get('sha256')
+        with self._get_file(feed, validators) as response:
+            if response.status_code == requests.codes.not_modified:
+                digest = known_digest
+            elif self.stream:
+                digest = self._stream_xml(response, file_path, known_digest)
+            else:
+                digest = hashlib.sha256(response.content).hexdigest()
+                if digest != known_digest:
+                    self._write_tree(self._build_tree(response), file_path)
+            headers = response.headers
+            self._validators[file_path.name] = {
+                'etag': headers.get('ETag', validators.get('etag')),
+                'last_modified': headers.get(
+                    'Last-Modified',
+                    validators.get('last_modified')
+                ),
+                'sha256': digest,
+            }
+        return digest, digest != known_digest
+
+    def _save_feed(
+        self,
+        feed: str,
+        folder_path: Path,
+        file_names: tuple[str, ...]
+    ) -> set[str]:
+        """
+        Защищенный метод, сохраняет фид во все файлы-варианты file_names.
+        Фид скачивается и сериализуется один раз за запуск, остальные
+        варианты получаются клонированием готового файла.
+        Возвращает имена перезаписанных файлов: неизменившиеся
+        с прошлого запуска файлы не трогаются.
+        """
+        written = set()
+        if feed not in self._sources:
+            source_path = folder_path / file_names[0]
+            digest, changed = self._fetch_feed(feed, source_path)
+            self._sources[feed] = (source_path, digest)
+            if changed:
+                written.add(source_path.name)
+        source_path, digest = self._sources[feed]
+        for file_name in file_names:
+            if file_name == source_path.name:
+                continue
+            file_path = folder_path / file_name
+            if self._get_validators(file_path).get('sha256') == digest:
+                continue
+            self._clone_file(source_path, file_path, self.variant_link)
+            self._validators[file_name] = {'sha256': digest}
+            written.add(file_name)
+        self.changed_files.update(written)
+        self.unchanged_files.update(set(file_names) - written)
+        return written
+
+    def save_validators(self, failed_files: set[str] = frozenset()) -> None:
+        """
+        Метод сохраняет валидаторы скачанных фидов.
+        Вызывается после успешной обработки, чтобы незавершенный
+        запуск не пометил фиды как уже обработанные. Валидаторы
+        failed_files - фидов, обработка которых прервалась, -
+        не сохраняются: следующий запуск скачает и обработает их заново.
+        """
+        if not self.conditional:
+            return
+        validators = {
+            file_name: value
+            for file_name, value in self._validators.items()
+            if file_name not in failed_files
+        }
+        if failed_files:
+            logging.info(
+                'Валидаторы фидов с прерванной обработкой не сохранены: %s',
+                ', '.join(sorted(failed_files))
+            )
+        save_state('feeds', validators)
+
+    def estimate_requests(self, stages: set[str]) -> dict[str, dict]:
+        """
+        Метод оценивает запросы за фидами без скачивания:
+        сколько фидов будет запрошено и сколько из них условно,
+        с валидаторами прошлого запуска.
+        """
+        folder_path = Path(__file__).parent.parent / self.feeds_folder
+        sources = {
+            'save_xml': [
+                self._get_filename(feed)[0] for feed in self.feeds_list
+            ],
+            'save_xml_one': [self._get_filename(FEED_ALL_MSC)[2]],
+        }
+        if 'save_xml' in stages and FEED_ALL_MSC in self.feeds_list:
+            # Фид уже скачан этапом save_xml и будет только склонирован.
+            sources['save_xml_one'] = []
+        return {
+            stage: {
+                'requests': len(file_names),
+                'conditional': sum(
+                    any(
+                        self._get_validators(folder_path / file_name).get(key)
+                        for key in ('etag', 'last_modified')
+                    )
+                    for file_name in file_names
+                ),
+            }
+            for stage, file_names in sources.items()
+            if stage in stages
+        }
+
     @time_of_function
     def save_xml(self) -> None:
         """Метод, сохраняющий фиды в xml-файлы"""
         total_files: int = len(self.feeds_list)
         saved_copy = 0
         saved_files = 0
+        unchanged_files = 0
         folder_path = self._make_dir(self.feeds_folder)
         for feed in self.feeds_list:
             file_name, file_name_copy, _ = self._get_filename(feed)
-            file_path = folder_path / file_name
             try:
-                response = self._get_file(feed)
-                xml_content = response.content
-                decoded_content = self._validate_xml(xml_content)
-                xml_tree = ET.fromstring(decoded_content)
-                self._indent(xml_tree)
-                tree = ET.ElementTree(xml_tree)
-                with open(file_path, 'wb') as file:
-                    tree.write(file, encoding=ENCODING, xml_declaration=True)
-
-                backup_path = folder_path / file_name_copy
-                with open(backup_path, 'wb') as file:
-                    tree.write(file, encoding=ENCODING, xml_declaration=True)
+                written = self._save_feed(
+                    feed,
+                    folder_path,
+                    (file_name, file_name_copy)
+                )
+                if not written:
+                    unchanged_files += 1
+                    logging.info('\nФайл %s не изменился', file_name)
+                    continue
 
-                saved_files += 1
-                saved_copy += 1
+                saved_files += file_name in written
+                saved_copy += file_name_copy in written
                 logging.info(
-                    '\nФайл %s успешно сохранен'
-                    '\nКопия %s успешно сохранена',
-                    file_name,
-                    file_name_copy
+                    '\nЗаписаны файлы фида: %s',
+                    ', '.join(sorted(written))
                 )
             except requests.exceptions.RequestException as error:
                 logging.warning('Фид %s не получен: %s', file_name, error)
+                metrics.count_failures()
                 continue
             except (EmptyXMLError, InvalidXMLError) as error:
                 logging.error('Ошибка валидации XML %s: %s', file_name, error)
+                metrics.count_failures()
                 continue
             except Exception as error:
                 logging.error(
@@ -137,6 +353,14 @@ class FeedSave(FileMixin):
             total_files
         )
         logger.bot_event('Создано копий - %s/%s.', saved_copy, total_files)
+        logger.bot_event(
+            'Фидов без изменений - %s/%s.',
+            unchanged_files,
+            total_files
+        )
+        metrics.count('feeds_saved', saved_files)
+        metrics.count('copies_saved', saved_copy)
+        metrics.count('feeds_unchanged', unchanged_files)
 
 # ---------------------------------------- костыль для нового фида msk
     @time_of_function
@@ -145,27 +369,22 @@ class FeedSave(FileMixin):
         saved_files = 0
         folder_path = self._make_dir(self.feeds_folder)
         _, _, filename = self._get_filename(feed)
-        file_path = folder_path / filename
         try:
-            response = self._get_file(feed)
-            xml_content = response.content
-            decoded_content = self._validate_xml(xml_content)
-            xml_tree = ET.fromstring(decoded_content)
-            self._indent(xml_tree)
-            tree = ET.ElementTree(xml_tree)
-            with open(file_path, 'wb') as file:
-                tree.write(file, encoding=ENCODING, xml_declaration=True)
-
-            saved_files += 1
-            logging.info(
-                '\nФайл %s успешно сохранен',
-                filename
-            )
+            if self._save_feed(feed, folder_path, (filename,)):
+                saved_files += 1
+                logging.info(
+                    '\nФайл %s успешно сохранен',
+                    filename
+                )
+            else:
+                logging.info('\nФайл %s не изменился', filename)
         except requests.exceptions.RequestException as error:
             logging.warning('Фид %s не получен: %s', filename, error)
+            metrics.count_failures()
             return
         except (EmptyXMLError, InvalidXMLError) as error:
             logging.error('Ошибка валидации XML %s: %s', filename, error)
+            metrics.count_failures()
             return
         except Exception as error:
             logging.error(
@@ -178,3 +397,4 @@ class FeedSave(FileMixin):
             'Успешно записано %s/1 файл для всех товаров.',
             saved_files,
         )
+        metrics.count('feeds_saved', saved_files)
@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+from PIL import Image
+
+from handler.constants import DEFAULT_IMAGE_SIZE
+from handler.exceptions import FrameLoadError
+from handler.logging_config import setup_logging
+
+setup_logging()
+
+
+class FrameCache:
+    """
+    Кэш рамок. Каждая рамка открывается, переводится в RGBA
+    и масштабируется один раз на процесс для каждого размера.
+    """
+
+    def __init__(self, frame_folder: str) -> None:
+        self.frame_path = Path(__file__).parent.parent / frame_folder
+        self._frames: dict[tuple[str, tuple[int, int]], Image.Image] = {}
+        self._digests: dict[str, str] = {}
+        self._signatures: dict[str, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, frame_name: str, size: tuple[int, int]) -> Image.Image:
+        """Защищенный метод, загружает и масштабирует рамку."""
+        try:
+            with Image.open(self.frame_path / frame_name) as frame:
+                frame.load()
+                return frame.convert('RGBA').resize(size)
+        except Exception as error:
+            logging.error(
+                'Не удалось загрузить рамку %s: %s',
+                frame_name,
+                error
+            )
+            raise FrameLoadError(f'Рамка {frame_name} недоступна: {error}')
+
+    def get(
+        self,
+        frame_name: str,
+        size: tuple[int, int] = DEFAULT_IMAGE_SIZE
+    ) -> Image.Image:
+        """Возвращает рамку нужного размера."""
+        key = (frame_name, tuple(size))
+        frame = self._frames.get(key)
+        if frame is None:
+            with self._lock:
+                frame = self._frames.get(key)
+                if frame is None:
+                    frame = self._load(frame_name, key[1])
+                    self._frames[key] = frame
+        return frame
+
+    def digest(self, frame_name: str) -> str:
+        """Возвращает хэш файла рамки вместе с ее именем."""
+        digest = self._digests.get(frame_name)
+        if digest is None:
+            with open(self.frame_path / frame_name, 'rb') as file:
+                content_hash = hashlib.file_digest(file, 'sha256')
+            digest = f'{frame_name}:{content_hash.hexdigest()}'
+            self._digests[frame_name] = digest
+        return digest
+
+    def _refresh(self, frame_name: str) -> None:
+        """
+        Защищенный метод, сбрасывает кэш рамки, если ее файл
+        изменился с момента загрузки.
+        """
+        try:
+            stat = (self.frame_path / frame_name).stat()
+        except OSError:
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if self._signatures.get(frame_name) == signature:
+                return
+            if frame_name in self._signatures:
+                logging.info('Рамка %s изменилась', frame_name)
+            self._signatures[frame_name] = signature
+            self._digests.pop(frame_name, None)
+            for key in [key for key in self._frames if key[0] == frame_name]:
+                del self._frames[key]
+
+    def refresh(self, frame_names) -> None:
+        """Сбрасывает кэш рамок, файлы которых изменились."""
+        for frame_name in sorted(set(frame_names)):
+            self._refresh(frame_name)
+
+    def preload(
+        self,
+        frame_names,
+        size: tuple[int, int] = DEFAULT_IMAGE_SIZE
+    ) -> None:
+        """
+        Загружает рамки заранее: отсутствующая или битая рамка
+        останавливает этап до обработки офферов. Рамки, файлы
+        которых изменились, загружаются заново.
+        """
+        frame_names = sorted(set(frame_names))
+        self.refresh(frame_names)
+        for frame_name in frame_names:
+            self.get(frame_name, size)
+        logging.info('Загружено рамок в кэш: %s', len(self._frames))
+
+
+_frame_caches: dict[str, FrameCache] = {}
+_frame_caches_lock = threading.Lock()
+
+
+def get_frame_cache(frame_folder: str) -> FrameCache:
+    """Возвращает общий для процесса кэш рамок папки frame_folder."""
+    with _frame_caches_lock:
+        cache = _frame_caches.get(frame_folder)
+        if cache is None:
+            cache = FrameCache(frame_folder)
+            _frame_caches[frame_folder] = cache
+        return cache
@@ -0,0 +1,223 @@
+import hashlib
+import logging
+from concurrent.futures import (Executor, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+from functools import partial
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+from PIL import Image
+
+from handler.constants import (DEFAULT_IMAGE_SIZE, FRAME_IMAGE_FORMAT,
+                               FRAME_IMAGE_OPTIMIZE, FRAME_IMAGE_QUALITY,
+                               FRAME_PNG_COMPRESS_LEVEL, RGB_COLOR_SETTINGS)
+from handler.frames import get_frame_cache
+from handler.logging_config import setup_logging
+
+setup_logging()
+
+EXECUTORS = {
+    'thread': ThreadPoolExecutor,
+    'process': ProcessPoolExecutor,
+}
+"""Доступные пулы для обрамления изображений и перезаписи фидов."""
+
+FRAME_LAYOUT_VERSION = 2
+"""
+Версия алгоритма компоновки. Увеличивается при изменении
+render_frame, чтобы пересобрать все обрамленные изображения.
+"""
+
+REDUCING_GAP = 2.0
+"""
+Запас для предварительного уменьшения в resize: изображение сначала
+быстро сжимается в целое число раз, затем масштабируется до точного
+размера, что по качеству почти не отличается от прямого resize.
+"""
+
+
+ENCODER_EXTENSIONS = {
+    'PNG': 'png',
+    'JPEG': 'jpg',
+    'WEBP': 'webp',
+}
+"""Поддерживаемые форматы обрамленных изображений и их расширения."""
+
+
+class EncoderProfile(NamedTuple):
+    """Параметры кодирования обрамленного изображения."""
+
+    image_format: str = 'PNG'
+    quality: int = 85
+    compress_level: int = 6
+    optimize: bool = False
+
+    @property
+    def extension(self) -> str:
+        """Расширение файлов в этом формате."""
+        return ENCODER_EXTENSIONS[self.image_format]
+
+    def save_options(self) -> dict:
+        """Возвращает параметры для Image.save."""
+        options = {'optimize': self.optimize}
+        if self.image_format == 'PNG':
+            options['compress_level'] = self.compress_level
+        else:
+            options['quality'] = self.quality
+        return options
+
+
+def get_encoder_profile(
+    image_format: str = FRAME_IMAGE_FORMAT,
+    quality: int = FRAME_IMAGE_QUALITY,
+    compress_level: int = FRAME_PNG_COMPRESS_LEVEL,
+    optimize: bool = FRAME_IMAGE_OPTIMIZE
+) -> EncoderProfile:
+    """Возвращает профиль кодирования из настроек."""
+    image_format = image_format.upper()
+    if image_format not in ENCODER_EXTENSIONS:
+        logging.warning(
+            'Неизвестный формат изображений %s, используется PNG',
+            image_format
+        )
+        image_format = 'PNG'
+    return EncoderProfile(image_format, quality, compress_level, optimize)
+
+
+def layout_signature(encoder: EncoderProfile = EncoderProfile()) -> str:
+    """
+    Возвращает хэш параметров компоновки и кодирования
+    обрамленного изображения.
+    """
+    params = (
+        FRAME_LAYOUT_VERSION,
+        DEFAULT_IMAGE_SIZE,
+        RGB_COLOR_SETTINGS,
+        tuple(encoder)
+    )
+    return hashlib.sha256(repr(params).encode()).hexdigest()
+
+
+class FrameJob(NamedTuple):
+    """Задача на обрамление одного изображения."""
+
+    offer_id: str
+    source_path: Path
+    frame_name: str
+    output_path: Path
+
+
+def fit_size(
+    image_size: tuple[int, int],
+    canvas_size: tuple[int, int]
+) -> tuple[int, int]:
+    """
+    Возвращает размер изображения на холсте. Изображение, которое
+    не помещается на холст, уменьшается хотя бы вдвое и не больше,
+    чем нужно, чтобы оно поместилось целиком.
+    """
+    image_width, image_height = image_size
+    canvas_width, canvas_height = canvas_size
+    if image_width <= canvas_width and image_height <= canvas_height:
+        return image_size
+    scale = min(0.5, canvas_width / image_width, canvas_height / image_height)
+    return (
+        max(1, int(image_width * scale)),
+        max(1, int(image_height * scale))
+    )
+
+
+def render_frame(
+    job: FrameJob,
+    frame_folder: str,
+    encoder: EncoderProfile = EncoderProfile()
+) -> None:
+    """
+    Накладывает рамку на изображение оффера и сохраняет результат.
+    Большие JPEG декодируются сразу в уменьшенном масштабе (draft),
+    остальные форматы уменьшаются через reduce перед точным resize.
+    """
+    frame = get_frame_cache(frame_folder).get(job.frame_name)
+    with Image.open(job.source_path) as image:
+        target_size = fit_size(image.size, DEFAULT_IMAGE_SIZE)
+        if target_size != image.size:
+            image.draft(image.mode, target_size)
+            image = image.resize(target_size, reducing_gap=REDUCING_GAP)
+        else:
+            image.load()
+        image_width, image_height = image.size
+
+        final_image = Image.new('RGB', DEFAULT_IMAGE_SIZE, RGB_COLOR_SETTINGS)
+
+        canvas_width, canvas_height = DEFAULT_IMAGE_SIZE
+        x_position = (canvas_width - image_width) // 2
+        y_position = (canvas_height - image_height) // 2
+
+        final_image.paste(image, (x_position, y_position))
+    final_image.paste(frame, (0, 0), frame)
+    final_image.save(
+        job.output_path,
+        encoder.image_format,
+        **encoder.save_options()
+    )
+
+
+def frame_offer(
+    job: FrameJob,
+    frame_folder: str,
+    encoder: EncoderProfile = EncoderProfile()
+) -> bool:
+    """Выполняет задачу на обрамление, возвращает True при успехе."""
+    try:
+        render_frame(job, frame_folder, encoder)
+        return True
+    except Exception as error:
+        logging.error('Ошибка при обрамлении %s: %s', job.offer_id, error)
+        return False
+
+
+def frame_pool(
+    workers: int,
+    executor: str = 'thread',
+    initializer: Callable | None = None,
+    initargs: tuple = ()
+) -> Executor:
+    """
+    Создает пул потоков или процессов для обрамления и фидов.
+    initializer(*initargs) выполняется один раз в каждом воркере.
+    """
+    executor_class = EXECUTORS.get(executor)
+    if executor_class is None:
+        logging.warning(
+            'Неизвестный тип пула %s, используются потоки',
+            executor
+        )
+        executor_class = ThreadPoolExecutor
+    return executor_class(
+        max_workers=max(1, workers),
+        initializer=initializer,
+        initargs=initargs
+    )
+
+
+def run_frame_jobs(
+    jobs: list[FrameJob],
+    frame_folder: str,
+    workers: int,
+    executor: str = 'thread',
+    encoder: EncoderProfile = EncoderProfile()
+) -> list[bool]:
+    """
+    Выполняет задачи на обрамление в пуле потоков или процессов.
+    Возвращает результаты в порядке задач: True при успехе.
+    """
+    worker = partial(
+        frame_offer,
+        frame_folder=frame_folder,
+        encoder=encoder
+    )
+    if workers <= 1 or len(jobs) <= 1:
+        return [worker(job) for job in jobs]
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with frame_pool(workers, executor) as pool:
+        return list(pool.map(worker, jobs, chunksize=chunksize))
@@ -0,0 +1,347 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from handler.constants import (BREAKER_COOLDOWN, BREAKER_THRESHOLD,
+                               HOST_BACKOFF, HOST_BURST, HOST_RATE_LIMIT,
+                               HOST_RETRIES)
+from handler.exceptions import CircuitOpenError
+from handler.http_session import get_session
+from handler.logging_config import setup_logging
+from handler.metrics import metrics
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+"""Ответы, после которых запрос повторяется."""
+
+NETWORK_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+"""Ошибки запроса, после которых запрос повторяется."""
+
+
+def jittered(delay: float) -> float:
+    """
+    Возвращает случайную паузу от половины до полной delay, чтобы
+    потоки, получившие ошибку одновременно, не повторяли запросы разом.
+    """
+    return random.uniform(delay / 2, delay)
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты запросов: rate запросов в секунду
+    и до burst запросов подряд. Ожидание блокирует только
+    поток, которому не хватило токена.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Забирает токен и возвращает время ожидания в секундах."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst,
+                    self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """
+    Предохранитель хоста. После threshold ошибок подряд размыкается
+    и cooldown секунд не пропускает запросы. Затем пропускает один
+    пробный запрос: успех замыкает предохранитель, ошибка снова
+    размыкает его на cooldown.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Проверяет, можно ли отправить запрос."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def release(self) -> None:
+        """
+        Снимает пробный запрос, который завершился ошибкой, не
+        связанной с доступностью хоста: следующий запрос станет пробным.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+            self._probing = False
+
+    def record_failure(self) -> bool:
+        """
+        Учитывает ошибку запроса.
+        Возвращает True, если предохранитель разомкнулся.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == self.OPEN:
+                return False
+            if self.state == self.HALF_OPEN \
+                    or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trips += 1
+                self._probing = False
+                return True
+            return False
+
+
+class HostGovernor:
+    """Ограничитель частоты, предохранитель и счетчики одного хоста."""
+
+    def __init__(
+        self,
+        host: str,
+        rate: float,
+        burst: int,
+        threshold: int,
+        cooldown: float
+    ) -> None:
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(threshold, cooldown)
+        self._lock = threading.Lock()
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        """Сбрасывает счетчики запуска, состояние хоста сохраняется."""
+        with self._lock:
+            self.counters = dict.fromkeys(
+                ('requests', 'failures', 'retries', 'rejected', 'trips'),
+                0
+            )
+            self.throttled_seconds = 0.0
+
+    def count(self, item: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[item] += value
+
+    def throttled(self, seconds: float) -> None:
+        with self._lock:
+            self.throttled_seconds += seconds
+
+    def summary(self) -> dict:
+        """Возвращает состояние и счетчики хоста."""
+        with self._lock:
+            return {
+                'state': self.breaker.state,
+                **self.counters,
+                'throttled_seconds': round(self.throttled_seconds, 3),
+            }
+
+
+class RequestGovernor:
+    """
+    Регулятор HTTP-запросов по хостам.
+
+    Каждый запрос проходит через предохранитель и ограничитель
+    частоты своего хоста. Сетевые ошибки и ответы 429/5xx повторяются
+    с экспоненциальной паузой со случайным разбросом. Пауза
+    выдерживается в потоке запроса, остальные загрузки продолжаются.
+    Состояние хостов живет в процессе между запусками.
+    """
+
+    def __init__(
+        self,
+        rate: float = HOST_RATE_LIMIT,
+        burst: int = HOST_BURST,
+        threshold: int = BREAKER_THRESHOLD,
+        cooldown: float = BREAKER_COOLDOWN,
+        retries: int = HOST_RETRIES,
+        backoff: tuple[float, float] = HOST_BACKOFF
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.retries = retries
+        self.backoff = backoff
+        self.hosts: dict[str, HostGovernor] = {}
+        self._lock = threading.Lock()
+
+    def host(self, url: str) -> HostGovernor:
+        """Возвращает регулятор хоста адреса url."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostGovernor(
+                    host,
+                    self.rate,
+                    self.burst,
+                    self.threshold,
+                    self.cooldown
+                )
+            return self.hosts[host]
+
+    def _delay(self, attempt: int, response=None) -> float:
+        """
+        Защищенный метод, возвращает паузу перед повтором.
+        Учитывает заголовок Retry-After ответа 429/503.
+        """
+        start, limit = self.backoff
+        delay = min(limit, start * 2 ** attempt)
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(limit, max(delay, int(retry_after)))
+        return jittered(delay)
+
+    def _failed(self, governor: HostGovernor) -> None:
+        """Защищенный метод, учитывает ошибку запроса к хосту."""
+        governor.count('failures')
+        if governor.breaker.record_failure():
+            governor.count('trips')
+            logging.warning(
+                'Хост %s не отвечает, запросы приостановлены на %s сек.',
+                governor.host,
+                self.cooldown
+            )
+
+    def request(
+        self,
+        url: str,
+        method: str = 'GET',
+        retries: int | None = None,
+        **kwargs
+    ) -> requests.Response:
+        """
+        Отправляет запрос через общую сессию.
+        Возвращает последний ответ или выбрасывает последнюю
+        сетевую ошибку. Если запросы к хосту приостановлены,
+        выбрасывает CircuitOpenError.
+        """
+        governor = self.host(url)
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            if not governor.breaker.allow():
+                governor.count('rejected')
+                raise CircuitOpenError(
+                    f'Запросы к {governor.host} приостановлены'
+                )
+            governor.throttled(governor.bucket.acquire())
+            governor.count('requests')
+            response = None
+            try:
+                response = get_session().request(method, url, **kwargs)
+            except NETWORK_ERRORS:
+                self._failed(governor)
+                if attempt >= retries:
+                    raise
+            except Exception:
+                governor.breaker.release()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    governor.breaker.record_success()
+                    return response
+                self._failed(governor)
+                if attempt >= retries:
+                    return response
+                response.close()
+            delay = self._delay(attempt, response)
+            attempt += 1
+            governor.count('retries')
+            logging.debug(
+                'Повтор %s запроса %s через %.2f сек.',
+                attempt,
+                url,
+                delay
+            )
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Отправляет GET-запрос, см. request."""
+        return self.request(url, 'GET', **kwargs)
+
+    def report(self) -> None:
+        """
+        Выводит состояние хостов в итоги запуска, передает его
+        в метрики и сбрасывает счетчики запуска.
+        """
+        with self._lock:
+            hosts = list(self.hosts.values())
+        for governor in sorted(hosts, key=lambda item: item.host):
+            summary = governor.summary()
+            if not summary['requests'] and not summary['rejected']:
+                continue
+            logger.bot_event(
+                'Хост %s: %s, запросов %s, ошибок %s, повторов %s, '
+                'отклонено %s',
+                governor.host,
+                summary['state'],
+                summary['requests'],
+                summary['failures'],
+                summary['retries'],
+                summary['rejected']
+            )
+            metrics.set_host(governor.host, summary)
+            governor.reset_counters()
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor() -> RequestGovernor:
+    """Возвращает общий для процесса регулятор запросов."""
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = RequestGovernor()
+    return _governor
@@ -0,0 +1,34 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from handler.constants import (HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE,
+                               IMAGE_DOWNLOAD_WORKERS)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Возвращает общую для процесса HTTP-сессию.
+
+    Сессия держит отдельный пул keep-alive соединений для каждого хоста,
+    размер пула не меньше числа потоков загрузки изображений, поэтому
+    потоки не открывают новое соединение на каждый запрос.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_maxsize = max(HTTP_POOL_MAXSIZE, IMAGE_DOWNLOAD_WORKERS)
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=pool_maxsize
+                )
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
@@ -1,25 +1,65 @@
+import hashlib
 import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from io import BytesIO
 from pathlib import Path
+from typing import NamedTuple
 
-import requests
 from PIL import Image
 
-from handler.constants import (CURRENT_ID, DEFAULT_IMAGE_SIZE, FEEDS_FOLDER,
-                               FILENAMES_ALL, FRAME_FOLDER, IMAGE_FOLDER,
-                               MSC_ALL_FRAME, MSC_FRAMES_NET, MSC_FRAMES_SRCH,
+from handler.asset_index import get_asset_index
+from handler.build_manifest import BuildManifest
+from handler.category_index import get_category_index
+from handler.constants import (ASSET_INDEX, CURRENT_ID, FEEDS_FOLDER,
+                               FILENAMES_ALL, FRAME_EXECUTOR, FRAME_FOLDER,
+                               FRAME_QUEUE_SIZE, FRAME_WORKERS,
+                               IMAGE_DOWNLOAD_WORKERS, IMAGE_FOLDER,
+                               IMAGE_PASSTHROUGH, IMAGE_PASSTHROUGH_FORMATS,
+                               IMAGE_REQUEST_TIMEOUT, MSC_ALL_FRAME,
+                               MSC_FRAMES_NET, MSC_FRAMES_SRCH,
                                NEW_IMAGE_FOLDER, NUMBER_PIXELS_IMAGE,
-                               RGB_COLOR_SETTINGS, TVR_FRAMES_NET,
-                               TVR_FRAMES_SRCH)
+                               TVR_FRAMES_NET, TVR_FRAMES_SRCH)
 from handler.decorators import time_of_function
-from handler.exceptions import DirectoryCreationError, EmptyFeedsListError
+from handler.exceptions import (CircuitOpenError, DirectoryCreationError,
+                                EmptyFeedsListError, GetTreeError)
 from handler.feeds import FEEDS
+from handler.frames import get_frame_cache
+from handler.framing import (EncoderProfile, FrameJob, frame_offer, frame_pool,
+                             get_encoder_profile, layout_signature,
+                             run_frame_jobs)
+from handler.governor import get_governor
+from handler.image_store import ImageStore
 from handler.logging_config import setup_logging
+from handler.metrics import metrics
 from handler.mixins import FileMixin
+from handler.offer_diff import OfferDiff, OfferSnapshot
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
+FRAME_NAME_DICTS = (
+    MSC_FRAMES_NET,
+    MSC_FRAMES_SRCH,
+    TVR_FRAMES_NET,
+    TVR_FRAMES_SRCH
+)
+"""Рамки обычных фидов по городам и размещениям."""
+
+
+class FrameTarget(NamedTuple):
+    """Обрамленное изображение, которое должно быть у оффера фида."""
+
+    offer_id: str
+    offer_key: str
+    suffix: str
+    framed_file: str | None
+    parent_id: str
+    frame_names: dict[str, str]
+    unchanged: bool = False
+
 
 class FeedImage(FileMixin):
     """
@@ -34,7 +74,13 @@ class FeedImage(FileMixin):
         image_folder: str = IMAGE_FOLDER,
         new_image_folder: str = NEW_IMAGE_FOLDER,
         feeds_list: tuple[str, ...] = FEEDS,
-        number_pixels_image: int = NUMBER_PIXELS_IMAGE
+        number_pixels_image: int = NUMBER_PIXELS_IMAGE,
+        download_workers: int = IMAGE_DOWNLOAD_WORKERS,
+        frame_workers: int = FRAME_WORKERS,
+        frame_executor: str = FRAME_EXECUTOR,
+        encoder: EncoderProfile | None = None,
+        frame_queue_size: int = FRAME_QUEUE_SIZE,
+        passthrough: bool = IMAGE_PASSTHROUGH
     ) -> None:
         self.frame_folder = frame_folder
         self.feeds_folder = feeds_folder
@@ -42,19 +88,40 @@ class FeedImage(FileMixin):
         self.new_image_folder = new_image_folder
         self.feeds_list = feeds_list
         self.number_pixels_image = number_pixels_image
-        self._existing_image_offers = set()
+        self.download_workers = download_workers
+        self.frame_workers = frame_workers
+        self.frame_executor = frame_executor
+        self.encoder = encoder or get_encoder_profile()
+        self.frame_queue_size = max(1, frame_queue_size)
+        self.passthrough = passthrough
+        self.frames = get_frame_cache(frame_folder)
+        self.store = ImageStore(image_folder)
+        self.builds = BuildManifest(new_image_folder)
+        self.snapshot = OfferSnapshot()
+        self._existing_image_offers: dict[str, str] = {}
+        self._fetched_offers: set[str] = set()
+        self._failed_offers: set[str] = set()
+        self._retry_offers: dict[str, frozenset[str]] = {}
+        self._stage_failed = False
 
     def _get_image_data(self, url: str) -> tuple:
         """
         Защищенный метод, загружает данные изображения
         и возвращает (image_data, image_format).
+        Формат читается из заголовка, изображение не декодируется.
         """
         try:
-            response = requests.get(url)
+            response = get_governor().get(
+                url,
+                timeout=IMAGE_REQUEST_TIMEOUT
+            )
             response.raise_for_status()
             image = Image.open(BytesIO(response.content))
             image_format = image.format.lower() if image.format else None
             return response.content, image_format
+        except CircuitOpenError as error:
+            logging.debug('Изображение %s не загружено: %s', url, error)
+            return None, None
         except Exception as error:
             logging.error('Ошибка при загрузке изображения %s: %s', url, error)
             return None, None
@@ -70,17 +137,24 @@ class FeedImage(FileMixin):
             return ''
         return f'{offer_id}.{image_format}'
 
-    def _build_offers_set(self, folder: str, target_set: set) -> None:
-        """Защищенный метод, строит множество всех существующих офферов."""
+    def _build_offers_set(self, folder: str, target: dict) -> None:
+        """
+        Защищенный метод, собирает скачанные изображения
+        всех существующих офферов: offer_id -> имя файла.
+        """
         try:
+            if ASSET_INDEX:
+                target.update(self._get_source_images(folder))
+                logging.info('Построен кэш для %s файлов', len(target))
+                return
             for file_name in self._get_filenames_set(folder):
                 offer_image = file_name.split('.')[0]
                 if offer_image:
-                    target_set.add(offer_image)
+                    target[offer_image] = file_name
 
             logging.info(
                 'Построен кэш для %s файлов',
-                len(target_set)
+                len(target)
             )
         except EmptyFeedsListError:
             raise
@@ -99,31 +173,15 @@ class FeedImage(FileMixin):
         Защищенный метод, возвращает словарь category_id -> parent_id
         для всех категорий, которые должны иметь рамку.
         """
-        categories_dict = {}
         try:
-            all_categories = {}
-            for filename in filenames:
-                if filename in FILENAMES_ALL:  # КОСТЫЛЬ!
-                    continue
-                tree = self._get_tree(filename, self.feeds_folder)
-                root = tree.getroot()
-                for category in root.findall('.//category'):
-                    cat_id = category.get('id')
-                    parent_id = category.get('parentId')
-                    all_categories[cat_id] = parent_id
-
-            def has_frame_parent(cat_id):
-                current_id = cat_id
-                while current_id:
-                    if current_id in CURRENT_ID:
-                        return current_id
-                    current_id = all_categories.get(current_id)
-                return None
-
-            for cat_id in all_categories:
-                frame_parent = has_frame_parent(cat_id)
-                if frame_parent:
-                    categories_dict[cat_id] = frame_parent
+            indexes = [
+                self._get_offer_index(filename, self.feeds_folder)
+                for filename in filenames
+                if filename not in FILENAMES_ALL  # КОСТЫЛЬ!
+            ]
+            categories_dict = get_category_index(indexes).frame_roots(
+                CURRENT_ID
+            )
 
             logging.info(
                 'Собрано %s категорий для обрамления',
@@ -135,33 +193,188 @@ class FeedImage(FileMixin):
             logging.error('Ошибка в _get_category_dict: %s', error)
             raise
 
+    @staticmethod
+    def _is_intact(image_data: bytes) -> bool:
+        """
+        Защищенный метод, проверяет изображение без декодирования:
+        формат можно сохранить как есть, структура файла
+        не повреждена, а JPEG не обрезан.
+        """
+        try:
+            with Image.open(BytesIO(image_data)) as img:
+                image_format = img.format
+                if image_format not in IMAGE_PASSTHROUGH_FORMATS:
+                    return False
+                img.verify()
+        except Exception:
+            return False
+        if image_format == 'JPEG':
+            return image_data.rstrip(b'\0\r\n').endswith(b'\xff\xd9')
+        return True
+
     def _save_image(
         self,
         image_data: bytes,
         folder_path: Path,
         image_filename: str
-    ) -> None:
-        """Защищенный метод, сохраняет изображение по указанному пути."""
+    ) -> bool:
+        """
+        Защищенный метод, сохраняет изображение по указанному пути.
+        Целое изображение подходящего формата записывается как есть,
+        остальные декодируются и перекодируются.
+        """
+        file_path = folder_path / image_filename
         try:
+            if self.passthrough and self._is_intact(image_data):
+                file_path.write_bytes(image_data)
+                return True
             with Image.open(BytesIO(image_data)) as img:
-                file_path = folder_path / image_filename
                 img.load()
                 img.save(file_path)
+            return True
         except Exception as error:
             logging.error(
                 'Ошибка при сохранении %s: %s',
                 image_filename,
                 error
             )
+            return False
 
-    @time_of_function
-    def get_images(self) -> None:
-        """Метод получения и сохранения изображений из xml-файла."""
-        total_offers_processed = 0
-        offers_with_images = 0
+    def _download_image(
+        self,
+        url: str,
+        offer_ids: list[str],
+        folder_path: Path
+    ) -> bool:
+        """
+        Защищенный метод, скачивает изображение по адресу и связывает
+        его со всеми офферами, которые на него ссылаются.
+        Возвращает True, если изображение сохранено.
+        """
+        image_data, image_format = self._get_image_data(url)
+        if not image_data or not image_format:
+            self._failed_offers.update(offer_ids)
+            return False
+        digest = hashlib.sha256(image_data).hexdigest()
+        blob_path = self.store.blob_path(digest, image_format)
+        if not self.store.write_blob(
+            blob_path,
+            lambda path: self._save_image(image_data, path.parent, path.name)
+        ):
+            self._failed_offers.update(offer_ids)
+            return False
+        for offer_id in offer_ids:
+            image_filename = self._get_image_filename(
+                offer_id,
+                image_data,
+                image_format
+            )
+            self.store.link(offer_id, url, digest, blob_path, image_filename)
+            self._existing_image_offers[offer_id] = image_filename
+            self._fetched_offers.add(offer_id)
+        return True
+
+    def _download_images(
+        self,
+        offer_images: dict[str, str],
+        folder_path: Path
+    ) -> int:
+        """
+        Защищенный метод, параллельно скачивает изображения офферов
+        через общий пул соединений и возвращает количество
+        сохраненных изображений. Каждый адрес скачивается один раз.
+        """
         images_downloaded = 0
-        offers_skipped_existing = 0
+        if not offer_images:
+            return images_downloaded
+        url_offers: dict[str, list[str]] = {}
+        for offer_id, url in offer_images.items():
+            url_offers.setdefault(url, []).append(offer_id)
+        with ThreadPoolExecutor(
+            max_workers=self.download_workers
+        ) as executor:
+            futures = [
+                executor.submit(
+                    self._download_image,
+                    url,
+                    offer_ids,
+                    folder_path
+                )
+                for url, offer_ids in url_offers.items()
+            ]
+            for future in as_completed(futures):
+                if future.result():
+                    images_downloaded += 1
+        return images_downloaded
+
+    def _frame_inputs(
+        self,
+        offer_id: str,
+        image_name: str,
+        frame_name: str
+    ) -> dict[str, str]:
+        """
+        Защищенный метод, возвращает хэши входов обрамленного
+        изображения: исходника, рамки и параметров компоновки.
+        """
+        return {
+            'source': self.store.source_hash(offer_id, image_name),
+            'frame': self.frames.digest(frame_name),
+            'layout': layout_signature(self.encoder),
+        }
 
+    def _record_frame(
+        self,
+        job: FrameJob,
+        build: tuple[str, dict, str | None]
+    ) -> None:
+        """Защищенный метод, записывает собранный выход в манифест."""
+        key, inputs, previous_file = build
+        self.builds.record(key, inputs, job.output_path.name, previous_file)
+
+    def _run_frame_jobs(
+        self,
+        jobs: list[FrameJob],
+        builds: list[tuple[str, dict, str | None]]
+    ) -> tuple[int, int]:
+        """
+        Защищенный метод, параллельно обрамляет изображения,
+        записывает собранные выходы в манифест и возвращает
+        количество успешно и неудачно обрамленных.
+        builds - ключ выхода, хэши входов и прежний файл для каждой задачи.
+        """
+        results = run_frame_jobs(
+            jobs,
+            self.frame_folder,
+            self.frame_workers,
+            self.frame_executor,
+            self.encoder
+        )
+        for job, (key, inputs, previous_file), result in zip(
+            jobs,
+            builds,
+            results
+        ):
+            if result:
+                self._record_frame(job, (key, inputs, previous_file))
+            else:
+                self._failed_offers.add(job.offer_id)
+        self.builds.save()
+        self.store.save()
+        framed = sum(results)
+        return framed, len(results) - framed
+
+    def _collect_offer_images(
+        self,
+        only_files: set[str] | None,
+        counters: dict[str, int]
+    ) -> dict[str, str]:
+        """
+        Защищенный метод, возвращает адреса изображений офферов,
+        которые нужно скачать: offer_id -> url.
+        """
+        offer_images: dict[str, str] = {}
+        seen_offers: set[str] = set()
         try:
             self._build_offers_set(
                 self.image_folder,
@@ -171,294 +384,882 @@ class FeedImage(FileMixin):
             logging.warning(
                 'Директория с изображениями отсутствует. Первый запуск'
             )
-        try:
-            filenames = self._get_filenames_set(self.feeds_folder)
-            for filename in filenames:
-                if filename in FILENAMES_ALL:  # КОСТЫЛЬ!
+        filenames = self._get_filenames_set(self.feeds_folder)
+        counters['feeds'] = len(filenames)
+        # Оффер может встречаться в нескольких фидах с разными
+        # картинками: берется первая по порядку имен фидов,
+        # чтобы манифест не менял адрес от запуска к запуску.
+        # Поэтому невыбранные фиды тоже просматриваются.
+        for filename in sorted(filenames):
+            if filename in FILENAMES_ALL:  # КОСТЫЛЬ!
+                continue
+            index = self._get_offer_index(filename, self.feeds_folder)
+            if only_files is not None and filename not in only_files:
+                seen_offers.update(
+                    offer.offer_id for offer in index.offers
+                    if offer.picture
+                )
+                continue
+            for offer in index.offers:
+                offer_id = offer.offer_id
+                counters['processed'] += 1
+
+                offer_image = offer.picture
+                if not offer_image:
                     continue
-                tree = self._get_tree(filename, self.feeds_folder)
-                root = tree.getroot()
-                offers = root.findall('.//offer')
-                for offer in offers:
-                    offer_id = str(offer.get('id'))
-                    total_offers_processed += 1
-
-                    picture = offer.find('picture')
-                    if picture is None:
-                        continue
 
-                    offer_image = picture.text
-                    if not offer_image:
-                        continue
+                counters['with_images'] += 1
 
-                    offers_with_images += 1
+                if offer_id in seen_offers:
+                    counters['skipped_existing'] += 1
+                    continue
+                seen_offers.add(offer_id)
 
-                    if offer_id in self._existing_image_offers:
-                        offers_skipped_existing += 1
-                        continue
+                if not self.store.needs_fetch(
+                    offer_id,
+                    offer_image,
+                    self._existing_image_offers.get(offer_id)
+                ):
+                    counters['skipped_existing'] += 1
+                    continue
 
-                    image_data, image_format = self._get_image_data(
-                        offer_image
-                    )
-                    image_filename = self._get_image_filename(
-                        str(offer_id),
-                        image_data,
-                        image_format
-                    )
-                    folder_path = self._make_dir(self.image_folder)
-                    self._save_image(
-                        image_data,
-                        folder_path,
-                        image_filename
-                    )
-                    images_downloaded += 1
-            logger.bot_event(
-                'Всего обработано %s офферов в %s фидах',
-                total_offers_processed,
-                len(filenames)
-            )
-            logger.bot_event(
-                'Всего офферов с подходящими изображениями - %s',
-                offers_with_images
+                offer_images[offer_id] = offer_image
+        return offer_images
+
+    def _report_images(self, counters: dict[str, int]) -> None:
+        """Защищенный метод, выводит итоги получения изображений."""
+        messages = (
+            ('Всего обработано %s офферов в %s фидах',
+             counters['processed'], counters['feeds']),
+            ('Всего офферов с подходящими изображениями - %s',
+             counters['with_images']),
+            ('Всего изображений скачано %s', counters['downloaded']),
+            ('Пропущено офферов с уже скачанными изображениями - %s',
+             counters['skipped_existing']),
+        )
+        for message, *args in messages:
+            logger.bot_event(message, *args, stacklevel=2)
+        metrics.count('offers_processed', counters['processed'])
+        metrics.count('offers_with_images', counters['with_images'])
+        metrics.count('images_downloaded', counters['downloaded'])
+        metrics.count('offers_skipped_existing', counters['skipped_existing'])
+        metrics.count_failures(counters['failed'])
+
+    @staticmethod
+    def _image_counters() -> dict[str, int]:
+        """Защищенный метод, возвращает счетчики получения изображений."""
+        return dict.fromkeys(
+            ('feeds', 'processed', 'with_images', 'skipped_existing',
+             'downloaded', 'failed'),
+            0
+        )
+
+    @time_of_function
+    def get_images(self, only_files: set[str] | None = None) -> None:
+        """
+        Метод получения и сохранения изображений из xml-файла.
+        only_files ограничивает обработку указанными фидами.
+        """
+        counters = self._image_counters()
+        try:
+            offer_images = self._collect_offer_images(only_files, counters)
+            folder_path = self._make_dir(self.image_folder)
+            counters['downloaded'] = self._download_images(
+                offer_images,
+                folder_path
             )
-            logger.bot_event('Всего изображений скачано %s', images_downloaded)
-            logger.bot_event(
-                'Пропущено офферов с уже скачанными изображениями - %s',
-                offers_skipped_existing
+            counters['failed'] = (
+                len(set(offer_images.values())) - counters['downloaded']
             )
+            self.store.save()
+            self._report_images(counters)
         except Exception as error:
+            self._stage_failed = True
             logging.error(
                 'Неожиданная ошибка при получении изображений: %s',
                 error
             )
 
-    @time_of_function
-    def add_frame(self) -> None:
-        """Метод форматирует изображения и добавляет рамку."""
-        total_framed_images = 0
-        total_failed_images = 0
-        skipped_images = 0
-        skipped_unsuitable_offers = 0
-        file_path = self._make_dir(self.image_folder)
-        frame_path = self._make_dir(self.frame_folder)
-        new_file_path = self._make_dir(self.new_image_folder)
-        images_names_list = self._get_filenames_set(self.image_folder)
+    def _preload_frames(self) -> None:
+        """Защищенный метод, загружает рамки фидов в кэш."""
+        self.frames.preload(
+            name
+            for frame_name_dict in FRAME_NAME_DICTS
+            for name in frame_name_dict.values()
+        )
 
-        image_framed_dict = self._get_image_dict(self.new_image_folder)
-        if not image_framed_dict:
+    def _frame_env(self, categories: dict[str, str]) -> str | None:
+        """
+        Защищенный метод, возвращает подпись окружения обрамления:
+        файлов рамок, параметров компоновки и корней категорий.
+        None, если рамку не удалось прочитать.
+        """
+        try:
+            frames = sorted({
+                self.frames.digest(name)
+                for frame_name_dict in FRAME_NAME_DICTS
+                for name in frame_name_dict.values()
+            })
+        except OSError:
+            return None
+        signature = (
+            layout_signature(self.encoder),
+            frames,
+            sorted(categories.items())
+        )
+        return hashlib.sha256(repr(signature).encode()).hexdigest()
+
+    def _frame_env_all(self) -> str | None:
+        """
+        Защищенный метод, возвращает подпись окружения обрамления
+        фида для всех товаров: рамки all и параметров компоновки.
+        """
+        try:
+            frame = self.frames.digest(MSC_ALL_FRAME)
+        except OSError:
+            return None
+        signature = (layout_signature(self.encoder), frame)
+        return hashlib.sha256(repr(signature).encode()).hexdigest()
+
+    def _frame_envs(self, filenames: set[str]) -> dict[str, str | None]:
+        """
+        Защищенный метод, возвращает подписи окружения
+        обрамления фидов: имя фида -> подпись. Рамки, файлы
+        которых изменились, перечитываются.
+        """
+        self.frames.refresh([
+            MSC_ALL_FRAME,
+            *(
+                name
+                for frame_name_dict in FRAME_NAME_DICTS
+                for name in frame_name_dict.values()
+            ),
+        ])
+        frame_env = self._frame_env(self._get_category_dict(filenames))
+        frame_env_all = self._frame_env_all()
+        return {
+            file_name: (
+                frame_env_all if file_name in FILENAMES_ALL else frame_env
+            )
+            for file_name in filenames
+        }
+
+    def pending_files(
+        self,
+        changed_files: set[str]
+    ) -> tuple[set[str], set[str]]:
+        """
+        Метод возвращает неизмененные фиды, которые все равно нужно
+        обработать: (stale, retry). stale - фиды, обработанные
+        в другом окружении обрамления (сменились рамки, компоновка,
+        кодирование или корни категорий) или без снимка. retry - фиды
+        с офферами, которые прошлый запуск не обработал: их нет
+        в снимке, и они снова скачиваются и обрамляются по манифестам.
+        """
+        stale: set[str] = set()
+        self._retry_offers = {}
+        try:
+            filenames = self._get_filenames_set(self.feeds_folder)
+            frame_envs = self._frame_envs(filenames)
+            for file_name in sorted(filenames - changed_files):
+                frame_env = frame_envs[file_name]
+                diff = self.snapshot.diff(
+                    self._get_offer_index(file_name, self.feeds_folder)
+                )
+                if diff is None or frame_env is not None \
+                        and self.snapshot.frame_env(file_name) != frame_env:
+                    stale.add(file_name)
+                    continue
+                offers = (
+                    diff.added | diff.picture_changed | diff.category_changed
+                )
+                if offers:
+                    self._retry_offers[file_name] = offers
+        except (
+            DirectoryCreationError,
+            EmptyFeedsListError,
+            GetTreeError
+        ) as error:
+            logging.warning('Не удалось проверить фиды: %s', error)
+            return stale, set()
+        if stale:
             logging.info(
-                'Обрамленные изображениями отсутствуют. Первый запуск'
+                'Сменилось окружение обрамления фидов: %s',
+                ', '.join(sorted(stale))
+            )
+        if self._retry_offers:
+            logging.info(
+                'Повтор необработанных офферов фидов: %s',
+                ', '.join(sorted(self._retry_offers))
             )
+        return stale, set(self._retry_offers)
+
+    def recovered_files(self) -> set[str]:
+        """
+        Метод возвращает фиды из retry, в которых хотя бы один
+        из необработанных прошлым запуском офферов обработан сейчас:
+        только их нужно перезаписать.
+        """
+        return {
+            file_name
+            for file_name, offers in self._retry_offers.items()
+            if offers - self._failed_offers
+        }
+
+    def _offer_diffs(
+        self,
+        only_files: set[str] | None
+    ) -> dict[str, OfferDiff | None]:
+        """
+        Защищенный метод, возвращает изменения офферов обычных фидов
+        с прошлого успешного запуска: имя фида -> изменения или None,
+        если фида нет в снимке.
+        """
+        diffs = {}
+        for file_name in sorted(self._get_filenames_set(self.feeds_folder)):
+            if file_name in FILENAMES_ALL:  # КОСТЫЛЬ!
+                continue
+            if only_files is not None and file_name not in only_files:
+                continue
+            diffs[file_name] = self.snapshot.diff(
+                self._get_offer_index(file_name, self.feeds_folder)
+            )
+        return diffs
+
+    def failed_files(self) -> set[str]:
+        """
+        Метод возвращает фиды, обработка которых прервалась:
+        все фиды, если этап изображений завершился ошибкой.
+        Отдельные офферы с ошибками повторяются через снимок,
+        см. pending_files.
+        """
+        if not self._stage_failed:
+            return set()
+        try:
+            return self._get_filenames_set(self.feeds_folder)
+        except (DirectoryCreationError, EmptyFeedsListError):
+            return set()
+
+    def report_changes(self, only_files: set[str] | None = None) -> None:
+        """
+        Метод выводит изменения офферов фидов
+        с прошлого успешного запуска.
+        """
+        try:
+            diffs = self._offer_diffs(only_files)
+        except (DirectoryCreationError, EmptyFeedsListError, GetTreeError):
+            return
+        totals = dict.fromkeys(OfferDiff._fields, 0)
+        new_feeds = 0
+        for diff in diffs.values():
+            if diff is None:
+                new_feeds += 1
+                continue
+            for field, count in diff.counts().items():
+                totals[field] += count
+        logger.bot_event(
+            'Изменения офферов: добавлено %s, удалено %s, сменилась '
+            'картинка у %s, сменилась категория у %s, без изменений %s',
+            totals['added'],
+            totals['removed'],
+            totals['picture_changed'],
+            totals['category_changed'],
+            totals['unchanged']
+        )
+        if new_feeds:
+            logging.info('Фидов без снимка прошлого запуска - %s', new_feeds)
+        for field, count in totals.items():
+            metrics.count(f'offers_{field}', count)
+
+    def save_snapshot(self, only_files: set[str] | None = None) -> None:
+        """
+        Метод записывает офферы обработанных фидов в снимок.
+        Вызывается после успешного запуска всех этапов. Офферы,
+        которые не удалось скачать или обрамить, в снимок
+        не попадают и повторяются следующим запуском.
+        """
+        try:
+            filenames = self._get_filenames_set(self.feeds_folder)
+            frame_envs = self._frame_envs(filenames)
+            for file_name in sorted(filenames):
+                if only_files is not None and file_name not in only_files:
+                    continue
+                self.snapshot.update(
+                    self._get_offer_index(file_name, self.feeds_folder),
+                    frame_envs[file_name],
+                    self._failed_offers
+                )
+        except (
+            DirectoryCreationError,
+            EmptyFeedsListError,
+            GetTreeError
+        ) as error:
+            logging.warning('Снимок офферов не обновлен: %s', error)
+            return
+        self.snapshot.save()
+
+    def _get_source_images(
+        self,
+        image_folder: str | None = None
+    ) -> dict[str, str]:
+        """
+        Защищенный метод, возвращает скачанные исходные изображения:
+        offer_id -> имя файла.
+        """
+        image_folder = image_folder or self.image_folder
+        if ASSET_INDEX:
+            folder_path = Path(__file__).parent.parent / image_folder
+            if not folder_path.exists():
+                raise DirectoryCreationError(
+                    'Папка %s не найдена',
+                    image_folder
+                )
+            images_dict = get_asset_index().source_images(folder_path)
+            if not images_dict:
+                raise EmptyFeedsListError('Нет скачанных файлов')
+            return images_dict
         images_dict = {}
-        for image_name in images_names_list:
+        for image_name in self._get_filenames_set(image_folder):
             offer_id = image_name.split('.')[0]
             images_dict[offer_id] = image_name
+        return images_dict
 
-        try:
-            filenames = self._get_filenames_set(self.feeds_folder)
-            categories = self._get_category_dict(filenames)
+    def _plan_frames(
+        self,
+        only_files: set[str] | None,
+        counters: dict[str, int],
+        discard: bool = True
+    ) -> list[FrameTarget]:
+        """
+        Защищенный метод, возвращает обрамленные изображения,
+        которые должны существовать для офферов фидов.
+        Обрамления офферов с неподходящей категорией удаляются,
+        без discard они только подсчитываются.
+        """
+        image_framed_dict = self._get_image_dict(self.new_image_folder)
+        if not image_framed_dict:
+            logging.info(
+                'Обрамленные изображениями отсутствуют. Первый запуск'
+            )
+        targets: list[FrameTarget] = []
+        filenames = self._get_filenames_set(self.feeds_folder)
+        categories = self._get_category_dict(filenames)
+        frame_env = self._frame_env(categories)
 
-            for file_name in filenames:
-                if file_name in FILENAMES_ALL:  # КОСТЫЛЬ!
-                    continue
-                frame_name_dict = MSC_FRAMES_NET
-                file_city = file_name.split('_')[-2]
+        for file_name in filenames:
+            if file_name in FILENAMES_ALL:  # КОСТЫЛЬ!
+                continue
+            if only_files is not None and file_name not in only_files:
+                continue
+            frame_name_dict = MSC_FRAMES_NET
+            file_city = file_name.split('_')[-2]
+            if file_city == '2':
+                frame_name_dict = TVR_FRAMES_NET
+            postfix = 'net'
+
+            if 'search' in file_name.split('_')[-1]:
+                frame_name_dict = MSC_FRAMES_SRCH
                 if file_city == '2':
-                    frame_name_dict = TVR_FRAMES_NET
-                postfix = 'net'
-
-                if 'search' in file_name.split('_')[-1]:
-                    frame_name_dict = MSC_FRAMES_SRCH
-                    if file_city == '2':
-                        frame_name_dict = TVR_FRAMES_SRCH
-                    postfix = 'srch'
-
-                tree = self._get_tree(file_name, self.feeds_folder)
-                root = tree.getroot()
-                offers = root.findall('.//offer')
-
-                for offer in offers:
-                    offer_id = str(offer.get('id'))
-                    category_elem = offer.find('categoryId')
-                    offer_key = f'{offer_id}_{file_city}_{postfix}'
-
-                    if offer_key in image_framed_dict:
-                        skipped_images += 1
-                        continue
+                    frame_name_dict = TVR_FRAMES_SRCH
+                postfix = 'srch'
 
-                    if category_elem is None or \
-                            category_elem.text not in categories:
-                        skipped_unsuitable_offers += 1
-                        continue
+            index = self._get_offer_index(file_name, self.feeds_folder)
+            # Офферы без изменений, обработанные в том же окружении
+            # обрамления, не требуют проверки входов сборки.
+            unchanged = frozenset()
+            diff = self.snapshot.diff(index)
+            if diff is not None and frame_env is not None \
+                    and self.snapshot.frame_env(file_name) == frame_env:
+                unchanged = diff.unchanged
 
-                    category_id = category_elem.text
+            for offer in index.offers:
+                offer_id = offer.offer_id
+                category_id = offer.category_id
+                offer_key = f'{offer_id}_{file_city}_{postfix}'
+                framed_file = image_framed_dict.get(offer_key)
 
-                    if offer_id not in images_dict:
-                        skipped_unsuitable_offers += 1
+                if category_id not in categories:
+                    counters['unsuitable'] += 1
+                    if not framed_file:
                         continue
+                    if not discard or self.builds.discard(
+                        offer_key,
+                        framed_file
+                    ):
+                        counters['removed'] += 1
+                    continue
 
-                    try:
-                        parent_id = categories[category_id]
-                        image_name = images_dict[offer_id]
-                        name_of_frame = frame_name_dict[parent_id]
-
-                        with Image.open(file_path / image_name) as image:
-                            image.load()
-                            image_width, image_height = image.size
-
-                        with Image.open(frame_path / name_of_frame) as frame:
-                            frame_resized = frame.resize(DEFAULT_IMAGE_SIZE)
-
-                        final_image = Image.new(
-                            'RGB',
-                            DEFAULT_IMAGE_SIZE,
-                            RGB_COLOR_SETTINGS
-                        )
-
-                        canvas_width, canvas_height = DEFAULT_IMAGE_SIZE
-                        x_position = (canvas_width - image_width) // 2
-                        y_position = (
-                            canvas_height - image_height
-                        ) // 2
-
-                        if image_width > canvas_width \
-                                or image_height > canvas_height:
-                            new_width = int(image_width * 50 / 100)
-                            new_height = int(image_height * 50 / 100)
-                            image = image.resize((new_width, new_height))
-                            x_position = (canvas_width - new_width) // 2
-                            y_position = (
-                                canvas_height - new_height
-                            ) // 2
-
-                        final_image.paste(image, (x_position, y_position))
-                        final_image.paste(frame_resized, (0, 0), frame_resized)
-                        promo_name = name_of_frame.split('.')[0]
-                        filename = (
-                            f'{offer_id}_{promo_name}_'
-                            f'{file_city}_{postfix}.png'
-                        )
-                        final_image.save(new_file_path / filename, 'PNG')
-                        total_framed_images += 1
-
-                    except Exception as error:
-                        total_failed_images += 1
-                        logging.error(
-                            'Ошибка при обрамлении %s: %s',
-                            offer_id,
-                            error
-                        )
-            logger.bot_event(
-                'Пропущенных офферов с неподходящей категорией - %s',
-                skipped_unsuitable_offers
-            )
-            logger.bot_event(
-                'Количество уже обрамленных изображений - %s',
-                skipped_images
+                targets.append(FrameTarget(
+                    offer_id,
+                    offer_key,
+                    f'{file_city}_{postfix}',
+                    framed_file,
+                    categories[category_id],
+                    frame_name_dict,
+                    offer_id in unchanged
+                ))
+        return targets
+
+    def _resolve_frame(
+        self,
+        target: FrameTarget,
+        images_dict: dict[str, str],
+        counters: dict[str, int],
+        folder_path: Path,
+        new_folder_path: Path
+    ) -> tuple[FrameJob, tuple[str, dict, str | None]] | None:
+        """
+        Защищенный метод, возвращает задачу на обрамление и запись
+        для манифеста сборки или None, если обрамлять не нужно.
+        """
+        offer_id = target.offer_id
+        if offer_id not in images_dict:
+            if target.framed_file:
+                counters['skipped'] += 1
+            else:
+                counters['unsuitable'] += 1
+            return None
+
+        if target.unchanged and target.framed_file \
+                and offer_id not in self._fetched_offers:
+            counters['skipped'] += 1
+            return None
+
+        try:
+            name_of_frame = target.frame_names[target.parent_id]
+            inputs = self._frame_inputs(
+                offer_id,
+                images_dict[offer_id],
+                name_of_frame
             )
-            logger.bot_event('Успешно обрамлено - %s', total_framed_images)
-            logger.bot_event('Неудачно обрамлено - %s', total_failed_images)
+        except (KeyError, OSError) as error:
+            counters['failed'] += 1
+            self._failed_offers.add(offer_id)
+            logging.error('Ошибка при обрамлении %s: %s', offer_id, error)
+            return None
+
+        if self.builds.is_fresh(target.offer_key, inputs, target.framed_file):
+            counters['skipped'] += 1
+            return None
+
+        promo_name = name_of_frame.split('.')[0]
+        filename = (
+            f'{offer_id}_{promo_name}_{target.suffix}'
+            f'.{self.encoder.extension}'
+        )
+        job = FrameJob(
+            offer_id,
+            folder_path / images_dict[offer_id],
+            name_of_frame,
+            new_folder_path / filename
+        )
+        return job, (target.offer_key, inputs, target.framed_file)
+
+    def _report_frames(self, counters: dict[str, int]) -> None:
+        """Защищенный метод, выводит итоги обрамления."""
+        messages = (
+            ('Пропущенных офферов с неподходящей категорией - %s',
+             counters['unsuitable']),
+            ('Удалено устаревших обрамленных изображений - %s',
+             counters['removed']),
+            ('Количество уже обрамленных изображений - %s',
+             counters['skipped']),
+            ('Успешно обрамлено - %s', counters['framed']),
+            ('Неудачно обрамлено - %s', counters['failed']),
+        )
+        for message, *args in messages:
+            logger.bot_event(message, *args, stacklevel=2)
+        metrics.count('images_framed', counters['framed'])
+        metrics.count('images_skipped', counters['skipped'])
+        metrics.count('offers_unsuitable', counters['unsuitable'])
+        metrics.count('images_removed', counters['removed'])
+        metrics.count_failures(counters['failed'])
+
+    @staticmethod
+    def _frame_counters() -> dict[str, int]:
+        """Защищенный метод, возвращает счетчики обрамления."""
+        return dict.fromkeys(
+            ('framed', 'failed', 'skipped', 'unsuitable', 'removed'),
+            0
+        )
+
+    @time_of_function
+    def add_frame(self, only_files: set[str] | None = None) -> None:
+        """
+        Метод форматирует изображения и добавляет рамку.
+        only_files ограничивает обработку указанными фидами.
+        """
+        counters = self._frame_counters()
+        self._preload_frames()
+        folder_path = self._make_dir(self.image_folder)
+        new_folder_path = self._make_dir(self.new_image_folder)
+        images_dict = self._get_source_images()
+        jobs: list[FrameJob] = []
+        builds: list[tuple[str, dict, str | None]] = []
+
+        try:
+            for target in self._plan_frames(only_files, counters):
+                resolved = self._resolve_frame(
+                    target,
+                    images_dict,
+                    counters,
+                    folder_path,
+                    new_folder_path
+                )
+                if resolved is not None:
+                    jobs.append(resolved[0])
+                    builds.append(resolved[1])
+
+            framed, failed = self._run_frame_jobs(jobs, builds)
+            counters['framed'] += framed
+            counters['failed'] += failed
+            self._report_frames(counters)
         except Exception as error:
             logging.error('Неожиданная ошибка наложения рамки: %s', error)
             raise
 
-# ---------------------------------------- костыль для нового фида msk
     @time_of_function
-    def add_frame_all(self) -> None:
-        """Метод форматирует изображения и добавляет рамку."""
-        total_framed_images = 0
-        total_failed_images = 0
-        skipped_images = 0
-        file_path = self._make_dir(self.image_folder)
-        frame_path = self._make_dir(self.frame_folder)
-        new_file_path = self._make_dir(self.new_image_folder)
-        images_names_list = self._get_filenames_set(self.image_folder)
+    def get_images_and_frame(
+        self,
+        only_files: set[str] | None = None
+    ) -> None:
+        """
+        Метод совмещает get_images и add_frame: скачанные изображения
+        через ограниченную очередь сразу уходят на обрамление,
+        пока остальные еще скачиваются. Результаты и счетчики
+        совпадают с последовательным запуском обоих этапов.
+        """
+        image_counters = self._image_counters()
+        frame_counters = self._frame_counters()
+        try:
+            offer_images = self._collect_offer_images(
+                only_files,
+                image_counters
+            )
+        except Exception as error:
+            self._stage_failed = True
+            logging.error(
+                'Неожиданная ошибка при получении изображений: %s',
+                error
+            )
+            offer_images = {}
+        folder_path = self._make_dir(self.image_folder)
+        try:
+            images_dict = self._get_source_images()
+        except EmptyFeedsListError:
+            images_dict = {}
+        self._preload_frames()
+
+        url_offers: dict[str, list[str]] = {}
+        for offer_id, url in offer_images.items():
+            url_offers.setdefault(url, []).append(offer_id)
+        ready: queue.Queue = queue.Queue(maxsize=self.frame_queue_size)
+        in_flight = threading.BoundedSemaphore(self.frame_queue_size)
+        frame_tasks = []
+        waiting: dict[str, list[FrameTarget]] = {}
+        new_folder_path = self._make_dir(self.new_image_folder)
+        worker = partial(
+            frame_offer,
+            frame_folder=self.frame_folder,
+            encoder=self.encoder
+        )
+
+        def download(url: str, offer_ids: list[str]) -> None:
+            saved = False
+            try:
+                saved = self._download_image(url, offer_ids, folder_path)
+            except Exception as error:
+                self._failed_offers.update(offer_ids)
+                logging.error(
+                    'Ошибка при загрузке изображения %s: %s',
+                    url,
+                    error
+                )
+            finally:
+                ready.put((offer_ids, saved))
 
+        try:
+            with frame_pool(
+                self.frame_workers,
+                self.frame_executor
+            ) as frames, ThreadPoolExecutor(
+                max_workers=self.download_workers
+            ) as downloads:
+
+                def submit(target: FrameTarget) -> None:
+                    resolved = self._resolve_frame(
+                        target,
+                        images_dict,
+                        frame_counters,
+                        folder_path,
+                        new_folder_path
+                    )
+                    if resolved is None:
+                        return
+                    in_flight.acquire()
+                    future = frames.submit(worker, resolved[0])
+                    future.add_done_callback(lambda _: in_flight.release())
+                    frame_tasks.append((future, *resolved))
+
+                def take_ready(block: bool) -> bool:
+                    try:
+                        offer_ids, saved = ready.get(block=block)
+                    except queue.Empty:
+                        return False
+                    image_counters['downloaded'] += saved
+                    for offer_id in offer_ids:
+                        if saved:
+                            images_dict[offer_id] = self.store.manifest[
+                                offer_id
+                            ]['file']
+                        for target in waiting.pop(offer_id, ()):
+                            submit(target)
+                    return True
+
+                for url, offer_ids in url_offers.items():
+                    downloads.submit(download, url, offer_ids)
+
+                # Оффер встречается в нескольких фидах: все его цели
+                # должны ждать загрузки до того, как она будет принята.
+                targets = self._plan_frames(only_files, frame_counters)
+                for target in targets:
+                    if target.offer_id in offer_images:
+                        waiting.setdefault(target.offer_id, []).append(target)
+                taken = 0
+                for target in targets:
+                    if target.offer_id in offer_images:
+                        continue
+                    submit(target)
+                    taken += take_ready(block=False)
+                while taken < len(url_offers):
+                    taken += take_ready(block=True)
+
+            for future, job, build in frame_tasks:
+                if future.result():
+                    self._record_frame(job, build)
+                    frame_counters['framed'] += 1
+                else:
+                    frame_counters['failed'] += 1
+                    self._failed_offers.add(job.offer_id)
+        except Exception as error:
+            logging.error('Неожиданная ошибка наложения рамки: %s', error)
+            raise
+        finally:
+            self.builds.save()
+            self.store.save()
+        image_counters['failed'] = (
+            len(url_offers) - image_counters['downloaded']
+        )
+        self._report_images(image_counters)
+        self._report_frames(frame_counters)
+
+    def _estimate_frames(
+        self,
+        only_files: set[str] | None,
+        pending: dict[str, str]
+    ) -> dict[str, int]:
+        """
+        Защищенный метод, оценивает обрамление без записи файлов.
+        pending - офферы, изображения которых еще будут скачаны.
+        """
+        counters = self._frame_counters()
+        try:
+            images_dict = self._get_source_images()
+        except (DirectoryCreationError, EmptyFeedsListError):
+            images_dict = {}
+        folder_path = Path(__file__).parent.parent / self.image_folder
+        new_folder_path = Path(__file__).parent.parent / self.new_image_folder
+        framings = 0
+        for target in self._plan_frames(only_files, counters, discard=False):
+            if target.offer_id in pending or self._resolve_frame(
+                target,
+                images_dict,
+                counters,
+                folder_path,
+                new_folder_path
+            ):
+                framings += 1
+        return {'framings': framings, 'removals': counters['removed']}
+
+    def _estimate_frames_all(self, pending: dict[str, str]) -> dict[str, int]:
+        """
+        Защищенный метод, оценивает обрамление all рамкой
+        без записи файлов.
+        """
+        try:
+            images_dict = self._get_source_images()
+        except (DirectoryCreationError, EmptyFeedsListError):
+            images_dict = {}
+        jobs, _ = self._plan_frames_all(
+            images_dict,
+            self._frame_counters(),
+            Path(__file__).parent.parent / self.image_folder,
+            Path(__file__).parent.parent / self.new_image_folder,
+            pending.keys()
+        )
+        offers = {
+            offer.offer_id
+            for file_name in FILENAMES_ALL
+            for offer in self._get_offer_index(
+                file_name,
+                self.feeds_folder
+            ).offers
+        }
+        return {'framings': len(jobs) + len(offers & pending.keys())}
+
+    def estimate_work(
+        self,
+        stages: set[str],
+        only_files: set[str] | None = None
+    ) -> dict[str, dict[str, int]]:
+        """
+        Метод оценивает, сколько изображений скачают и обрамят
+        этапы stages, ничего не скачивая и не записывая.
+        Оценка строится по текущим фидам и манифестам.
+        """
+        estimates = {}
+        pending: dict[str, str] = {}
+        try:
+            if 'get_images' in stages:
+                pending = self._collect_offer_images(
+                    only_files,
+                    self._image_counters()
+                )
+                estimates['get_images'] = {
+                    'downloads': len(set(pending.values())),
+                    'offers': len(pending),
+                }
+            if 'add_frame' in stages:
+                estimates['add_frame'] = self._estimate_frames(
+                    only_files,
+                    pending
+                )
+            if 'add_frame_all' in stages:
+                estimates['add_frame_all'] = self._estimate_frames_all(
+                    pending
+                )
+        except (
+            DirectoryCreationError,
+            EmptyFeedsListError,
+            GetTreeError
+        ) as error:
+            logging.warning('Нет данных для оценки: %s', error)
+        return estimates
+
+# ---------------------------------------- костыль для нового фида msk
+    def _plan_frames_all(
+        self,
+        images_dict: dict[str, str],
+        counters: dict[str, int],
+        folder_path: Path,
+        new_folder_path: Path,
+        pending: set[str] = frozenset()
+    ) -> tuple[list[FrameJob], list[tuple[str, dict, str | None]]]:
+        """
+        Защищенный метод, возвращает задачи на обрамление all рамкой
+        и записи для манифеста сборки. Офферы pending, изображения
+        которых еще не скачаны, пропускаются.
+        """
         image_framed_dict = self._get_image_dict_all(self.new_image_folder)
         if not image_framed_dict:
             logging.info(
                 'Обрамленные изображениями отсутствуют. Первый запуск'
             )
-        images_dict = {}
-        for image_name in images_names_list:
-            offer_id = image_name.split('.')[0]
-            images_dict[offer_id] = image_name
+        jobs: list[FrameJob] = []
+        builds: list[tuple[str, dict, str | None]] = []
+        for file_name in FILENAMES_ALL:
+            file_city = file_name.split('_')[-2]
 
-        try:
-            filenames = FILENAMES_ALL
-            for file_name in filenames:
-                file_city = file_name.split('_')[-2]
-
-                tree = self._get_tree(file_name, self.feeds_folder)
-                root = tree.getroot()
-                offers = root.findall('.//offer')
+            index = self._get_offer_index(file_name, self.feeds_folder)
 
-                for offer in offers:
-                    offer_id = str(offer.get('id'))
-                    offer_key = f'{offer_id}_{file_city}'
+            for offer in index.offers:
+                offer_id = offer.offer_id
+                offer_key = f'{offer_id}_{file_city}'
+                framed_file = image_framed_dict.get(offer_key)
 
-                    if offer_key in image_framed_dict:
-                        skipped_images += 1
+                if offer_id in pending:
+                    continue
+                if offer_id not in images_dict:
+                    if framed_file:
+                        counters['skipped'] += 1
                         continue
+                    counters['failed'] += 1
+                    self._failed_offers.add(offer_id)
+                    logging.error(
+                        'Ошибка при обрамлении %s: нет изображения',
+                        offer_id
+                    )
+                    continue
 
-                    try:
-                        image_name = images_dict[offer_id]
-
-                        with Image.open(file_path / image_name) as image:
-                            image.load()
-                            image_width, image_height = image.size
-
-                        with Image.open(frame_path / MSC_ALL_FRAME) as frame:
-                            frame_resized = frame.resize(DEFAULT_IMAGE_SIZE)
-
-                        final_image = Image.new(
-                            'RGB',
-                            DEFAULT_IMAGE_SIZE,
-                            RGB_COLOR_SETTINGS
-                        )
-
-                        canvas_width, canvas_height = DEFAULT_IMAGE_SIZE
-                        x_position = (canvas_width - image_width) // 2
-                        y_position = (
-                            canvas_height - image_height
-                        ) // 2
-
-                        if image_width > canvas_width \
-                                or image_height > canvas_height:
-                            new_width = int(image_width * 50 / 100)
-                            new_height = int(image_height * 50 / 100)
-                            image = image.resize((new_width, new_height))
-                            x_position = (canvas_width - new_width) // 2
-                            y_position = (
-                                canvas_height - new_height
-                            ) // 2
-
-                        final_image.paste(image, (x_position, y_position))
-                        final_image.paste(frame_resized, (0, 0), frame_resized)
-                        promo_name = MSC_ALL_FRAME.split('.')[0]
-                        filename = (
-                            f'{offer_id}_{promo_name}_'
-                            f'{file_city}_all.png'
-                        )
-                        final_image.save(new_file_path / filename, 'PNG')
-                        total_framed_images += 1
-
-                    except Exception as error:
-                        total_failed_images += 1
-                        logging.error(
-                            'Ошибка при обрамлении %s: %s',
-                            offer_id,
-                            error
-                        )
+                try:
+                    inputs = self._frame_inputs(
+                        offer_id,
+                        images_dict[offer_id],
+                        MSC_ALL_FRAME
+                    )
+                except OSError as error:
+                    counters['failed'] += 1
+                    self._failed_offers.add(offer_id)
+                    logging.error(
+                        'Ошибка при обрамлении %s: %s',
+                        offer_id,
+                        error
+                    )
+                    continue
+
+                if self.builds.is_fresh(
+                    f'{offer_key}_all',
+                    inputs,
+                    framed_file
+                ):
+                    counters['skipped'] += 1
+                    continue
+
+                promo_name = MSC_ALL_FRAME.split('.')[0]
+                filename = (
+                    f'{offer_id}_{promo_name}_{file_city}_all'
+                    f'.{self.encoder.extension}'
+                )
+                jobs.append(FrameJob(
+                    offer_id,
+                    folder_path / images_dict[offer_id],
+                    MSC_ALL_FRAME,
+                    new_folder_path / filename
+                ))
+                builds.append((f'{offer_key}_all', inputs, framed_file))
+        return jobs, builds
+
+    @time_of_function
+    def add_frame_all(self) -> None:
+        """Метод форматирует изображения и добавляет рамку."""
+        counters = self._frame_counters()
+        self.frames.preload((MSC_ALL_FRAME,))
+        file_path = self._make_dir(self.image_folder)
+        new_file_path = self._make_dir(self.new_image_folder)
+        images_dict = self._get_source_images()
+
+        try:
+            jobs, builds = self._plan_frames_all(
+                images_dict,
+                counters,
+                file_path,
+                new_file_path
+            )
+            framed, failed = self._run_frame_jobs(jobs, builds)
+            counters['framed'] += framed
+            counters['failed'] += failed
             logger.bot_event(
                 'Количество уже обрамленных изображений all рамкой - %s',
-                skipped_images
+                counters['skipped']
             )
-            logger.bot_event('Успешно обрамлено all - %s', total_framed_images)
+            logger.bot_event('Успешно обрамлено all - %s', counters['framed'])
             logger.bot_event(
                 'Неудачно обрамлено all - %s',
-                total_failed_images
+                counters['failed']
             )
+            metrics.count('images_framed', counters['framed'])
+            metrics.count('images_skipped', counters['skipped'])
+            metrics.count_failures(counters['failed'])
         except Exception as error:
             logging.error('Неожиданная ошибка наложения рамки: %s', error)
             raise
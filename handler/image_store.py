@@ -0,0 +1,191 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from handler.asset_index import get_asset_index
+from handler.constants import ASSET_INDEX
+from handler.logging_config import setup_logging
+from handler.state import load_state, save_state
+
+setup_logging()
+
+
+class ImageStore:
+    """
+    Хранилище исходных изображений офферов.
+
+    Манифест связывает оффер с адресом картинки и хэшем ее содержимого.
+    Байты хранятся один раз по хэшу в скрытой папке .store, а файл
+    {offer_id}.{format} в папке изображений - жесткая ссылка на них,
+    поэтому офферы с одинаковой картинкой делят место на диске.
+    """
+
+    STORE_DIR = '.store'
+    STATE_NAME = 'images'
+
+    def __init__(self, image_folder: str) -> None:
+        self.folder_path = Path(__file__).parent.parent / image_folder
+        self.store_path = self.folder_path / self.STORE_DIR
+        self.manifest: dict[str, dict] = load_state(self.STATE_NAME)
+        self.assets = get_asset_index() if ASSET_INDEX else None
+        self._lock = threading.Lock()
+
+    def needs_fetch(
+        self,
+        offer_id: str,
+        url: str,
+        image_filename: str | None
+    ) -> bool:
+        """
+        Проверяет, нужно ли скачивать изображение оффера:
+        файла image_filename нет или адрес картинки изменился.
+        Файлы, скачанные до появления манифеста, принимаются
+        в манифест как есть.
+        """
+        entry = self.manifest.get(offer_id)
+        if entry is None:
+            if image_filename:
+                with self._lock:
+                    self.manifest[offer_id] = {
+                        'url': url,
+                        'sha256': None,
+                        'file': image_filename,
+                    }
+            return not image_filename
+        return not image_filename or entry['url'] != url
+
+    def blob_path(self, digest: str, image_format: str) -> Path:
+        """Возвращает путь к содержимому по его хэшу."""
+        return self.store_path / digest[:2] / f'{digest}.{image_format}'
+
+    def write_blob(self, blob_path: Path, write) -> bool:
+        """
+        Сохраняет содержимое, если его еще нет в хранилище.
+        write(path) записывает файл и возвращает True при успехе,
+        готовый файл атомарно переносится на место.
+        """
+        if self.assets:
+            self.assets.track(self.folder_path)
+        if blob_path.exists():
+            return True
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = blob_path.with_name(
+            f'.{threading.get_ident()}_{blob_path.name}'
+        )
+        try:
+            if not write(temp_path):
+                return False
+            os.replace(temp_path, blob_path)
+            return True
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    def link(
+        self,
+        offer_id: str,
+        url: str,
+        digest: str,
+        blob_path: Path,
+        image_filename: str
+    ) -> None:
+        """
+        Делает файл оффера ссылкой на сохраненное содержимое
+        и записывает оффер в манифест. Прежние файлы оффера
+        в других форматах удаляются.
+        """
+        target_path = self.folder_path / image_filename
+        temp_path = target_path.with_name(f'.{image_filename}.part')
+        try:
+            os.link(blob_path, temp_path)
+        except OSError:
+            shutil.copyfile(blob_path, temp_path)
+        os.replace(temp_path, target_path)
+        if self.assets:
+            self.assets.add(self.folder_path, image_filename)
+        with self._lock:
+            previous = self.manifest.get(offer_id)
+            self.manifest[offer_id] = {
+                'url': url,
+                'sha256': digest,
+                'file': image_filename,
+            }
+        if previous is None:
+            return
+        stale_files = set(self._offer_files(offer_id))
+        if previous.get('file'):
+            stale_files.add(previous['file'])
+        stale_files.discard(image_filename)
+        for stale_file in stale_files:
+            (self.folder_path / stale_file).unlink(missing_ok=True)
+            if self.assets:
+                self.assets.remove(self.folder_path, stale_file)
+
+    def _offer_files(self, offer_id: str) -> list[str]:
+        """
+        Защищенный метод, возвращает файлы оффера {offer_id}.*
+        в папке изображений.
+        """
+        if self.assets:
+            return [
+                file_name
+                for file_name, _ in self.assets.files(
+                    self.folder_path,
+                    offer_id=offer_id
+                )
+            ]
+        return [
+            file_path.name
+            for file_path in self.folder_path.glob(f'{offer_id}.*')
+        ]
+
+    def source_hash(self, offer_id: str, image_filename: str) -> str:
+        """
+        Возвращает хэш исходного изображения оффера.
+        Для файлов, принятых в манифест без хэша, он считается один раз.
+        """
+        entry = self.manifest.get(offer_id) or {}
+        digest = entry.get('sha256')
+        if digest and entry.get('file') == image_filename:
+            return digest
+        with open(self.folder_path / image_filename, 'rb') as file:
+            digest = hashlib.file_digest(file, 'sha256').hexdigest()
+        with self._lock:
+            entry = dict(self.manifest.get(offer_id) or {})
+            entry.update(sha256=digest, file=image_filename)
+            self.manifest[offer_id] = entry
+        return digest
+
+    def forget(self, offer_id: str) -> None:
+        """Удаляет оффер из манифеста."""
+        with self._lock:
+            self.manifest.pop(offer_id, None)
+
+    def blob_paths(self) -> list[Path]:
+        """Возвращает пути ко всему содержимому хранилища."""
+        if not self.store_path.exists():
+            return []
+        return [
+            blob_path
+            for blob_path in self.store_path.glob('*/*')
+            if not blob_path.name.startswith('.')
+        ]
+
+    def referenced_digests(self) -> set[str]:
+        """Возвращает хэши содержимого, на которое ссылаются офферы."""
+        with self._lock:
+            return {
+                entry['sha256']
+                for entry in self.manifest.values()
+                if entry.get('sha256')
+            }
+
+    def save(self) -> None:
+        """Сохраняет манифест."""
+        with self._lock:
+            save_state(self.STATE_NAME, self.manifest)
+        if self.assets:
+            self.assets.commit()
+        logging.info('Манифест изображений: %s офферов', len(self.manifest))
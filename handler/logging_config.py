@@ -7,11 +7,27 @@ INFO_BOT = 25
 
 logging.addLevelName(INFO_BOT, 'INFO_BOT')
 
+LOG_FORMAT = (
+    '%(asctime)s, '
+    '%(filename)s, '
+    '%(funcName)s, '
+    '%(levelname)s, '
+    '%(message)s, '
+    '%(name)s'
+)
+"""Формат записей лога."""
+
 
 class CustomLogger(logging.Logger):
-    def bot_event(self, message, *args, **kws):
+    def bot_event(self, message, *args, stacklevel=1, **kws):
         if self.isEnabledFor(INFO_BOT):
-            self._log(INFO_BOT, message, args, **kws, stacklevel=2)
+            self._log(
+                INFO_BOT,
+                message,
+                args,
+                **kws,
+                stacklevel=stacklevel + 1
+            )
 
 
 logging.setLoggerClass(CustomLogger)
@@ -33,6 +49,18 @@ def setup_logging():
     Логи сохраняются в папку 'logs' с именем файла в формате ГГГГ-ММ-ДД.log.
     Автоматически создает папку логов, если она не существует.
     """
+    logging.basicConfig(
+        level=logging.INFO,
+        format=LOG_FORMAT,
+        handlers=[_file_handler()]
+    )
+
+
+def _file_handler() -> RotatingFileHandler:
+    """
+    Создает обработчик файла лога для текущего момента:
+    logs/ГГГГ-ММ-ДД/ГГГГММДДЧЧММ.log.
+    """
     date_dir = dt.now().strftime('%Y-%m-%d')
     log_dir = os.path.abspath(
         os.path.join(os.path.dirname(__file__), '..', 'logs', date_dir)
@@ -50,16 +78,25 @@ def setup_logging():
     )
 
     handler.setLevel(logging.INFO)
+    return handler
 
-    logging.basicConfig(
-        level=logging.INFO,
-        format=(
-            '%(asctime)s, '
-            '%(filename)s, '
-            '%(funcName)s, '
-            '%(levelname)s, '
-            '%(message)s, '
-            '%(name)s'
-        ),
-        handlers=[handler]
-    )
+
+def start_log_file() -> None:
+    """
+    Переключает лог на новый файл с текущими датой и временем.
+
+    Вызывается службой перед каждым запуском: setup_logging
+    настраивает файл один раз при импорте, и без переключения
+    все запуски службы писали бы в файл дня ее старта.
+    """
+    root = logging.getLogger()
+    handler = _file_handler()
+    for old_handler in list(root.handlers):
+        if isinstance(old_handler, RotatingFileHandler):
+            if old_handler.baseFilename == handler.baseFilename:
+                handler.close()
+                return
+            root.removeHandler(old_handler)
+            old_handler.close()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root.addHandler(handler)
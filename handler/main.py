@@ -1,36 +1,195 @@
+import argparse
 import logging
 
+from handler.constants import FILENAMES_ALL, PIPELINE_OVERLAP
 from handler.decorators import time_of_script
+from handler.exceptions import RunLockedError
 from handler.feeds import FEED_ALL_MSC
 from handler.feeds_handler import FeedHandler
 from handler.feeds_save import FeedSave
+from handler.governor import get_governor
 from handler.image_handler import FeedImage
 from handler.logging_config import setup_logging
+from handler.retention import ImageRetention
+from handler.run_lock import RunLock
 
 setup_logging()
 
+STAGES = (
+    'save_xml',
+    'get_images',
+    'add_frame',
+    'image_replacement',
+    'add_sales_notes',
+    'save_xml_one',
+    'add_frame_all',
+    'image_replacement_all',
+    'add_sales_notes_all',
+    'collect_garbage',
+)
+"""Этапы обработки в порядке запуска."""
+
 
 @time_of_script
-def main():
+def main(stages: tuple[str, ...] = STAGES):
+    selected = set(stages)
     try:
         save_client = FeedSave()
         image_client = FeedImage()
         handler_client = FeedHandler()
 
-        save_client.save_xml()
-        image_client.get_images()
-        image_client.add_frame()
-        handler_client.image_replacement()
-        handler_client.add_sales_notes()
+        # Неизмененные фиды обрабатываются, если сменилось окружение
+        # обрамления (stale) или прошлый запуск не обработал часть
+        # их офферов (retry). Фиды retry перезаписываются, только
+        # если хотя бы один такой оффер обработан.
+        changed_files = None
+        stale_files: set[str] = set()
+        retry_files: set[str] = set()
+        if 'save_xml' in selected:
+            save_client.save_xml()
+            if save_client.conditional:
+                changed_files = save_client.changed_files
+                stale_files, retry_files = image_client.pending_files(
+                    changed_files
+                )
+        image_files = rewrite_files = processed_files = None
+        if changed_files is not None:
+            image_files = (
+                changed_files | stale_files | retry_files
+            ) - set(FILENAMES_ALL)
+            processed_files = set(image_files)
+        if image_files is None or image_files:
+            image_client.report_changes(changed_files)
+            if PIPELINE_OVERLAP and {'get_images', 'add_frame'} <= selected:
+                image_client.get_images_and_frame(image_files)
+            else:
+                if 'get_images' in selected:
+                    image_client.get_images(image_files)
+                if 'add_frame' in selected:
+                    image_client.add_frame(image_files)
+            if image_files is not None:
+                rewrite_files = image_files & set().union(
+                    changed_files,
+                    stale_files,
+                    image_client.recovered_files()
+                )
+            if rewrite_files is None or rewrite_files:
+                if 'image_replacement' in selected:
+                    handler_client.image_replacement(rewrite_files)
+                if 'add_sales_notes' in selected:
+                    handler_client.add_sales_notes(rewrite_files)
+        else:
+            logging.info('Фиды не изменились, обработка пропущена')
 # ---------------------------------------- костыль для нового фида msk
-        save_client.save_xml_one(FEED_ALL_MSC)
-        image_client.add_frame_all()
-        handler_client.image_replacement_all()
-        handler_client.add_sales_notes_all()
+        all_changed = all_framed = True
+        if 'save_xml_one' in selected:
+            save_client.save_xml_one(FEED_ALL_MSC)
+            if save_client.conditional:
+                file_name = FILENAMES_ALL[0]
+                all_changed = file_name in save_client.changed_files \
+                    or file_name in stale_files
+                all_framed = all_changed or file_name in retry_files
+        if all_framed:
+            if 'add_frame_all' in selected:
+                image_client.add_frame_all()
+            if processed_files is not None:
+                processed_files.update(FILENAMES_ALL)
+            if all_changed \
+                    or FILENAMES_ALL[0] in image_client.recovered_files():
+                if 'image_replacement_all' in selected:
+                    handler_client.image_replacement_all()
+                if 'add_sales_notes_all' in selected:
+                    handler_client.add_sales_notes_all()
+        else:
+            logging.info('Фид для всех товаров не изменился')
+        if 'collect_garbage' in selected:
+            ImageRetention().collect_garbage()
+        if selected >= set(STAGES):
+            if processed_files is None or processed_files:
+                image_client.save_snapshot(processed_files)
+            save_client.save_validators(image_client.failed_files())
+        else:
+            # Скачанные фиды обработаны не всеми этапами: следующий
+            # полный запуск должен получить их заново.
+            logging.info(
+                'Выполнены не все этапы, валидаторы и снимок офферов '
+                'не сохранены'
+            )
     except Exception as error:
         logging.error('Неожиданная ошибка: %s', error)
         raise
+    finally:
+        get_governor().report()
+
+
+def estimate(stages: tuple[str, ...] = STAGES) -> dict[str, dict]:
+    """
+    Оценивает объем работы этапов stages, ничего не скачивая
+    и не записывая. Оценка строится по текущим файлам, поэтому
+    фиды, которые обновит save_xml, в ней не учитываются.
+    """
+    selected = set(stages)
+    estimates = {}
+    estimates.update(FeedSave().estimate_requests(selected))
+    estimates.update(FeedImage().estimate_work(selected))
+    estimates.update(FeedHandler().estimate_rewrites(selected))
+    if 'collect_garbage' in selected:
+        estimates['collect_garbage'] = ImageRetention().estimate()
+    return {stage: estimates.get(stage, {}) for stage in stages}
+
+
+def run_locked(stages: tuple[str, ...] = STAGES) -> bool:
+    """
+    Запускает обработку, если не выполняется другой запуск.
+    Возвращает False, если запуск пропущен.
+    """
+    try:
+        with RunLock():
+            main(stages)
+    except RunLockedError as error:
+        logging.warning('Запуск пропущен: %s', error)
+        return False
+    return True
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """Разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(
+        description='Скачивание и обработка фидов'
+    )
+    parser.add_argument('--stages', nargs='+', choices=STAGES,
+                        metavar='STAGE',
+                        help='этапы для запуска, по умолчанию все')
+    parser.add_argument('--skip', nargs='+', choices=STAGES, default=[],
+                        metavar='STAGE',
+                        help='этапы, которые нужно пропустить')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='только оценить объем работы этапов')
+    parser.add_argument('--list-stages', action='store_true',
+                        help='вывести список этапов и выйти')
+    return parser.parse_args(argv)
+
+
+def cli(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    if args.list_stages:
+        print('\n'.join(STAGES))
+        return
+    selected = set(args.stages or STAGES) - set(args.skip)
+    stages = tuple(stage for stage in STAGES if stage in selected)
+    if not stages:
+        raise SystemExit('Не выбрано ни одного этапа')
+    if not args.dry_run:
+        run_locked(stages)
+        return
+    logging.info('Оценка этапов: %s', ', '.join(stages))
+    for stage, items in estimate(stages).items():
+        summary = ', '.join(
+            f'{item}={value}' for item, value in items.items()
+        ) or 'нет данных'
+        logging.info('Оценка %s: %s', stage, summary)
+        print(f'{stage}: {summary}')
 
 
 if __name__ == '__main__':
-    main()
+    cli()
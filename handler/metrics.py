@@ -0,0 +1,307 @@
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from datetime import datetime as dt
+from pathlib import Path
+
+from handler.constants import METRICS_FOLDER, METRICS_PREFIX
+from handler.logging_config import setup_logging
+
+setup_logging()
+
+PROC_IO = Path('/proc/self/io')
+PROC_STATUS = Path('/proc/self/status')
+PROC_CLEAR_REFS = Path('/proc/self/clear_refs')
+
+
+def _read_io() -> tuple[int, int]:
+    """
+    Возвращает байты, прочитанные и записанные процессом
+    (файлы и сеть). Без /proc возвращает нули.
+    """
+    try:
+        counters = dict(
+            line.split(': ')
+            for line in PROC_IO.read_text().splitlines()
+        )
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def _reset_peak_rss() -> bool:
+    """Сбрасывает пиковое потребление памяти процесса (только Linux)."""
+    try:
+        PROC_CLEAR_REFS.write_text('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss() -> int:
+    """Возвращает пиковое потребление памяти процессом в байтах."""
+    try:
+        for line in PROC_STATUS.read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cpu_time() -> float:
+    """Процессорное время процесса и завершившихся дочерних процессов."""
+    usage = [
+        resource.getrusage(who)
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)
+    ]
+    return sum(item.ru_utime + item.ru_stime for item in usage)
+
+
+class StageMetrics:
+    """Показатели одного этапа обработки."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.status = 'SUCCESS'
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_bytes = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.items: dict[str, int] = {}
+        self.failures = 0
+
+    def as_dict(self) -> dict:
+        """Возвращает показатели этапа в виде словаря."""
+        return {
+            'calls': self.calls,
+            'status': self.status,
+            'wall_seconds': round(self.wall_seconds, 3),
+            'cpu_seconds': round(self.cpu_seconds, 3),
+            'peak_rss_bytes': self.peak_rss_bytes,
+            'read_bytes': self.read_bytes,
+            'write_bytes': self.write_bytes,
+            'items': dict(self.items),
+            'failures': self.failures,
+        }
+
+
+class _StageTimer:
+    """Контекстный менеджер, замеряющий один вызов этапа."""
+
+    def __init__(self, registry: 'MetricsRegistry', name: str) -> None:
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self) -> StageMetrics:
+        self.stage = self.registry.get_stage(self.name)
+        if not self.registry.depth:
+            _reset_peak_rss()
+        self.registry.push(self.stage)
+        self.wall = time.perf_counter()
+        self.cpu = _cpu_time()
+        self.io = _read_io()
+        return self.stage
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        read_bytes, write_bytes = _read_io()
+        stage = self.stage
+        stage.calls += 1
+        stage.wall_seconds += time.perf_counter() - self.wall
+        stage.cpu_seconds += _cpu_time() - self.cpu
+        stage.read_bytes += read_bytes - self.io[0]
+        stage.write_bytes += write_bytes - self.io[1]
+        stage.peak_rss_bytes = max(stage.peak_rss_bytes, _peak_rss())
+        if exc_type is not None:
+            stage.status = 'ERROR'
+        self.registry.pop()
+
+
+class MetricsRegistry:
+    """
+    Реестр показателей этапов за один запуск.
+
+    Этап открывается через stage(name), счетчики добавляются
+    в текущий открытый этап функциями count и count_failures.
+    По окончании запуска показатели выгружаются в JSON
+    и в текстовый файл для node_exporter (Prometheus).
+    """
+
+    def __init__(self) -> None:
+        self.stages: dict[str, StageMetrics] = {}
+        self.hosts: dict[str, dict] = {}
+        self.started = time.time()
+        self._stack: list[StageMetrics] = []
+        self._lock = threading.Lock()
+
+    def get_stage(self, name: str) -> StageMetrics:
+        """Возвращает показатели этапа, создавая их при первом вызове."""
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = StageMetrics(name)
+            return self.stages[name]
+
+    @property
+    def depth(self) -> int:
+        """Количество открытых этапов."""
+        return len(self._stack)
+
+    def push(self, stage: StageMetrics) -> None:
+        with self._lock:
+            self._stack.append(stage)
+
+    def pop(self) -> None:
+        with self._lock:
+            self._stack.pop()
+
+    def stage(self, name: str) -> _StageTimer:
+        """Замеряет вызов этапа name."""
+        return _StageTimer(self, name)
+
+    def _current(self) -> StageMetrics:
+        """Защищенный метод, возвращает текущий открытый этап."""
+        with self._lock:
+            if self._stack:
+                return self._stack[-1]
+        return self.get_stage('main')
+
+    def count(self, item: str, value: int = 1) -> None:
+        """Увеличивает счетчик item текущего этапа."""
+        stage = self._current()
+        with self._lock:
+            stage.items[item] = stage.items.get(item, 0) + value
+
+    def count_failures(self, value: int = 1) -> None:
+        """Увеличивает количество ошибок текущего этапа."""
+        stage = self._current()
+        with self._lock:
+            stage.failures += value
+
+    def set_host(self, host: str, summary: dict) -> None:
+        """Записывает состояние и счетчики запросов к хосту."""
+        with self._lock:
+            self.hosts[host] = dict(summary)
+
+    def as_dict(self, status: str = 'SUCCESS') -> dict:
+        """Возвращает показатели запуска в виде словаря."""
+        return {
+            'started': dt.fromtimestamp(self.started).isoformat(
+                timespec='seconds'
+            ),
+            'finished': dt.now().isoformat(timespec='seconds'),
+            'status': status,
+            'stages': {
+                name: stage.as_dict() for name, stage in self.stages.items()
+            },
+            'hosts': dict(self.hosts),
+        }
+
+    def to_prometheus(
+        self,
+        status: str = 'SUCCESS',
+        prefix: str = METRICS_PREFIX
+    ) -> str:
+        """Возвращает показатели в текстовом формате Prometheus."""
+        lines = []
+
+        def metric(name, help_text, samples) -> None:
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            for labels, value in samples:
+                label_text = ','.join(
+                    f'{key}="{label}"' for key, label in labels.items()
+                )
+                if label_text:
+                    label_text = f'{{{label_text}}}'
+                lines.append(f'{prefix}_{name}{label_text} {value}')
+
+        stages = list(self.stages.values())
+        fields = (
+            ('stage_wall_seconds', 'wall_seconds', 'Время этапа, сек.'),
+            ('stage_cpu_seconds', 'cpu_seconds', 'Время CPU этапа, сек.'),
+            ('stage_peak_rss_bytes', 'peak_rss_bytes', 'Пик памяти этапа.'),
+            ('stage_read_bytes', 'read_bytes', 'Прочитано байт за этап.'),
+            ('stage_write_bytes', 'write_bytes', 'Записано байт за этап.'),
+            ('stage_failures', 'failures', 'Ошибок за этап.'),
+        )
+        for name, field, help_text in fields:
+            metric(name, help_text, [
+                ({'stage': stage.name}, round(getattr(stage, field), 3))
+                for stage in stages
+            ])
+        metric('stage_success', 'Этап завершился без исключения.', [
+            ({'stage': stage.name}, int(stage.status == 'SUCCESS'))
+            for stage in stages
+        ])
+        metric('stage_items', 'Счетчики обработанных объектов этапа.', [
+            ({'stage': stage.name, 'item': item}, value)
+            for stage in stages
+            for item, value in sorted(stage.items.items())
+        ])
+        host_fields = (
+            ('host_requests', 'requests', 'Запросов к хосту.'),
+            ('host_failures', 'failures', 'Ошибок запросов к хосту.'),
+            ('host_retries', 'retries', 'Повторов запросов к хосту.'),
+            ('host_rejected', 'rejected', 'Запросов, не отправленных '
+             'из-за разомкнутого предохранителя.'),
+        )
+        for name, field, help_text in host_fields:
+            metric(name, help_text, [
+                ({'host': host}, summary[field])
+                for host, summary in sorted(self.hosts.items())
+            ])
+        metric('host_breaker_open', 'Предохранитель хоста разомкнут.', [
+            ({'host': host}, int(summary['state'] != 'closed'))
+            for host, summary in sorted(self.hosts.items())
+        ])
+        metric('run_success', 'Запуск завершился без ошибок.', [
+            ({}, int(status == 'SUCCESS'))
+        ])
+        metric('run_timestamp_seconds', 'Время окончания запуска.', [
+            ({}, int(time.time()))
+        ])
+        return '\n'.join(lines) + '\n'
+
+    def export(
+        self,
+        status: str = 'SUCCESS',
+        folder: str = METRICS_FOLDER
+    ) -> None:
+        """
+        Атомарно записывает metrics.json и metrics.prom
+        в папку с метриками.
+        """
+        folder_path = Path(__file__).parent.parent / folder
+        try:
+            folder_path.mkdir(parents=True, exist_ok=True)
+            files = {
+                'metrics.json': json.dumps(
+                    self.as_dict(status),
+                    ensure_ascii=False,
+                    indent=2
+                ),
+                'metrics.prom': self.to_prometheus(status),
+            }
+            for file_name, content in files.items():
+                temp_path = folder_path / f'.{file_name}.part'
+                temp_path.write_text(content, encoding='utf-8')
+                os.replace(temp_path, folder_path / file_name)
+        except OSError as error:
+            logging.error('Не удалось сохранить метрики: %s', error)
+
+    def reset(self) -> None:
+        """Очищает показатели перед новым запуском."""
+        with self._lock:
+            self.stages.clear()
+            self.hosts.clear()
+            self._stack.clear()
+            self.started = time.time()
+
+
+metrics = MetricsRegistry()
+"""Реестр показателей текущего запуска."""
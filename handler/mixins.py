@@ -1,13 +1,60 @@
 import logging
+import os
+import shutil
+import threading
+import time
 import xml.etree.ElementTree as ET
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from handler.asset_index import get_asset_index
+from handler.constants import ASSET_INDEX
 from handler.exceptions import (DirectoryCreationError, EmptyFeedsListError,
                                 GetTreeError)
 from handler.logging_config import setup_logging
+from handler.offer_index import OfferIndex, get_offer_index
 
 setup_logging()
 
+FICLONE = 0x40049409
+"""Код ioctl для копирования файла через reflink (Linux)."""
+
+LISTING_SETTLE_NS = 2 * 10 ** 9
+"""
+Сколько должно пройти с изменения папки, чтобы ее список файлов
+можно было кэшировать: изменение в тот же квант времени файловой
+системы не поменяло бы mtime папки.
+"""
+
+_listing_cache: dict[str, tuple[int, frozenset[str]]] = {}
+_listing_lock = threading.Lock()
+
+
+def list_files(folder_path: Path) -> frozenset[str]:
+    """
+    Возвращает имена файлов папки. Список кэшируется на время
+    жизни процесса и перечитывается, только если изменилось
+    время модификации папки (создание, удаление, переименование).
+    """
+    key = str(folder_path)
+    mtime = folder_path.stat().st_mtime_ns
+    with _listing_lock:
+        cached = _listing_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with os.scandir(folder_path) as entries:
+        names = frozenset(entry.name for entry in entries if entry.is_file())
+    with _listing_lock:
+        if time.time_ns() - mtime > LISTING_SETTLE_NS:
+            _listing_cache[key] = (mtime, names)
+        else:
+            _listing_cache.pop(key, None)
+    return names
+
 
 class FileMixin:
     """
@@ -16,16 +63,27 @@ class FileMixin:
     - _get_filenames_list - Получение имен для файлов списком.
     - _make_dir - Создает директорию и возвращает путь до нее.
     - _get_tree - Получает дерево XML-файла.
+    - _get_offer_index - Получает индекс офферов XML-файла.
+    - _clone_file - Клонирует файл через reflink, hardlink или копию.
+    - _get_image_dict - Получает обрамленные изображения по ключам.
     """
 
-    def _get_filenames_set(self, folder_name: str) -> set[str]:
-        """Защищенный метод, возвращает список названий фидов."""
+    def _get_filenames_set(
+        self,
+        folder_name: str,
+        suffix: str | None = None
+    ) -> set[str]:
+        """
+        Защищенный метод, возвращает список названий фидов.
+        suffix оставляет только файлы с указанным расширением.
+        """
         folder_path = Path(__file__).parent.parent / folder_name
         if not folder_path.exists():
             logging.error('Папка %s не существует', folder_name)
             raise DirectoryCreationError('Папка %s не найдена', folder_name)
         files_names = {
-            file.name for file in folder_path.iterdir() if file.is_file()
+            name for name in list_files(folder_path)
+            if suffix is None or Path(name).suffix == suffix
         }
         if not files_names:
             logging.error('В папке нет файлов')
@@ -59,6 +117,71 @@ class FileMixin:
             )
             raise GetTreeError('Ошибка получения дерева фида.')
 
+    def _get_offer_index(
+        self,
+        file_name: str,
+        folder_name: str
+    ) -> OfferIndex:
+        """
+        Защищенный метод, возвращает индекс офферов фида.
+        Фид разбирается один раз, повторные вызовы берут индекс из кэша.
+        """
+        try:
+            file_path = (
+                Path(__file__).parent.parent / folder_name / file_name
+            )
+            return get_offer_index(file_path)
+        except Exception as error:
+            logging.error(
+                'Не удалось получить индекс фида по причине %s',
+                error
+            )
+            raise GetTreeError('Ошибка получения индекса фида.')
+
+    def _reflink(self, source_path: Path, target_path: Path) -> bool:
+        """
+        Защищенный метод, создает reflink-копию файла,
+        если файловая система это поддерживает.
+        """
+        if fcntl is None:
+            return False
+        with open(source_path, 'rb') as source, \
+                open(target_path, 'wb') as target:
+            try:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+                return True
+            except OSError:
+                return False
+
+    def _clone_file(
+        self,
+        source_path: Path,
+        target_path: Path,
+        mode: str = 'copy'
+    ) -> None:
+        """
+        Защищенный метод, атомарно создает target_path с содержимым
+        source_path без повторной сериализации: reflink, hardlink
+        или побайтовой копией, если первые два недоступны.
+        """
+        temp_path = target_path.with_name(f'{target_path.name}.part')
+        try:
+            temp_path.unlink(missing_ok=True)
+            cloned = False
+            if mode == 'hardlink':
+                try:
+                    os.link(source_path, temp_path)
+                    cloned = True
+                except OSError:
+                    logging.debug('Hardlink недоступен для %s', target_path)
+            elif mode == 'reflink':
+                cloned = self._reflink(source_path, temp_path)
+            if not cloned:
+                shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, target_path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
     def _indent(self, elem, level=0) -> None:
         """Защищенный метод, расставляет правильные отступы в XML файлах."""
         i = '\n' + level * '  '
@@ -75,7 +198,29 @@ class FileMixin:
             if level and (not elem.tail or not elem.tail.strip()):
                 elem.tail = i
 
+    def _get_indexed_images(
+        self,
+        image_folder: str,
+        all_frames: bool
+    ) -> dict:
+        """
+        Защищенный метод, возвращает обрамленные изображения
+        из индекса изображений вместо чтения папки.
+        """
+        folder_path = Path(__file__).parent.parent / image_folder
+        if all_frames:
+            image_dict = get_asset_index().image_dict_all(folder_path)
+        else:
+            image_dict = get_asset_index().image_dict(folder_path)
+        if not image_dict:
+            logging.warning(
+                'Нет подходящих офферов для обрамления изображений'
+            )
+        return image_dict
+
     def _get_image_dict(self, image_folder: str) -> dict:
+        if ASSET_INDEX:
+            return self._get_indexed_images(image_folder, all_frames=False)
         image_dict: dict = {}
         try:
             image_names = self._get_filenames_set(image_folder)
@@ -109,6 +254,8 @@ class FileMixin:
 
 # ---------------------------------------- костыль для нового фида msk
     def _get_image_dict_all(self, image_folder: str) -> dict:
+        if ASSET_INDEX:
+            return self._get_indexed_images(image_folder, all_frames=True)
         image_dict: dict = {}
         try:
             image_names = self._get_filenames_set(image_folder)
@@ -0,0 +1,110 @@
+import logging
+from typing import NamedTuple
+
+from handler.logging_config import setup_logging
+from handler.offer_index import OfferIndex
+from handler.state import load_state, save_state
+
+setup_logging()
+
+
+class OfferDiff(NamedTuple):
+    """Изменения офферов фида с прошлого успешного запуска."""
+
+    added: frozenset[str]
+    removed: frozenset[str]
+    picture_changed: frozenset[str]
+    category_changed: frozenset[str]
+    unchanged: frozenset[str]
+
+    def counts(self) -> dict[str, int]:
+        """Возвращает количество офферов в каждой группе."""
+        return {field: len(getattr(self, field)) for field in self._fields}
+
+
+def diff_offers(
+    previous: dict[str, list],
+    index: OfferIndex
+) -> OfferDiff:
+    """
+    Сравнивает офферы фида со снимком прошлого запуска
+    (offer_id -> [picture, category_id]). Оффер, у которого
+    сменились и картинка, и категория, считается со сменой картинки.
+    """
+    groups: dict[str, str] = {}
+    for offer in index.offers:
+        old = previous.get(offer.offer_id)
+        if old is None:
+            group = 'added'
+        elif old[0] != offer.picture:
+            group = 'picture_changed'
+        elif old[1] != offer.category_id:
+            group = 'category_changed'
+        else:
+            group = 'unchanged'
+        groups[offer.offer_id] = group
+
+    def members(name: str) -> frozenset[str]:
+        return frozenset(
+            offer_id for offer_id, group in groups.items() if group == name
+        )
+
+    return OfferDiff(
+        added=members('added'),
+        removed=frozenset(previous.keys() - groups.keys()),
+        picture_changed=members('picture_changed'),
+        category_changed=members('category_changed'),
+        unchanged=members('unchanged'),
+    )
+
+
+class OfferSnapshot:
+    """
+    Снимок офферов фидов после успешного запуска.
+
+    Для каждого фида хранит картинку и категорию офферов, а также
+    подпись окружения обрамления (рамки, компоновка, дерево категорий),
+    с которым офферы были обработаны. Офферы, обработка которых
+    завершилась ошибкой, в снимок не попадают и при следующем
+    запуске считаются добавленными.
+    """
+
+    STATE_NAME = 'offers'
+
+    def __init__(self) -> None:
+        self.feeds: dict[str, dict] = load_state(self.STATE_NAME)
+
+    def diff(self, index: OfferIndex) -> OfferDiff | None:
+        """
+        Возвращает изменения офферов фида
+        или None, если снимка фида еще нет.
+        """
+        entry = self.feeds.get(index.file_name)
+        if entry is None:
+            return None
+        return diff_offers(entry['offers'], index)
+
+    def frame_env(self, file_name: str) -> str | None:
+        """Возвращает подпись окружения обрамления фида."""
+        return (self.feeds.get(file_name) or {}).get('frame_env')
+
+    def update(
+        self,
+        index: OfferIndex,
+        frame_env: str | None,
+        exclude: set[str] = frozenset()
+    ) -> None:
+        """Записывает офферы фида, кроме exclude, в снимок."""
+        self.feeds[index.file_name] = {
+            'frame_env': frame_env,
+            'offers': {
+                offer.offer_id: [offer.picture, offer.category_id]
+                for offer in index.offers
+                if offer.offer_id not in exclude
+            },
+        }
+
+    def save(self) -> None:
+        """Сохраняет снимок."""
+        save_state(self.STATE_NAME, self.feeds)
+        logging.info('Снимок офферов: %s фидов', len(self.feeds))
@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from handler.logging_config import setup_logging
+
+setup_logging()
+
+
+class _HashingReader:
+    """Файл, считающий sha256 прочитанных данных."""
+
+    def __init__(self, file) -> None:
+        self._file = file
+        self.hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        self.hash.update(data)
+        return data
+
+
+class OfferRecord:
+    """Компактная запись об оффере: только поля, нужные этапам обработки."""
+
+    __slots__ = ('offer_id', 'category_id', 'picture', 'city', 'placement')
+
+    def __init__(
+        self,
+        offer_id: str,
+        category_id: str | None,
+        picture: str | None,
+        city: str,
+        placement: str
+    ) -> None:
+        self.offer_id = offer_id
+        self.category_id = category_id
+        self.picture = picture
+        self.city = city
+        self.placement = placement
+
+
+class OfferIndex:
+    """
+    Индекс одного фида: офферы и дерево категорий.
+    Строится за один потоковый проход по файлу.
+    """
+
+    def __init__(self, file_name: str) -> None:
+        self.file_name = file_name
+        self.city = file_name.split('_')[-2]
+        self.placement = file_name.split('_')[-1].split('.')[0]
+        self.offers: list[OfferRecord] = []
+        self.categories: dict[str, str | None] = {}
+        self.digest: str | None = None
+
+    @classmethod
+    def build(cls, file_path: Path) -> 'OfferIndex':
+        """
+        Разбирает фид и возвращает заполненный индекс.
+        Хэш содержимого файла считается в том же проходе.
+        """
+        index = cls(file_path.name)
+        with open(file_path, 'rb') as file:
+            reader = _HashingReader(file)
+            index._parse(reader)
+            reader.hash.update(file.read())
+        index.digest = reader.hash.hexdigest()
+        logging.debug(
+            'Построен индекс %s: %s офферов, %s категорий',
+            index.file_name,
+            len(index.offers),
+            len(index.categories)
+        )
+        return index
+
+    def _parse(self, source) -> None:
+        """Защищенный метод, заполняет индекс из XML-источника."""
+        index = self
+        offers_parent = None
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if elem.tag == 'offers':
+                    offers_parent = elem
+                continue
+            if elem.tag == 'category':
+                index.categories[elem.get('id')] = elem.get('parentId')
+            elif elem.tag == 'offer':
+                index.offers.append(OfferRecord(
+                    str(elem.get('id')),
+                    elem.findtext('categoryId'),
+                    elem.findtext('picture'),
+                    index.city,
+                    index.placement
+                ))
+                if offers_parent is not None:
+                    offers_parent.clear()
+                else:
+                    elem.clear()
+
+
+_index_cache: dict[str, tuple[tuple[int, int], OfferIndex]] = {}
+_index_lock = threading.Lock()
+
+
+def get_offer_index(file_path: Path) -> OfferIndex:
+    """
+    Возвращает индекс фида из кэша процесса.
+    Индекс перестраивается, только если файл изменился
+    (по времени модификации и размеру).
+    """
+    stat = file_path.stat()
+    signature = (stat.st_mtime_ns, stat.st_size)
+    key = str(file_path.resolve())
+    with _index_lock:
+        cached = _index_cache.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        index = OfferIndex.build(file_path)
+        _index_cache[key] = (signature, index)
+        return index
@@ -0,0 +1,115 @@
+import gzip
+import logging
+import os
+from pathlib import Path
+
+from handler.constants import (ENCODING, FEED_CHUNK_SIZE, PUBLISH_BROTLI,
+                               PUBLISH_GZIP, PUBLISH_GZIP_LEVEL)
+from handler.logging_config import setup_logging
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+setup_logging()
+
+
+class PublishWriter:
+    """
+    Атомарная публикация фида.
+
+    Фид пишется во временный файл рядом с итоговым, одновременно
+    сжимаясь в .gz (и .br) копии для отдачи веб-сервером. Только после
+    успешной записи все файлы переименовываются на место, поэтому
+    потребители никогда не видят недописанный фид.
+    """
+
+    def __init__(
+        self,
+        file_path: Path,
+        compress: bool = True,
+        gzip_enabled: bool = PUBLISH_GZIP,
+        brotli_enabled: bool = PUBLISH_BROTLI
+    ) -> None:
+        self.file_path = file_path
+        self.gzip_enabled = compress and gzip_enabled
+        self.brotli_enabled = compress and brotli_enabled
+        if self.brotli_enabled and brotli is None:
+            logging.warning('Пакет brotli не установлен, .br не создается')
+            self.brotli_enabled = False
+        self._buffer: list[bytes] = []
+        self._buffer_size = 0
+        self._targets: list[tuple[Path, Path]] = []
+
+    def _temp_path(self, file_path: Path) -> Path:
+        """Защищенный метод, возвращает путь временного файла."""
+        temp_path = file_path.with_name(f'.{file_path.name}.part')
+        self._targets.append((temp_path, file_path))
+        return temp_path
+
+    def __enter__(self) -> 'PublishWriter':
+        self._gzip_file = self._gzip_raw = None
+        self._brotli_file = self._compressor = None
+        if self.gzip_enabled:
+            gzip_path = self.file_path.with_name(f'{self.file_path.name}.gz')
+            self._gzip_raw = open(self._temp_path(gzip_path), 'wb')
+            self._gzip_file = gzip.GzipFile(
+                filename=self.file_path.name,
+                fileobj=self._gzip_raw,
+                mode='wb',
+                compresslevel=PUBLISH_GZIP_LEVEL,
+                mtime=0
+            )
+        if self.brotli_enabled:
+            brotli_path = self.file_path.with_name(
+                f'{self.file_path.name}.br'
+            )
+            self._brotli_file = open(self._temp_path(brotli_path), 'wb')
+            self._compressor = brotli.Compressor()
+        self._file = open(self._temp_path(self.file_path), 'wb')
+        return self
+
+    def write(self, text: str) -> None:
+        """Записывает фрагмент фида во все выходные файлы."""
+        data = text.encode(ENCODING)
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        if self._buffer_size >= FEED_CHUNK_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Защищенный метод, сбрасывает накопленный буфер."""
+        if not self._buffer:
+            return
+        data = b''.join(self._buffer)
+        self._buffer.clear()
+        self._buffer_size = 0
+        self._file.write(data)
+        if self._gzip_file is not None:
+            self._gzip_file.write(data)
+        if self._compressor is not None:
+            self._brotli_file.write(self._compressor.process(data))
+
+    def _close(self) -> None:
+        """Защищенный метод, закрывает все выходные файлы."""
+        self._file.close()
+        if self._gzip_file is not None:
+            self._gzip_file.close()
+            self._gzip_raw.close()
+        if self._brotli_file is not None:
+            self._brotli_file.close()
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        try:
+            if exc_type is None:
+                self._flush()
+                if self._compressor is not None:
+                    self._brotli_file.write(self._compressor.finish())
+        finally:
+            self._close()
+        if exc_type is None:
+            for temp_path, file_path in reversed(self._targets):
+                os.replace(temp_path, file_path)
+        for temp_path, _ in self._targets:
+            temp_path.unlink(missing_ok=True)
@@ -0,0 +1,308 @@
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+from handler.asset_index import get_asset_index, parse_asset
+from handler.build_manifest import BuildManifest
+from handler.constants import (ASSET_INDEX, FEEDS_FOLDER, FILENAMES_ALL,
+                               IMAGE_FOLDER, IMAGE_GC_GRACE_DAYS,
+                               IMAGE_GC_MODE, IMAGE_QUARANTINE_DAYS,
+                               NEW_IMAGE_FOLDER, QUARANTINE_FOLDER)
+from handler.decorators import time_of_function
+from handler.exceptions import (DirectoryCreationError, EmptyFeedsListError,
+                                GetTreeError)
+from handler.image_store import ImageStore
+from handler.logging_config import setup_logging
+from handler.metrics import metrics
+from handler.mixins import FileMixin
+from handler.state import load_state, save_state
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+GC_MODES = ('quarantine', 'delete', 'off')
+"""Допустимые режимы сборки мусора."""
+
+DAY = 24 * 60 * 60
+"""Количество секунд в сутках."""
+
+
+def image_key(role: str, file_name: str) -> str:
+    """
+    Возвращает ключ изображения: номер оффера для исходного
+    изображения, номер оффера, город и размещение для обрамленного
+    (как в ключах _get_image_dict и манифеста сборки).
+    """
+    asset = parse_asset(file_name)
+    if role == 'images':
+        return asset.offer_id
+    return f'{asset.offer_id}_{asset.city}_{asset.postfix}'
+
+
+def feed_postfix(file_name: str) -> str:
+    """Возвращает размещение, которому предназначены рамки фида."""
+    if file_name in FILENAMES_ALL:  # КОСТЫЛЬ!
+        return 'all'
+    if 'search' in file_name.split('_')[-1]:
+        return 'srch'
+    return 'net'
+
+
+class ImageRetention(FileMixin):
+    """
+    Сборка мусора в папках исходных и обрамленных изображений.
+
+    Исходное изображение лишнее, если его оффера нет ни в одном
+    текущем фиде, обрамленное - если оффера нет в фиде своего города
+    и размещения. Время, с которого файл стал лишним, хранится в состоянии; по
+    истечении IMAGE_GC_GRACE_DAYS файл переносится в карантин или
+    удаляется, а оффер убирается из манифестов. Содержимое хранилища,
+    на которое больше не ссылается ни один оффер, удаляется сразу.
+    """
+
+    STATE_NAME = 'retention'
+    ROLES = ('images', 'framed')
+
+    def __init__(
+        self,
+        feeds_folder: str = FEEDS_FOLDER,
+        image_folder: str = IMAGE_FOLDER,
+        new_image_folder: str = NEW_IMAGE_FOLDER,
+        quarantine_folder: str = QUARANTINE_FOLDER,
+        mode: str = IMAGE_GC_MODE,
+        grace_days: float = IMAGE_GC_GRACE_DAYS,
+        quarantine_days: float = IMAGE_QUARANTINE_DAYS
+    ) -> None:
+        if mode not in GC_MODES:
+            logging.warning(
+                'Неизвестный режим сборки мусора %s, используется '
+                'quarantine',
+                mode
+            )
+            mode = 'quarantine'
+        self.feeds_folder = feeds_folder
+        self.folders = dict(zip(self.ROLES, (image_folder, new_image_folder)))
+        self.quarantine_path = Path(__file__).parent.parent / quarantine_folder
+        self.mode = mode
+        self.grace_seconds = grace_days * DAY
+        self.quarantine_seconds = quarantine_days * DAY
+        self.store = ImageStore(image_folder)
+        self.builds = BuildManifest(new_image_folder)
+        self.assets = get_asset_index() if ASSET_INDEX else None
+        self.orphans: dict[str, float] = load_state(self.STATE_NAME)
+
+    def _live_keys(self) -> dict[str, set[str]]:
+        """
+        Защищенный метод, возвращает ключи изображений, которые нужны
+        текущим фидам: роль -> ключи. Фиды без офферов считаются
+        ошибкой, чтобы не убрать все изображения.
+        """
+        live = {role: set() for role in self.ROLES}
+        for file_name in self._get_filenames_set(self.feeds_folder, '.xml'):
+            index = self._get_offer_index(file_name, self.feeds_folder)
+            file_city = file_name.split('_')[-2]
+            suffix = f'{file_city}_{feed_postfix(file_name)}'
+            for offer in index.offers:
+                live['images'].add(offer.offer_id)
+                live['framed'].add(f'{offer.offer_id}_{suffix}')
+        if not live['images']:
+            raise EmptyFeedsListError('В фидах нет офферов')
+        return live
+
+    def _image_names(self, folder: str) -> list[str]:
+        """Защищенный метод, возвращает имена изображений папки."""
+        if self.assets:
+            folder_path = Path(__file__).parent.parent / folder
+            return [
+                file_name for file_name, _ in self.assets.files(folder_path)
+            ]
+        try:
+            return [
+                file_name for file_name in self._get_filenames_set(folder)
+                if not file_name.startswith('.')
+            ]
+        except (DirectoryCreationError, EmptyFeedsListError):
+            return []
+
+    def _find_orphans(
+        self,
+        live: dict[str, set[str]],
+        now: float
+    ) -> dict[str, float]:
+        """
+        Защищенный метод, возвращает лишние файлы:
+        роль/имя файла -> время, с которого файл лишний.
+        """
+        orphans = {}
+        for role, folder in self.folders.items():
+            for file_name in self._image_names(folder):
+                if image_key(role, file_name) not in live[role]:
+                    key = f'{role}/{file_name}'
+                    orphans[key] = self.orphans.get(key, now)
+        return orphans
+
+    def _dispose(self, role: str, file_name: str, counters: dict) -> None:
+        """
+        Защищенный метод, переносит файл в карантин или удаляет его.
+        Освобожденными считаются байты файлов без других жестких ссылок.
+        """
+        folder_path = Path(__file__).parent.parent / self.folders[role]
+        file_path = folder_path / file_name
+        if self.assets:
+            self.assets.track(folder_path)
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            if self.assets:
+                self.assets.remove(folder_path, file_name)
+            return
+        if self.mode == 'quarantine':
+            target_path = self.quarantine_path / role / file_name
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(file_path, target_path)
+            os.utime(target_path)
+            counters['quarantined'] += 1
+            counters['bytes_quarantined'] += stat.st_size
+        else:
+            file_path.unlink()
+            counters['removed'] += 1
+            if stat.st_nlink == 1:
+                counters['bytes_reclaimed'] += stat.st_size
+        if self.assets:
+            self.assets.remove(folder_path, file_name)
+
+    def _collect_blobs(self, counters: dict) -> None:
+        """
+        Защищенный метод, удаляет содержимое хранилища,
+        на которое не ссылается ни один оффер.
+        """
+        if not self.store.manifest:
+            return
+        referenced = self.store.referenced_digests()
+        for blob_path in self.store.blob_paths():
+            if blob_path.name.split('.')[0] in referenced:
+                continue
+            stat = blob_path.stat()
+            blob_path.unlink()
+            counters['blobs_removed'] += 1
+            if stat.st_nlink == 1:
+                counters['bytes_reclaimed'] += stat.st_size
+
+    def _purge_quarantine(self, now: float, counters: dict) -> None:
+        """
+        Защищенный метод, удаляет файлы, пролежавшие
+        в карантине дольше срока хранения.
+        """
+        for role in self.ROLES:
+            role_path = self.quarantine_path / role
+            if not role_path.exists():
+                continue
+            for file_path in role_path.iterdir():
+                stat = file_path.stat()
+                if now - stat.st_mtime < self.quarantine_seconds:
+                    continue
+                file_path.unlink()
+                counters['purged'] += 1
+                if stat.st_nlink == 1:
+                    counters['bytes_reclaimed'] += stat.st_size
+
+    def _report(self, counters: dict) -> None:
+        """Защищенный метод, выводит итоги сборки мусора."""
+        messages = (
+            ('Лишних изображений - %s, из них ожидают срока - %s',
+             counters['orphans'], counters['waiting']),
+            ('Перенесено в карантин - %s файлов (%s байт)',
+             counters['quarantined'], counters['bytes_quarantined']),
+            ('Удалено изображений - %s, содержимого хранилища - %s, '
+             'из карантина - %s',
+             counters['removed'], counters['blobs_removed'],
+             counters['purged']),
+            ('Освобождено байт - %s', counters['bytes_reclaimed']),
+        )
+        for message, *args in messages:
+            logger.bot_event(message, *args, stacklevel=2)
+        for item in (
+            'orphans',
+            'quarantined',
+            'removed',
+            'blobs_removed',
+            'purged',
+            'bytes_quarantined',
+            'bytes_reclaimed',
+        ):
+            metrics.count(f'gc_{item}', counters[item])
+
+    def estimate(self) -> dict[str, int]:
+        """
+        Метод оценивает сборку мусора, ничего не удаляя:
+        сколько файлов лишние и сколько из них будет убрано.
+        """
+        if self.mode == 'off':
+            return {}
+        now = time.time()
+        try:
+            orphans = self._find_orphans(self._live_keys(), now)
+        except (
+            DirectoryCreationError,
+            EmptyFeedsListError,
+            GetTreeError
+        ) as error:
+            logging.warning('Нет данных для оценки: %s', error)
+            return {}
+        due = [
+            key for key, seen in orphans.items()
+            if now - seen >= self.grace_seconds
+        ]
+        return {'orphans': len(orphans), 'due': len(due)}
+
+    @time_of_function
+    def collect_garbage(self) -> None:
+        """
+        Метод убирает изображения офферов, которых больше нет в фидах,
+        и выводит, сколько файлов и байт освобождено.
+        """
+        if self.mode == 'off':
+            logging.info('Сборка мусора отключена')
+            return
+        now = time.time()
+        try:
+            live = self._live_keys()
+        except (
+            DirectoryCreationError,
+            EmptyFeedsListError,
+            GetTreeError
+        ) as error:
+            logging.warning('Сборка мусора пропущена: %s', error)
+            return
+        counters = dict.fromkeys(
+            ('orphans', 'waiting', 'quarantined', 'removed', 'blobs_removed',
+             'purged', 'bytes_quarantined', 'bytes_reclaimed'),
+            0
+        )
+        orphans = self._find_orphans(live, now)
+        counters['orphans'] = len(orphans)
+        try:
+            for key, seen in list(orphans.items()):
+                if now - seen < self.grace_seconds:
+                    counters['waiting'] += 1
+                    continue
+                role, file_name = key.split('/', 1)
+                self._dispose(role, file_name, counters)
+                if role == 'images':
+                    self.store.forget(image_key(role, file_name))
+                else:
+                    self.builds.forget(image_key(role, file_name))
+                del orphans[key]
+            self._collect_blobs(counters)
+            self._purge_quarantine(now, counters)
+        except OSError as error:
+            logging.error('Ошибка при сборке мусора: %s', error)
+            metrics.count_failures()
+        finally:
+            self.orphans = orphans
+            save_state(self.STATE_NAME, self.orphans)
+            self.store.save()
+            self.builds.save()
+        self._report(counters)
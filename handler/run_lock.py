@@ -0,0 +1,69 @@
+import logging
+import os
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from handler.constants import RUN_LOCK_FILE, STATE_FOLDER
+from handler.exceptions import RunLockedError
+from handler.logging_config import setup_logging
+
+setup_logging()
+
+
+class RunLock:
+    """
+    Межпроцессная блокировка запуска обработки.
+
+    Захватывает flock на файле в папке состояния, поэтому разовый
+    запуск и служба не могут обрабатывать фиды одновременно.
+    Блокировка снимается ядром и при аварийном завершении процесса.
+    """
+
+    def __init__(
+        self,
+        file_name: str = RUN_LOCK_FILE,
+        folder: str = STATE_FOLDER
+    ) -> None:
+        self.path = Path(__file__).parent.parent / folder / file_name
+        self._file = None
+
+    def acquire(self) -> None:
+        """Захватывает блокировку или вызывает RunLockedError."""
+        if fcntl is None:
+            logging.warning('Блокировка запусков недоступна на этой ОС')
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.path, 'a+')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.seek(0)
+            owner = lock_file.read().strip()
+            lock_file.close()
+            raise RunLockedError(
+                f'Запуск уже выполняется (pid {owner or "неизвестен"})'
+            )
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._file = lock_file
+
+    def release(self) -> None:
+        """Снимает блокировку."""
+        if self._file is not None:
+            self._file.truncate(0)
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> 'RunLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
@@ -0,0 +1,143 @@
+from datetime import datetime as dt
+from datetime import timedelta
+
+from handler.exceptions import ScheduleError
+
+CRON_FIELDS = (
+    ('минута', 0, 59),
+    ('час', 0, 23),
+    ('день', 1, 31),
+    ('месяц', 1, 12),
+    ('день недели', 0, 7),
+)
+"""
+Поля выражения cron и допустимые значения.
+Воскресенье в дне недели - и 0, и 7.
+"""
+
+
+class IntervalSchedule:
+    """Запуски с фиксированным интервалом от начала предыдущего."""
+
+    def __init__(self, seconds: int) -> None:
+        if seconds <= 0:
+            raise ScheduleError(f'Интервал должен быть больше нуля: {seconds}')
+        self.interval = timedelta(seconds=seconds)
+
+    def next_after(self, moment: dt) -> dt:
+        """Возвращает время следующего запуска после moment."""
+        return moment + self.interval
+
+    def __str__(self) -> str:
+        return f'каждые {int(self.interval.total_seconds())} сек.'
+
+
+class CronSchedule:
+    """
+    Запуски по выражению cron из пяти полей:
+    минута, час, день месяца, месяц, день недели.
+    Поддерживаются *, списки, диапазоны и шаг (*/15, 1-5/2).
+    """
+
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        parts = expression.split()
+        if len(parts) != len(CRON_FIELDS):
+            raise ScheduleError(
+                f'Ожидается {len(CRON_FIELDS)} полей cron: {expression}'
+            )
+        (
+            self.minutes,
+            self.hours,
+            self.days,
+            self.months,
+            self.weekdays
+        ) = (
+            self._parse_field(part, *field)
+            for part, field in zip(parts, CRON_FIELDS)
+        )
+        self.any_day = parts[2].startswith('*')
+        self.any_weekday = parts[4].startswith('*')
+
+    @staticmethod
+    def _parse_field(
+        part: str,
+        name: str,
+        low: int,
+        high: int
+    ) -> frozenset[int]:
+        """Защищенный метод, разбирает одно поле cron."""
+        values = set()
+        for item in part.split(','):
+            value_range, _, step = item.partition('/')
+            try:
+                step = int(step) if step else 1
+                if value_range == '*':
+                    start, end = low, high
+                elif '-' in value_range:
+                    start, end = map(int, value_range.split('-'))
+                else:
+                    start = end = int(value_range)
+                    if step > 1:
+                        end = high
+            except ValueError:
+                raise ScheduleError(f'Неверное поле cron ({name}): {part}')
+            if step < 1 or start < low or end > high or start > end:
+                raise ScheduleError(f'Неверное поле cron ({name}): {part}')
+            values.update(range(start, end + 1, step))
+        if name == 'день недели':
+            values = {value % 7 for value in values}
+        return frozenset(values)
+
+    def _day_matches(self, moment: dt) -> bool:
+        """
+        Защищенный метод, проверяет день: если заданы и день месяца,
+        и день недели, достаточно совпадения одного из них.
+        """
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: dt) -> dt:
+        """Возвращает время следующего запуска после moment."""
+        candidate = moment.replace(second=0, microsecond=0)
+        candidate += timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                month = candidate.month % 12 + 1
+                year = candidate.year + (month == 1)
+                candidate = candidate.replace(
+                    year=year, month=month, day=1, hour=0, minute=0
+                )
+                continue
+            if not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(
+                    hour=0, minute=0
+                )
+                continue
+            if candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(
+                    minute=0
+                )
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+            return candidate
+        raise ScheduleError(f'Расписание никогда не срабатывает: {self}')
+
+    def __str__(self) -> str:
+        return f'cron "{self.expression}"'
+
+
+def get_schedule(
+    interval: int,
+    cron: str = ''
+) -> IntervalSchedule | CronSchedule:
+    """Возвращает расписание: cron, если задан, иначе интервал."""
+    if cron.strip():
+        return CronSchedule(cron.strip())
+    return IntervalSchedule(interval)
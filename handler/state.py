@@ -0,0 +1,47 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+from handler.constants import STATE_FOLDER
+from handler.logging_config import setup_logging
+
+setup_logging()
+
+
+def _state_path(name: str, folder: str) -> Path:
+    """Возвращает путь к файлу состояния."""
+    return Path(__file__).parent.parent / folder / f'{name}.json'
+
+
+def load_state(name: str, folder: str = STATE_FOLDER) -> dict:
+    """
+    Загружает сохраненное состояние.
+    Отсутствующий или поврежденный файл дает пустое состояние.
+    """
+    file_path = _state_path(name, folder)
+    try:
+        with open(file_path, encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as error:
+        logging.warning(
+            'Не удалось прочитать состояние %s: %s',
+            file_path,
+            error
+        )
+        return {}
+
+
+def save_state(name: str, data: dict, folder: str = STATE_FOLDER) -> None:
+    """Атомарно сохраняет состояние в json-файл."""
+    file_path = _state_path(name, folder)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = file_path.with_name(f'{file_path.name}.part')
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False)
+        os.replace(temp_path, file_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
@@ -0,0 +1,100 @@
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Callable
+
+
+class _Node:
+    """Состояние открытого элемента при потоковом разборе."""
+
+    __slots__ = ('elem', 'opened', 'buffered')
+
+    def __init__(self, elem: ET.Element, buffered: bool) -> None:
+        self.elem = elem
+        self.opened = False
+        self.buffered = buffered
+
+
+def _start_tag(elem: ET.Element, text: str) -> str:
+    """Сериализует открывающий тег элемента вместе с его текстом."""
+    shell = ET.Element(elem.tag, elem.attrib)
+    shell.text = text
+    serialized = ET.tostring(shell, encoding='unicode')
+    return serialized[:-len(f'</{elem.tag}>')]
+
+
+def _indented_text(elem: ET.Element, level: int) -> str:
+    """Текст элемента с дочерними узлами после расстановки отступов."""
+    if elem.text and elem.text.strip():
+        return elem.text
+    return '\n' + (level + 1) * '  '
+
+
+def _indented_tail(elem: ET.Element, level: int, has_children: bool) -> str:
+    """Хвост элемента после расстановки отступов."""
+    if elem.tail and elem.tail.strip():
+        return elem.tail
+    if has_children or level:
+        return '\n' + level * '  '
+    return elem.tail or ''
+
+
+def stream_transform(
+    source_path: Path,
+    write: Callable[[str], object],
+    transform: Callable[[ET.Element], None],
+    indent: Callable[[ET.Element, int], None],
+    unit_tag: str = 'offer'
+) -> None:
+    """
+    Потоково переписывает XML-файл.
+
+    Каждый элемент unit_tag собирается целиком, передается в transform,
+    форматируется функцией indent и сразу записывается через write,
+    после чего освобождается. Остальные элементы записываются по мере
+    разбора, поэтому память зависит от размера одного оффера,
+    а не всего файла. Результат совпадает с indent(root) и
+    ET.tostring(root, encoding='unicode') для всего дерева.
+    """
+    stack: list[_Node] = []
+    pending = None
+    for event, elem in ET.iterparse(source_path, events=('start', 'end')):
+        if pending is not None:
+            write(_indented_tail(*pending))
+            pending = None
+
+        if event == 'start':
+            buffered = elem.tag == unit_tag or bool(
+                stack and stack[-1].buffered
+            )
+            if stack:
+                parent = stack[-1]
+                if not parent.opened and not parent.buffered:
+                    write(_start_tag(
+                        parent.elem,
+                        _indented_text(parent.elem, len(stack) - 1)
+                    ))
+                    parent.opened = True
+            stack.append(_Node(elem, buffered))
+            continue
+
+        node = stack.pop()
+        level = len(stack)
+        if node.opened:
+            write(f'</{elem.tag}>')
+            pending = (elem, level, True)
+        elif stack and stack[-1].buffered:
+            continue
+        else:
+            if elem.tag == unit_tag:
+                transform(elem)
+            tail = elem.tail
+            indent(elem, level)
+            elem.tail = None
+            write(ET.tostring(elem, encoding='unicode'))
+            elem.tail = tail
+            pending = (elem, level, len(elem) > 0)
+        if stack:
+            stack[-1].elem.remove(elem)
+
+    if pending is not None:
+        write(_indented_tail(*pending))